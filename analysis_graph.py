@@ -0,0 +1,105 @@
+import os
+import custom_functions
+import dataset_store
+import rightsizing
+import distribution_charts
+import snapshot_diff
+from recompute_graph import RecomputeGraph
+
+######################
+# Initialize variables
+######################
+# Derived tables, charts and sizing values of the app as nodes of a recompute graph, the widget values are the inputs.
+# A rerun only recomputes the nodes downstream of changed widgets (e.g. a sizing slider does not re-filter the datasets).
+# With NTNX_RECOMPUTE_REPORT=1 the app shows which nodes were invalidated / recomputed in the last run and why.
+recompute_report_enabled = os.environ.get('NTNX_RECOMPUTE_REPORT', '').lower() in ('1', 'true', 'yes')
+
+analysis_inputs = [
+    'dataset_id', 'vCluster_selected', # vCluster_selected as tuple
+    'rightsizing_basis', 'rightsizing_buffer', 'rightsizing_ranking',
+    'vCPU_option', 'vCPU_growth', 'vRAM_option', 'vRAM_growth', 'vStorage_option', 'vStorage_growth',
+    'compare_dataset_id',
+]
+
+######################
+# Custom Functions
+######################
+# Check if Nutanix CVMs are included in the (unfiltered) export
+def check_for_cvms(dataset_id):
+    df_vInfo = dataset_store.open_datasets(dataset_id, ['vInfo'])[0]
+    return bool((df_vInfo['VM Name'].str.match('^NTNX-.*-CVM$')==True).any())
+
+# Filter a dataset by the selected clusters: dataset_store.filter_by_cluster on the memory-mapped tab (a view where the selected rows allow it)
+def filter_dataset(dataset_id, vCluster_selected, dataset_name):
+    return dataset_store.filter_datasets(dataset_id, list(vCluster_selected), [dataset_name])[0]
+
+# Count the VMs by power state: (on, off, total)
+def count_vms(df_vInfo_filtered):
+    power_state = df_vInfo_filtered['Power State'].to_numpy()
+    return int((power_state == 'poweredOn').sum()), int((power_state == 'poweredOff').sum()), df_vInfo_filtered.shape[0]
+
+# Generate the heatmaps of the distribution grids: (vCPU, vRAM, VM capacity per cluster), None for grids without VMs
+def generate_distribution_charts(distribution_grids):
+    vCPU_grid, vRAM_grid, storage_grid = distribution_grids
+    return (
+        None if vCPU_grid.is_empty() else distribution_charts.generate_density_chart(vCPU_grid, 'vCPUs provisioned', 'vCPUs 95th Percentile', 350),
+        None if vRAM_grid.is_empty() else distribution_charts.generate_density_chart(vRAM_grid, 'GiB provisioned', 'GiB 95th Percentile', 350),
+        None if storage_grid.is_empty() else distribution_charts.generate_density_chart(storage_grid, 'VM Capacity', 'Cluster', 150 + 25 * len(storage_grid.y_labels)),
+    )
+
+# Build the recompute graph of the app
+def build_analysis_graph():
+
+    graph = RecomputeGraph()
+    for input_name in analysis_inputs:
+        graph.add_input(input_name)
+
+    # Filtered datasets, one node per tab (the detail tabs are only requested once they are stored)
+    graph.add_node('contains_cvms', check_for_cvms, ['dataset_id'])
+    for dataset_name in dataset_store.dataset_names:
+        graph.add_node('df_'+dataset_name+'_filtered', lambda dataset_id, vCluster_selected, dataset_name=dataset_name: filter_dataset(dataset_id, vCluster_selected, dataset_name), ['dataset_id', 'vCluster_selected'])
+
+    # vCluster overview & vHosts details
+    graph.add_node('CPU_infos', custom_functions.generate_CPU_infos, ['df_vHosts_filtered'])
+    graph.add_node('Memory_infos', custom_functions.generate_Memory_infos, ['df_vHosts_filtered'])
+    graph.add_node('Storage_infos', custom_functions.generate_Storage_infos, ['df_vPartition_filtered'])
+    graph.add_node('donut_chart_cpu', lambda CPU_infos: custom_functions.generate_donut_chart(CPU_infos[2]), ['CPU_infos'])
+    graph.add_node('donut_chart_memory', lambda Memory_infos: custom_functions.generate_donut_chart(Memory_infos[2]), ['Memory_infos'])
+    graph.add_node('donut_chart_storage', lambda Storage_infos: custom_functions.generate_donut_chart(Storage_infos[2]), ['Storage_infos'])
+    graph.add_node('read_write_ratio_infos', custom_functions.generate_read_write_ratio_infos, ['df_vCluster_filtered'])
+    graph.add_node('vHosts_overview_df', custom_functions.generate_vHosts_overview_df, ['df_vHosts_filtered'])
+
+    # VM details
+    graph.add_node('vm_counts', count_vms, ['df_vInfo_filtered'])
+    graph.add_node('top10_vCPU_VMs_df', custom_functions.generate_top10_vCPU_VMs_df, ['df_vCPU_filtered'])
+    graph.add_node('top10_vMemory_VMs_df', custom_functions.generate_top10_vMemory_VMs_df, ['df_vMemory_filtered'])
+    graph.add_node('top10_vStorage_consumed_VMs_df', custom_functions.generate_top10_vStorage_consumed_VMs_df, ['df_vmList_filtered'])
+    graph.add_node('guest_os_df', custom_functions.generate_guest_os_df, ['df_vmList_filtered'])
+
+    # vCPU / vRAM / vStorage results, overview tables & charts
+    graph.add_node('vCPU_result', custom_functions.generate_vCPU_result, ['df_vCPU_filtered', 'df_vHosts_filtered'])
+    graph.add_node('vCPU_overview_df', custom_functions.generate_vCPU_overview_df, ['vCPU_result'])
+    graph.add_node('vCPU_bar_chart', lambda vCPU_result: custom_functions.generate_bar_charts(vCPU_result.usage_values(), "vCPUs", 350), ['vCPU_result'])
+    graph.add_node('vRAM_result', custom_functions.generate_vRAM_result, ['df_vMemory_filtered'])
+    graph.add_node('vRAM_overview_df', custom_functions.generate_vRAM_overview_df, ['vRAM_result'])
+    graph.add_node('vRAM_bar_chart', lambda vRAM_result: custom_functions.generate_bar_charts(vRAM_result.usage_values(), "GiB", 250), ['vRAM_result'])
+    graph.add_node('vStorage_result', custom_functions.generate_vStorage_result, ['df_vPartition_filtered', 'df_vDisk_filtered', 'df_vmList_filtered', 'df_vSnapshot_filtered'])
+    graph.add_node('vStorage_overview_df', custom_functions.generate_vStorage_overview_df, ['vStorage_result'])
+    graph.add_node('storage_chart', custom_functions.generate_storage_charts, ['vStorage_result'])
+
+    # Right-sizing, distributions & comparison with an older export
+    graph.add_node('rightsizing_df', rightsizing.generate_rightsizing_df, ['df_vCPU_filtered', 'df_vMemory_filtered', 'rightsizing_basis', 'rightsizing_buffer'])
+    graph.add_node('rightsizing_cluster_df', rightsizing.generate_rightsizing_cluster_df, ['rightsizing_df'])
+    graph.add_node('rightsizing_ranking_df', rightsizing.generate_rightsizing_ranking_df, ['rightsizing_df', 'rightsizing_ranking'])
+    graph.add_node('distribution_grids', distribution_charts.generate_distribution_grids, ['dataset_id', 'vCluster_selected'])
+    graph.add_node('distribution_charts', generate_distribution_charts, ['distribution_grids'])
+    graph.add_node('snapshot_diff_result', snapshot_diff.generate_snapshot_diff_from_datasets, ['compare_dataset_id', 'dataset_id'])
+
+    # Sizing values (basis, final value incl. growth, growth)
+    graph.add_node('vCPU_sizing', custom_functions.calculate_sizing_values_vCPU, ['vCPU_result', 'vCPU_option', 'vCPU_growth'])
+    graph.add_node('vRAM_sizing', custom_functions.calculate_sizing_values_vRAM, ['vRAM_result', 'vRAM_option', 'vRAM_growth'])
+    graph.add_node('vStorage_sizing', custom_functions.calculate_sizing_values_vStorage, ['vStorage_result', 'vStorage_option', 'vStorage_growth'])
+
+    return graph
+
+analysis_graph = build_analysis_graph()
@@ -0,0 +1,367 @@
+import os
+import re
+import sys
+import json
+import math
+import time
+import signal
+import argparse
+import warnings
+import threading
+import dataclasses
+import multiprocessing
+from contextlib import contextmanager
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import custom_functions
+import dataset_store
+
+######################
+# Initialize variables
+######################
+# Local HTTP service returning the analysis & sizing results of the app as JSON (e.g. for the quoting spreadsheet / CRM plugin).
+# Parsing and analysis run in a bounded process pool, parsed exports are reused from the dataset store.
+#   POST /datasets                       body: collector export (.xlsx)  -> dataset id & clusters
+#   GET  /analysis?dataset_id=...        optional: &cluster=A&cluster=B, &vCPU_option=...&vCPU_growth=10 (same for vRAM / vStorage)
+#   POST /analysis?cluster=...           body: collector export (.xlsx), parse & analysis in one request
+#   GET  /metrics                        latency percentiles, queue depth, cache hits
+#   GET  /health
+service_host = os.environ.get('NTNX_SERVICE_HOST', '127.0.0.1')
+service_port = int(os.environ.get('NTNX_SERVICE_PORT', '8502'))
+service_workers = int(os.environ.get('NTNX_SERVICE_WORKERS', max((os.cpu_count() or 2) - 1, 1)))
+max_queued_jobs = 32 # jobs waiting for a free worker, further requests are rejected (503)
+max_upload_bytes = 512 * 2**20
+latency_window = 1000 # latency percentiles over the last requests per endpoint
+analysis_cache_size = 256 # analysis results per dataset & cluster selection kept in the service process
+
+service_session_id = 'analysis-service-'+str(os.getpid()) # dataset_store lease of the service
+dataset_id_pattern = re.compile('^[0-9a-f]{32}$')
+
+# Service state (process pool, jobs, metrics & analysis cache), shared by the request threads
+worker_pool = None
+service_lock = threading.Lock()
+jobs_in_progress = 0
+rejected_requests = 0
+request_counts = {}
+request_latencies = {}
+analysis_cache = OrderedDict()
+analysis_cache_hits = 0
+analysis_cache_misses = 0
+leased_datasets = set()
+job_locks = {} # job key -> [lock, waiting & running requests], concurrent requests for the same parsing / analysis wait for the first one
+
+######################
+# Custom Functions
+######################
+# Raised if all workers are busy and the queue is full
+class ServiceBusyError(Exception):
+    pass
+
+# Worker: parse a collector export into the dataset store (only once per content), returns the dataset id
+def parse_export(file_bytes):
+    return dataset_store.store_datasets(file_bytes)
+
+# Worker: generate the headline values and the vCPU / vRAM / vStorage results of a dataset & cluster selection (None = all clusters)
+def analyze_dataset(dataset_id, vCluster_selected):
+
+    clusters = dataset_store.get_dataset_clusters(dataset_id)
+    if vCluster_selected is None:
+        vCluster_selected = clusters
+    unknown_clusters = [cluster for cluster in vCluster_selected if cluster not in clusters]
+    if unknown_clusters:
+        raise ValueError(f"unknown clusters: {unknown_clusters}")
+
+    df_vInfo_filtered, df_vCPU_filtered, df_vMemory_filtered, df_vHosts_filtered, df_vCluster_filtered, df_vPartition_filtered, df_vmList_filtered, df_vDisk_filtered, df_vSnapshot_filtered = dataset_store.filter_datasets(dataset_id, vCluster_selected)
+    total_ghz, consumed_ghz, cpu_percentage = custom_functions.generate_CPU_infos(df_vHosts_filtered)
+    total_memory, consumed_memory, memory_percentage = custom_functions.generate_Memory_infos(df_vHosts_filtered)
+    storage_provisioned, storage_consumed, storage_percentage = custom_functions.generate_Storage_infos(df_vPartition_filtered)
+    read_ratio, write_ratio = custom_functions.generate_read_write_ratio_infos(df_vCluster_filtered)
+
+    headline = {
+        'datacenters': df_vCluster_filtered['Datacenter'].nunique(),
+        'clusters': df_vCluster_filtered['Cluster Name'].nunique(),
+        'hosts': df_vHosts_filtered.shape[0],
+        'vms': df_vInfo_filtered.shape[0],
+        'vms_on': int((df_vInfo_filtered['Power State'].to_numpy() == 'poweredOn').sum()),
+        'vms_off': int((df_vInfo_filtered['Power State'].to_numpy() == 'poweredOff').sum()),
+        'cpu_ghz_total': total_ghz, 'cpu_ghz_consumed': consumed_ghz, 'cpu_percentage': cpu_percentage[0],
+        'memory_gib_total': total_memory, 'memory_gib_consumed': consumed_memory, 'memory_percentage': memory_percentage[0],
+        'storage_tib_provisioned': storage_provisioned, 'storage_tib_consumed': storage_consumed, 'storage_percentage': storage_percentage[0],
+        'iops': round(df_vCluster_filtered['95th Percentile IOPS'].sum(), 2),
+        'read_ratio': read_ratio, 'write_ratio': write_ratio,
+    }
+    vCPU_result = custom_functions.generate_vCPU_result(df_vCPU_filtered, df_vHosts_filtered)
+    vRAM_result = custom_functions.generate_vRAM_result(df_vMemory_filtered)
+    vStorage_result = custom_functions.generate_vStorage_result(df_vPartition_filtered, df_vDisk_filtered, df_vmList_filtered, df_vSnapshot_filtered)
+
+    return list(vCluster_selected), headline, vCPU_result, vRAM_result, vStorage_result
+
+# Worker initializer
+def init_worker():
+    warnings.simplefilter("ignore") # Ignore openpyxl Excile File Warning while reading (no default style)
+
+# Run a function in the process pool, waits for the result. Rejects the job if the queue is full.
+def run_job(function, *args):
+
+    global jobs_in_progress, rejected_requests
+    with service_lock:
+        if jobs_in_progress >= service_workers + max_queued_jobs:
+            rejected_requests += 1
+            raise ServiceBusyError(f"all {service_workers} workers busy and {max_queued_jobs} jobs queued")
+        jobs_in_progress += 1
+    try:
+        return worker_pool.submit(function, *args).result()
+    finally:
+        with service_lock:
+            jobs_in_progress -= 1
+
+# Lock a job key while its job runs, the lock is removed once no request uses the key anymore
+@contextmanager
+def lock_job(job_key):
+
+    with service_lock:
+        job_lock = job_locks.setdefault(job_key, [threading.Lock(), 0])
+        job_lock[1] += 1
+    try:
+        with job_lock[0]:
+            yield
+    finally:
+        with service_lock:
+            job_lock[1] -= 1
+            if job_lock[1] == 0:
+                del job_locks[job_key]
+
+# Register the usage of a dataset by the service (refreshes the lease on every request)
+def lease_dataset(dataset_id):
+    dataset_store.acquire_dataset(dataset_id, service_session_id)
+    with service_lock:
+        leased_datasets.add(dataset_id)
+
+# Drop the cached analysis results & leases of datasets removed from the dataset store (by cleanup_datasets of any process)
+def invalidate_removed_datasets():
+
+    with service_lock:
+        dataset_ids = {cache_key[0] for cache_key in analysis_cache} | leased_datasets
+    removed_datasets = {dataset_id for dataset_id in dataset_ids if not dataset_store.is_dataset_complete(dataset_id)}
+    if removed_datasets:
+        with service_lock:
+            for cache_key in [cache_key for cache_key in analysis_cache if cache_key[0] in removed_datasets]:
+                del analysis_cache[cache_key]
+            leased_datasets.difference_update(removed_datasets)
+
+    return removed_datasets
+
+# Parse an uploaded export (or reuse the stored dataset), returns the dataset id
+def store_export(file_bytes):
+
+    dataset_id = dataset_store.get_dataset_id(file_bytes)
+    if not dataset_store.is_dataset_complete(dataset_id):
+        with lock_job(('parse', dataset_id)):
+            if not dataset_store.is_dataset_complete(dataset_id):
+                run_job(parse_export, file_bytes)
+                dataset_store.cleanup_datasets()
+                invalidate_removed_datasets()
+    lease_dataset(dataset_id)
+
+    return dataset_id
+
+# Get the analysis results of a dataset & cluster selection, cached per dataset & selection
+def get_analysis(dataset_id, vCluster_selected):
+
+    global analysis_cache_hits, analysis_cache_misses
+    if not dataset_id_pattern.match(dataset_id):
+        raise ValueError(f"invalid dataset id: {dataset_id}")
+    if not dataset_store.is_dataset_complete(dataset_id):
+        invalidate_removed_datasets()
+        raise FileNotFoundError(f"unknown dataset id: {dataset_id}")
+    lease_dataset(dataset_id)
+
+    cache_key = (dataset_id, None if vCluster_selected is None else tuple(sorted(set(vCluster_selected))))
+    with lock_job(('analysis',) + cache_key):
+        with service_lock:
+            if cache_key in analysis_cache:
+                analysis_cache_hits += 1
+                analysis_cache.move_to_end(cache_key)
+                return analysis_cache[cache_key]
+            analysis_cache_misses += 1
+
+        analysis = run_job(analyze_dataset, dataset_id, None if cache_key[1] is None else list(cache_key[1]))
+        with service_lock:
+            analysis_cache[cache_key] = analysis
+            while len(analysis_cache) > analysis_cache_size:
+                analysis_cache.popitem(last=False)
+
+    return analysis
+
+# Generate the sizing values for the requested (or default) sizing options & growth values
+def generate_sizing(query, vCPU_result, vRAM_result, vStorage_result):
+
+    sizing = {}
+    for result_type, result, sizing_options, calculate_sizing_values in [
+        ('vCPU', vCPU_result, custom_functions.vCPU_sizing_options, custom_functions.calculate_sizing_values_vCPU),
+        ('vRAM', vRAM_result, custom_functions.vRAM_sizing_options, custom_functions.calculate_sizing_values_vRAM),
+        ('vStorage', vStorage_result, custom_functions.vStorage_sizing_options, custom_functions.calculate_sizing_values_vStorage),
+    ]:
+        sizing_option = query.get(result_type+'_option', [custom_functions.sizing_defaults[result_type][0]])[0]
+        if sizing_option not in sizing_options:
+            raise ValueError(f"unknown {result_type} sizing option: {sizing_option}, options: {list(sizing_options)}")
+        try:
+            growth = int(query.get(result_type+'_growth', [custom_functions.sizing_defaults[result_type][1]])[0])
+        except ValueError:
+            raise ValueError(f"{result_type}_growth has to be an integer (%)")
+        basis, final, growth_value = calculate_sizing_values(result, sizing_option, growth)
+        sizing[result_type] = {'option': sizing_option, 'growth_percent': growth, 'basis': basis, 'final': final, 'growth': growth_value}
+
+    return sizing
+
+# Generate the JSON response of an analysis request
+def generate_analysis_response(dataset_id, query):
+
+    vCluster_selected = query.get('cluster') # all clusters if not given
+    clusters, headline, vCPU_result, vRAM_result, vStorage_result = get_analysis(dataset_id, vCluster_selected)
+
+    return {
+        'dataset_id': dataset_id,
+        'clusters': clusters,
+        'headline': headline,
+        'vCPU': dataclasses.asdict(vCPU_result),
+        'vRAM': dataclasses.asdict(vRAM_result),
+        'vStorage': dataclasses.asdict(vStorage_result),
+        'sizing': generate_sizing(query, vCPU_result, vRAM_result, vStorage_result),
+    }
+
+# Convert numpy values & NaN (not allowed in JSON) into plain JSON values
+def to_json_value(value):
+    if isinstance(value, dict):
+        return {str(key): to_json_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json_value(item) for item in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+# Record the latency of a request
+def record_latency(endpoint, seconds):
+    with service_lock:
+        request_counts[endpoint] = request_counts.get(endpoint, 0) + 1
+        request_latencies.setdefault(endpoint, deque(maxlen=latency_window)).append(seconds)
+
+# Generate the service metrics (latency percentiles in ms over the last latency_window requests per endpoint)
+def generate_metrics():
+
+    with service_lock:
+        latency_ms = {
+            endpoint: dict(
+                requests=request_counts[endpoint],
+                **{f"p{percentile}": float(np.percentile(np.asarray(latencies) * 1000, percentile)) for percentile in (50, 90, 95, 99)}
+            )
+            for endpoint, latencies in request_latencies.items()
+        }
+        return {
+            'workers': service_workers,
+            'jobs_in_progress': jobs_in_progress,
+            'queue_depth': max(jobs_in_progress - service_workers, 0),
+            'max_queued_jobs': max_queued_jobs,
+            'rejected_requests': rejected_requests,
+            'analysis_cache': {'entries': len(analysis_cache), 'hits': analysis_cache_hits, 'misses': analysis_cache_misses},
+            'latency_ms': latency_ms,
+        }
+
+# HTTP request handler (one thread per request, the work itself runs in the process pool)
+class AnalysisRequestHandler(BaseHTTPRequestHandler):
+
+    def send_json(self, status, payload):
+        body = json.dumps(to_json_value(payload), allow_nan=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        content_length = int(self.headers.get('Content-Length') or 0)
+        if content_length <= 0:
+            raise ValueError('request body with the collector export (.xlsx) expected')
+        if content_length > max_upload_bytes:
+            raise OverflowError(f"upload larger than {max_upload_bytes} bytes")
+        return self.rfile.read(content_length)
+
+    def handle_request(self, method):
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        endpoint = method+' '+url.path
+        start = time.perf_counter()
+        try:
+            if method == 'GET' and url.path == '/health':
+                status, payload = 200, {'status': 'ok'}
+            elif method == 'GET' and url.path == '/metrics':
+                status, payload = 200, generate_metrics()
+            elif method == 'POST' and url.path == '/datasets':
+                dataset_id = store_export(self.read_body())
+                status, payload = 201, {'dataset_id': dataset_id, 'clusters': dataset_store.get_dataset_clusters(dataset_id)}
+            elif method == 'GET' and url.path == '/analysis':
+                if 'dataset_id' not in query:
+                    raise ValueError('dataset_id expected')
+                status, payload = 200, generate_analysis_response(query['dataset_id'][0], query)
+            elif method == 'POST' and url.path == '/analysis':
+                status, payload = 200, generate_analysis_response(store_export(self.read_body()), query)
+            else:
+                status, payload = 404, {'error': f"unknown endpoint: {endpoint}"}
+        except ServiceBusyError as e:
+            status, payload = 503, {'error': str(e)}
+        except FileNotFoundError as e:
+            status, payload = 404, {'error': str(e)}
+        except OverflowError as e:
+            status, payload = 413, {'error': str(e)}
+        except ValueError as e:
+            status, payload = 400, {'error': str(e)}
+        except Exception as e: # e.g. the uploaded file is no collector export
+            status, payload = 422, {'error': f"{type(e).__name__}: {e}"}
+
+        self.send_json(status, payload)
+        if url.path not in ('/health', '/metrics'):
+            record_latency(endpoint, time.perf_counter() - start)
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+# Start the service, blocks until interrupted
+def run_service(host=service_host, port=service_port, workers=service_workers):
+
+    global worker_pool, service_workers
+    service_workers = workers
+    os.environ.setdefault('STREAMLIT_LOGGER_LEVEL', 'error') # workers: no bare mode warnings of streamlit
+    worker_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=init_worker)
+    server = ThreadingHTTPServer((host, port), AnalysisRequestHandler)
+    signal.signal(signal.SIGTERM, signal.default_int_handler) # stop on SIGTERM like on Ctrl+C
+    print(f"Analysis service listening on http://{host}:{port} ({workers} workers)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        worker_pool.shutdown(cancel_futures=True)
+        for dataset_id in leased_datasets:
+            dataset_store.release_dataset(dataset_id, service_session_id)
+
+# Usage:
+#   python analysis_service.py [--host 127.0.0.1] [--port 8502] [--workers 4]
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local HTTP service for the Nutanix Collector analysis & sizing results.')
+    parser.add_argument('--host', default=service_host)
+    parser.add_argument('--port', type=int, default=service_port)
+    parser.add_argument('--workers', type=int, default=service_workers)
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore")
+    run_service(args.host, args.port, args.workers)
@@ -1,13 +1,21 @@
 import plotly.express as px
-import plotly.graph_objs as go
 import streamlit as st
 import custom_functions
+import dataset_store
+import snapshot_diff
+import trend_store
+import rightsizing
+import distribution_charts
+import s3_ingest
+import recompute_graph
+from analysis_graph import analysis_graph, recompute_report_enabled
 import pandas as pd
 import numpy as np
 import warnings
 from PIL import Image
 import time
 import base64
+import uuid
 
 ######################
 # Page Config
@@ -21,6 +29,8 @@ st.markdown(f"<style>{custom_functions.local_css('style/style.css')}</style>", u
 ######################
 filter_form_submitted = False
 uploaded_file_valid = False
+if 'session_id' not in st.session_state:
+    st.session_state['session_id'] = uuid.uuid4().hex # used for dataset_store leases
 warnings.simplefilter("ignore") # Ignore openpyxl Excile File Warning while reading (no default style)
 
 ######################
@@ -47,12 +57,35 @@ with upload_filter_section:
     with column_upload:
         uploaded_file = st.file_uploader(label="Laden Sie Ihre Excel basierte Collector Auswertung hier hoch.", type=['xlsx'], help='Diesen Excel Export können Sie entweder direkt aus der Collector Anwendung heraus erzeugen oder über das Collector Portal mittels "Export as .XLS". ')
 
-    if uploaded_file is not None:
+        # Optional: pick an export from the configured S3 bucket instead of uploading it
+        s3_export_selected = None
+        if s3_ingest.s3_bucket is not None and uploaded_file is None:
+            s3_exports = s3_ingest.list_exports_for_app(s3_ingest.s3_bucket, s3_ingest.s3_prefix)
+            s3_export_selected = st.selectbox('Oder Collector Auswertung aus dem S3 Bucket wählen:', [None] + list(s3_exports), format_func=lambda key: '-' if key is None else key, key='s3_export_selectbox')
+
+    export_name = uploaded_file.name if uploaded_file is not None else s3_export_selected
+
+    if export_name is not None:
         with column_filter:            
                 try:
 
-                    # load excel, filter our relevant tabs and columns, merge all in one dataframe
-                    df_vInfo, df_vCPU, df_vMemory, df_vHosts, df_vCluster, df_vPartition, df_vmList, df_vDisk, df_vSnapshot = custom_functions.get_data_from_excel(uploaded_file)            
+                    # load excel, filter our relevant tabs and columns, merge all in one dataframe - stored once and shared memory-mapped between sessions
+                    # only the headline tabs are parsed here, the detail tabs follow once the vCluster overview is shown
+                    # the same upload as in the last run is already stored (no re-hashing of the file on every rerun)
+                    uploaded_file_id = getattr(uploaded_file, 'file_id', None)
+                    if uploaded_file_id is not None and st.session_state.get('uploaded_file_id') == uploaded_file_id and st.session_state.get('dataset_id') is not None:
+                        dataset_id = st.session_state['dataset_id']
+                    elif uploaded_file is not None:
+                        dataset_id = dataset_store.store_headline_datasets(uploaded_file)
+                    else:
+                        dataset_id = s3_ingest.get_export_dataset_id(s3_ingest.s3_bucket, s3_export_selected, s3_exports[s3_export_selected]['ETag'])
+                    if st.session_state.get('dataset_id') not in (None, dataset_id):
+                        dataset_store.release_dataset(st.session_state['dataset_id'], st.session_state['session_id'])
+                        dataset_store.cleanup_datasets()
+                    dataset_store.acquire_dataset(dataset_id, st.session_state['session_id'])
+                    st.session_state['dataset_id'] = dataset_id
+                    st.session_state['uploaded_file_id'] = uploaded_file_id
+                    df_vInfo, df_vHosts, df_vCluster, df_vPartition = dataset_store.open_datasets(dataset_id, dataset_store.headline_dataset_names)
 
                     vCluster_selected = st.multiselect(
                         "vCluster selektieren:",
@@ -68,33 +101,39 @@ with upload_filter_section:
                     analysis_section.error("##### FEHLER: Die hochgeladene Nutanix Collector Excel Datei konnte leider nicht ausgelesen werden.")
                     analysis_section.markdown("Im folgenden die genaue Fehlermeldung für ein Troubleshooting:")
                     analysis_section.exception(e)
-                    st.session_state[uploaded_file.name] = True 
-
-if uploaded_file is not None and uploaded_file_valid is True and len(vCluster_selected) != 0:
+                    st.session_state[export_name] = True 
+
+    elif st.session_state.get('dataset_id') is not None:
+        # uploaded / selected file was removed, release the dataset and remove datasets which are not used anymore
+        dataset_store.release_dataset(st.session_state['dataset_id'], st.session_state['session_id'])
+        st.session_state['dataset_id'] = None
+        st.session_state['detail_dataset_id'] = None
+        dataset_store.cleanup_datasets()
+        st.session_state.pop('analysis_graph_state', None) # memoized frames & tables of the released dataset
+
+if export_name is not None and uploaded_file_valid is True and len(vCluster_selected) != 0:
+
+    # Derived tables, charts and sizing values are memoized nodes of the analysis graph (per session), the widget values are its inputs.
+    # Only nodes downstream of changed widgets are recomputed.
+    if 'analysis_graph_state' not in st.session_state:
+        st.session_state['analysis_graph_state'] = recompute_graph.GraphState()
+    graph_state = st.session_state['analysis_graph_state']
+    analysis_graph.start_run(graph_state)
+    analysis_graph.set_inputs(graph_state, dataset_id=dataset_id, vCluster_selected=tuple(vCluster_selected))
 
     # Check is Nutanix CVMs are included in analysis which could lead to misinterpretations
-    check_for_cvms = df_vInfo[(df_vInfo['VM Name'].str.match('^NTNX-.*-CVM$')==True)]
-    if not check_for_cvms.empty:
+    if analysis_graph.get(graph_state, 'contains_cvms'):
         upload_filter_section.warning('Achtung: Die Collector Auswertung scheint Nutanix CVMs zu enthalten welche die Auswertung (insbesondere im Storage Bereich) stark verfälschen können. Es ist empfohlen Auswertungen von Nutanix Umgebungen über Prism abzuziehen und nicht über den Hypervisor. Entweder neue Nutanix Auswertung abziehen (empfohlen) oder CVMs manuell aus der Collector Excel Datei entfernen.')
 
     with analysis_section: 
         st.markdown("---")
         st.markdown('### Auswertung')
         
-        # Declare new df for filtered vCluster selection
-        df_vInfo_filtered = df_vInfo.query("`Cluster Name`==@vCluster_selected")
-        df_vCPU_filtered = df_vCPU.query("`Cluster Name`==@vCluster_selected")
-        df_vMemory_filtered = df_vMemory.query("`Cluster Name`==@vCluster_selected")
-        df_vHosts_filtered = df_vHosts.query("`Cluster Name`==@vCluster_selected")
-        df_vCluster_filtered = df_vCluster.query("`Cluster Name`==@vCluster_selected")
-        df_vPartition_filtered = df_vPartition.query("`Cluster Name`==@vCluster_selected")
-        df_vmList_filtered = df_vmList.query("`Cluster Name`==@vCluster_selected")
-        df_vDisk_filtered = df_vDisk.query("`Cluster Name`==@vCluster_selected")
-        df_vSnapshot_filtered = df_vSnapshot.query("`Cluster Name`==@vCluster_selected")
+        # Declare new df for filtered vCluster selection (views / row selections of the shared datasets)
+        df_vInfo_filtered, df_vHosts_filtered, df_vCluster_filtered, df_vPartition_filtered = analysis_graph.get(graph_state, 'df_vInfo_filtered', 'df_vHosts_filtered', 'df_vCluster_filtered', 'df_vPartition_filtered')
 
         # Set bar chart setting to static for both  charts
         chart_config = {'staticPlot': True}
-        chart_marker_colors = ['#034EA2','#BBE3F3']
         
         vCluster_expander = st.expander(label='vCluster Übersicht')
         with vCluster_expander:
@@ -105,13 +144,8 @@ if uploaded_file is not None and uploaded_file_valid is True and len(vCluster_se
             with column_cpu:
                 st.markdown("<h4 style='text-align: center; color:#000000;'>pCPU:</h4>", unsafe_allow_html=True)
 
-                total_ghz, consumed_ghz, cpu_percentage = custom_functions.generate_CPU_infos(df_vHosts_filtered)
-
-                donut_chart_cpu = go.Figure(data = go.Pie(values = cpu_percentage, hole = 0.9, marker_colors=chart_marker_colors, sort=False,textinfo='none', hoverinfo='skip'))
-                donut_chart_cpu.add_annotation(x= 0.5, y = 0.5, text = str(round(cpu_percentage[0],2))+' %',
-                                    font = dict(size=20,family='Arial Black', color='black'), showarrow = False)
-                donut_chart_cpu.update(layout_showlegend=False)
-                donut_chart_cpu.update_layout(margin=dict(l=10, r=10, t=10, b=10,pad=4), autosize=True, height = 150)
+                total_ghz, consumed_ghz, cpu_percentage = analysis_graph.get(graph_state, 'CPU_infos')
+                donut_chart_cpu = analysis_graph.get(graph_state, 'donut_chart_cpu')
 
                 st.plotly_chart(donut_chart_cpu, use_container_width=True, config=chart_config)
                 st.markdown(f"<p style='text-align: center;'>{consumed_ghz} GHz verwendet</p>", unsafe_allow_html=True)
@@ -120,13 +154,8 @@ if uploaded_file is not None and uploaded_file_valid is True and len(vCluster_se
             with column_memory:
                 st.markdown("<h4 style='text-align: center; color:#000000;'>pMemory:</h4>", unsafe_allow_html=True)
 
-                total_memory, consumed_memory, memory_percentage = custom_functions.generate_Memory_infos(df_vHosts_filtered)
-
-                donut_chart_memory = go.Figure(data = go.Pie(values = memory_percentage, hole = 0.9, marker_colors=chart_marker_colors, sort=False,textinfo='none', hoverinfo='skip'))
-                donut_chart_memory.add_annotation(x= 0.5, y = 0.5, text = str(round(memory_percentage[0],2))+' %',
-                                    font = dict(size=20,family='Arial Black', color='black'), showarrow = False)
-                donut_chart_memory.update(layout_showlegend=False)
-                donut_chart_memory.update_layout(margin=dict(l=10, r=10, t=10, b=10,pad=4), autosize=True, height = 150)
+                total_memory, consumed_memory, memory_percentage = analysis_graph.get(graph_state, 'Memory_infos')
+                donut_chart_memory = analysis_graph.get(graph_state, 'donut_chart_memory')
 
                 st.plotly_chart(donut_chart_memory, use_container_width=True, config=chart_config)
                 st.markdown(f"<p style='text-align: center;'>{consumed_memory} GiB verwendet</p>", unsafe_allow_html=True)
@@ -135,13 +164,8 @@ if uploaded_file is not None and uploaded_file_valid is True and len(vCluster_se
             with column_storage:
                 st.markdown("<h4 style='text-align: center; color:#000000;'>vStorage:</h4>", unsafe_allow_html=True)
 
-                storage_provisioned, storage_consumed, storage_percentage = custom_functions.generate_Storage_infos(df_vPartition_filtered)
-
-                donut_chart_storage = go.Figure(data = go.Pie(values = storage_percentage, hole = 0.9, marker_colors=chart_marker_colors, sort=False,textinfo='none', hoverinfo='skip'))
-                donut_chart_storage.add_annotation(x= 0.5, y = 0.5, text = str(round(storage_percentage[0],2))+' %',
-                                    font = dict(size=20,family='Arial Black', color='black'), showarrow = False)
-                donut_chart_storage.update(layout_showlegend=False)
-                donut_chart_storage.update_layout(margin=dict(l=10, r=10, t=10, b=10,pad=4), autosize=True, height = 150)
+                storage_provisioned, storage_consumed, storage_percentage = analysis_graph.get(graph_state, 'Storage_infos')
+                donut_chart_storage = analysis_graph.get(graph_state, 'donut_chart_storage')
 
                 st.plotly_chart(donut_chart_storage, use_container_width=True, config=chart_config)
                 st.markdown(f"<p style='text-align: center;'>{storage_consumed} TiB verwendet</p>", unsafe_allow_html=True)
@@ -154,42 +178,61 @@ if uploaded_file is not None and uploaded_file_valid is True and len(vCluster_se
                     st.markdown("<h4 style='text-align: center; color:#000000;'>IOPS:</h4>", unsafe_allow_html=True)
                     st.markdown(f"<h5 style='text-align: center;'>{round(df_vCluster_filtered['95th Percentile IOPS'].sum(),2)}</h5>", unsafe_allow_html=True)
             with column_read_write_ratio:
-                    read_ratio, write_ratio = custom_functions.generate_read_write_ratio_infos(df_vCluster_filtered)
+                    read_ratio, write_ratio = analysis_graph.get(graph_state, 'read_write_ratio_infos')
                     st.markdown("<h4 style='text-align: center; color:#000000;'>Read / Write Verhältnis:</h4>", unsafe_allow_html=True)
                     st.markdown(f"<h5 style='text-align: center;'>{read_ratio} % / {write_ratio} %</h5>", unsafe_allow_html=True)      
 
         vHosts_expander = st.expander(label='vHosts Details')
         with vHosts_expander:
 
-            pCPU_df, memory_df, hardware_df = custom_functions.generate_vHosts_overview_df(df_vHosts_filtered)            
+            pCPU_df, memory_df, hardware_df = analysis_graph.get(graph_state, 'vHosts_overview_df')            
             column_pCPU, column_pRAM, column_hardware = st.columns(3)
             
             with column_pCPU:
                 st.markdown("<h5 style='text-align: center; color:#000000;'>pCPU Details:</h5>", unsafe_allow_html=True)
-                st.table(pCPU_df)
+                st.table(pCPU_df.style.format(precision=2)) # Limit export to 2 decimals
             with column_pRAM:
                 st.markdown("<h5 style='text-align: center; color:#000000;'> pMemory Details:</h5>", unsafe_allow_html=True)
-                st.table(memory_df)
+                st.table(memory_df.style.format(precision=2))
             with column_hardware:
                 st.markdown("<h5 style='text-align: center; color:#000000;'>vHost Details:</h5>", unsafe_allow_html=True)
                 st.table(hardware_df)
                 
+        # Parse the detail tabs (vCPU / vMemory usage, vmList, vDisk, vSnapshot) while the sections above are already shown.
+        # Once per upload / selected export, sessions storing the same export concurrently wait for the first one and reuse it.
+        if st.session_state.get('detail_dataset_id') != dataset_id:
+            with st.spinner('Die Details der Collector Auswertung werden geladen ...'):
+                try:
+                    if uploaded_file is not None:
+                        dataset_store.store_detail_datasets(uploaded_file, dataset_id)
+                    else: # S3 export: fetched & stored again if its dataset isn't complete anymore (e.g. removed by a cleanup)
+                        s3_ingest.get_export_dataset_id(s3_ingest.s3_bucket, s3_export_selected, s3_exports[s3_export_selected]['ETag'])
+                except Exception as e:
+                    st.error("##### FEHLER: Die hochgeladene Nutanix Collector Excel Datei konnte leider nicht ausgelesen werden.")
+                    st.markdown("Im folgenden die genaue Fehlermeldung für ein Troubleshooting:")
+                    st.exception(e)
+                    st.stop()
+            try:
+                trend_store.save_export(dataset_id) # every analyzed export, the customer is assigned below
+            except Exception as e: # trend database locked / not writable, the analysis is shown anyway
+                st.warning(f"Die Cluster Werte der Auswertung konnten nicht für das Wachstum gespeichert werden: {e}")
+            st.session_state['detail_dataset_id'] = dataset_id
+
         VM_expander = st.expander(label='VM Details')
         with VM_expander:
 
-            df_vInfo_filtered_vm_on = df_vInfo_filtered.query("`Power State`=='poweredOn'")    
-            df_vInfo_filtered_vm_off = df_vInfo_filtered.query("`Power State`=='poweredOff'")
+            vms_on, vms_off, vms_total = analysis_graph.get(graph_state, 'vm_counts')
 
             column_vm_on, column_vm_off, column_vm_total = st.columns(3)            
 
             with column_vm_on:                    
-                st.markdown(f"<h5 style='text-align: center; color:#000000;'>VMs On: { df_vInfo_filtered_vm_on['MOID'].shape[0] }</h5>", unsafe_allow_html=True)
+                st.markdown(f"<h5 style='text-align: center; color:#000000;'>VMs On: { vms_on }</h5>", unsafe_allow_html=True)
 
             with column_vm_off:                
-                st.markdown(f"<h5 style='text-align: center; color:#000000;'>VMs Off: { df_vInfo_filtered_vm_off['MOID'].shape[0] }</h5>", unsafe_allow_html=True)
+                st.markdown(f"<h5 style='text-align: center; color:#000000;'>VMs Off: { vms_off }</h5>", unsafe_allow_html=True)
 
             with column_vm_total:
-                st.markdown(f"<h5 style='text-align: center; color:#000000;'>VMs Gesamt: { df_vInfo_filtered['MOID'].shape[0] }</h5>", unsafe_allow_html=True)
+                st.markdown(f"<h5 style='text-align: center; color:#000000;'>VMs Gesamt: { vms_total }</h5>", unsafe_allow_html=True)
 
             st.write('---')
             
@@ -197,20 +240,20 @@ if uploaded_file is not None and uploaded_file_valid is True and len(vCluster_se
 
             with column_top10_vCPU:        
                 st.markdown(f"<h6 style='text-align: center; color:#000000;'>Top 10 VMs: vCPU (On)</h6>", unsafe_allow_html=True)                
-                top_vms_vCPU = custom_functions.generate_top10_vCPU_VMs_df(df_vCPU_filtered)
+                top_vms_vCPU = analysis_graph.get(graph_state, 'top10_vCPU_VMs_df')
                 st.table(top_vms_vCPU)
             with column_top10_vRAM:
                 st.markdown(f"<h6 style='text-align: center; color:#000000;'>Top 10 VMs: vMemory (On)</h6>", unsafe_allow_html=True)
-                top_vms_vMemory = custom_functions.generate_top10_vMemory_VMs_df(df_vMemory_filtered)
-                st.table(top_vms_vMemory)
+                top_vms_vMemory = analysis_graph.get(graph_state, 'top10_vMemory_VMs_df')
+                st.table(top_vms_vMemory.style.format(precision=0))
             with column_top10_vStorage:
                 st.markdown(f"<h6 style='text-align: center; color:#000000;'>Top 10 VMs: vStorage consumed</h6>", unsafe_allow_html=True)
-                top_vms_vStorage_consumed = custom_functions.generate_top10_vStorage_consumed_VMs_df(df_vmList_filtered)
-                st.table(top_vms_vStorage_consumed)
+                top_vms_vStorage_consumed = analysis_graph.get(graph_state, 'top10_vStorage_consumed_VMs_df')
+                st.table(top_vms_vStorage_consumed.style.format(precision=2))
 
         guest_os_expander = st.expander(label='VM Gastbetriebssystem Details')
         with guest_os_expander:
-            guest_os_df = custom_functions.generate_guest_os_df(df_vmList_filtered)
+            guest_os_df = analysis_graph.get(graph_state, 'guest_os_df')
             st.table(guest_os_df)
             st.write('Ein Auslesen der Gastbetriebssysteme setzt u.A. vorraus dass die passenden Guest Tools in den VMs installiert sind und diese eingeschaltet sind/waren. Dies ist i.d.R. nicht überall der Fall daher zeigt die obige Tabelle nur die Gastbetriebssysteme von den VMs bei welchen solch ein Auslesen möglich war.')
 
@@ -224,18 +267,18 @@ if uploaded_file is not None and uploaded_file_valid is True and len(vCluster_se
             with column_vCPU_performance_based:
                 st.markdown("<h5 style='text-align: left; color:#000000; '><u>Nutzungs-basierte vCPU Auswertung (On)</u></h5>", unsafe_allow_html=True)
 
-            vCPU_provisioned_df, vCPU_overview_df = custom_functions.generate_vCPU_overview_df(df_vCPU_filtered,df_vHosts_filtered)
+            vCPU_provisioned_df, vCPU_overview_df = analysis_graph.get(graph_state, 'vCPU_overview_df')
             
             column_vCPU_overview_table, column_vCPU_performance_based_table, column_vCPU_performance_based_chart = st.columns([2,1.5,2.5])                            
 
             with column_vCPU_overview_table:
-                st.table(vCPU_provisioned_df)
+                st.table(vCPU_provisioned_df.style.format(precision=2, na_rep='nicht vorhanden'))
                 
             with column_vCPU_performance_based_table:
-                st.table(vCPU_overview_df)
+                st.table(vCPU_overview_df.style.format(precision=2, na_rep='nicht vorhanden'))
 
             with column_vCPU_performance_based_chart:
-                bar_chart_vCPU, vCPU_bar_chart_config = custom_functions.generate_bar_charts(vCPU_overview_df.data, "vCPUs", 350)
+                bar_chart_vCPU, vCPU_bar_chart_config = analysis_graph.get(graph_state, 'vCPU_bar_chart')
                 st.plotly_chart(bar_chart_vCPU,use_container_width=True, config=vCPU_bar_chart_config)                
 
             st.write('Der Nutanix Collector kann neben den zugewiesenen vCPU Ressourcen an die VMs ebenfalls die Performance Werte der letzten 7 Tage in 30 Minuten Intervallen aus vCenter/Prism auslesen und bietet anhand dessen eine Möglichkeit für Rückschlüsse auf tatsächlich verwendete / benötigte vCPU Ressourcen. Bei den hier rechts gezeigten Nutzungs-basierten Auswertung wird die jeweils prozentuale Auslastung pro angeschalteter VM mit den zugewiesenen vCPU Werten multipliziert und mit zusätzlich 20% Puffer versehen. **Da vCPU überprovisioniert werden kann, bietet es sich an die tatsächlich benötigten vCPU Werte zu verwenden (95th Percentile empfohlen).**')
@@ -249,26 +292,72 @@ if uploaded_file is not None and uploaded_file_valid is True and len(vCluster_se
             with column_vRAM_performance_based:
                 st.markdown("<h5 style='text-align: left; color:#000000; '><u>Nutzungs-basierte vMemory Auswertung (On)</u></h5>", unsafe_allow_html=True)
 
-            vRAM_provisioned_df, vMemory_overview_df = custom_functions.generate_vRAM_overview_df(df_vMemory_filtered)
+            vRAM_provisioned_df, vMemory_overview_df = analysis_graph.get(graph_state, 'vRAM_overview_df')
             
             column_vRAM_overview_table, column_vRAM_performance_based_table, column_vRAM_performance_based_chart = st.columns([2,1.5,2.5])                            
 
             with column_vRAM_overview_table:
-                st.table(vRAM_provisioned_df)
+                st.table(vRAM_provisioned_df.style.format(precision=2, na_rep='nicht vorhanden'))
                 
             with column_vRAM_performance_based_table:
-                st.table(vMemory_overview_df)
+                st.table(vMemory_overview_df.style.format(precision=2, na_rep='nicht vorhanden'))
 
             with column_vRAM_performance_based_chart:
-                bar_chart_vMemory, vMemory_bar_chart_config = custom_functions.generate_bar_charts(vMemory_overview_df.data, "GiB", 250)
+                bar_chart_vMemory, vMemory_bar_chart_config = analysis_graph.get(graph_state, 'vRAM_bar_chart')
                 st.plotly_chart(bar_chart_vMemory,use_container_width=True, config=vMemory_bar_chart_config)                
 
             st.write('Der Nutanix Collector kann neben den zugewiesenen vMemory Ressourcen an die VMs ebenfalls die Performance Werte der letzten 7 Tage in 30 Minuten Intervallen aus vCenter/Prism auslesen und bietet anhand dessen eine Möglichkeit für Rückschlüsse auf tatsächlich verwendete / benötigte vMemory Ressourcen. Bei den hier rechts gezeigten Nutzungs-basierten Auswertung wird die jeweils prozentuale Auslastung pro angeschalteter VM mit den zugewiesenen vMemory Werten multipliziert und mit zusätzlich 20% Puffer versehen. **Da vMemory nicht überprovisioniert werden sollte, sollte beim Sizing lediglich die konfigurierten/provisioned Werte verwendet werden.** Die tatsächliche Auslastung kann aber Rückschlüsse auf ein potenzielles Optimierungspotenzial und und damit verbundenen Kosteneinsparungen aufzeigen.')
 
+        rightsizing_expander = st.expander(label='VM Right-Sizing (On)')
+        with rightsizing_expander:
+            column_rightsizing_basis, column_rightsizing_buffer, column_rightsizing_ranking = st.columns(3)
+            with column_rightsizing_basis:
+                rightsizing_basis_selected = st.selectbox('Nutzungs-Grundlage:', tuple(rightsizing.rightsizing_basis_options), key='rightsizing_basis_selectbox')
+            with column_rightsizing_buffer:
+                rightsizing_buffer_selected = st.slider('Puffer auf die Nutzung (Faktor):', 1.0, 2.0, custom_functions.usage_buffer_factor, 0.05, key='rightsizing_buffer_slider')
+            with column_rightsizing_ranking:
+                rightsizing_ranking_selected = st.selectbox('Ranking nach:', tuple(rightsizing.rightsizing_ranking_options), key='rightsizing_ranking_selectbox')
+
+            analysis_graph.set_inputs(graph_state, rightsizing_basis=rightsizing_basis_selected, rightsizing_buffer=rightsizing_buffer_selected, rightsizing_ranking=rightsizing_ranking_selected)
+
+            st.markdown("<h5 style='text-align: left; color:#000000; '><u>Einsparpotenzial pro Cluster</u></h5>", unsafe_allow_html=True)
+            st.table(analysis_graph.get(graph_state, 'rightsizing_cluster_df').style.format(precision=2))
+            st.markdown("<h5 style='text-align: left; color:#000000; '><u>Top 10 VMs mit dem größten Einsparpotenzial pro Cluster</u></h5>", unsafe_allow_html=True)
+            st.dataframe(analysis_graph.get(graph_state, 'rightsizing_ranking_df').style.format(precision=2))
+            st.markdown("<h5 style='text-align: left; color:#000000; '><u>Alle VMs (sortierbar)</u></h5>", unsafe_allow_html=True)
+            st.dataframe( # column formats instead of a Styler, a Styler renders every cell of the (possibly large) table on the server
+                analysis_graph.get(graph_state, 'rightsizing_df'), use_container_width=True, hide_index=True,
+                column_config={column: st.column_config.NumberColumn(format='%.2f') for column in ['vRAM (GiB)', 'vRAM empfohlen (GiB)', 'vRAM einsparbar (GiB)']}
+            )
+            st.write('Pro angeschalteter VM wird die prozentuale Auslastung (gewählte Grundlage) mit den zugewiesenen vCPU / vMemory Werten multipliziert, mit dem gewählten Puffer versehen und aufgerundet. Die Differenz zu den zugewiesenen Werten ergibt das Einsparpotenzial.')
+
+        distribution_expander = st.expander(label='Verteilungen (VMs)')
+        with distribution_expander:
+            vCPU_distribution_chart, vRAM_distribution_chart, storage_distribution_chart = analysis_graph.get(graph_state, 'distribution_charts')
+            column_vCPU_distribution, column_vRAM_distribution = st.columns(2)
+            with column_vCPU_distribution:
+                st.markdown("<h5 style='text-align: center; color:#000000;'>vCPU: Provisioned vs. 95th Percentile (On)</h5>", unsafe_allow_html=True)
+                if vCPU_distribution_chart is not None:
+                    st.plotly_chart(vCPU_distribution_chart, use_container_width=True)
+                else:
+                    st.write('Keine VMs mit Werten in der Auswahl.')
+            with column_vRAM_distribution:
+                st.markdown("<h5 style='text-align: center; color:#000000;'>vRAM: Provisioned vs. 95th Percentile (On)</h5>", unsafe_allow_html=True)
+                if vRAM_distribution_chart is not None:
+                    st.plotly_chart(vRAM_distribution_chart, use_container_width=True)
+                else:
+                    st.write('Keine VMs mit Werten in der Auswahl.')
+            st.markdown("<h5 style='text-align: center; color:#000000;'>VM Capacity pro Cluster</h5>", unsafe_allow_html=True)
+            if storage_distribution_chart is not None:
+                st.plotly_chart(storage_distribution_chart, use_container_width=True)
+            else:
+                st.write('Keine VMs mit Werten in der Auswahl.')
+            st.write('Die VMs werden vorab in ein festes Raster zusammengefasst, die Farbe zeigt die Anzahl der VMs pro Feld. Die Diagramme bleiben damit auch bei sehr vielen VMs schnell.')
+
         vStorage_expander = st.expander(label='vStorage Details')
         with vStorage_expander:
             column_vPartition, column_vDisk, column_vSnapshot = st.columns(3)                            
-            vPartition_df, vDisk_df, vmList_df, vSnapshot_df = custom_functions.generate_vStorage_overview_df(df_vPartition_filtered, df_vDisk_filtered, df_vmList_filtered, df_vSnapshot_filtered)
+            vPartition_df, vDisk_df, vmList_df, vSnapshot_df = analysis_graph.get(graph_state, 'vStorage_overview_df')
 
             with column_vPartition:
                 st.markdown("<h5 style='text-align: left; color:#000000; '><u>vPartition Auswertung</u></h5>", unsafe_allow_html=True)            
@@ -286,13 +375,70 @@ if uploaded_file is not None and uploaded_file_valid is True and len(vCluster_se
             st.markdown("<h5 style='text-align: left; color:#000000; '><u>VM Storage Auswertung</u></h5>", unsafe_allow_html=True)
             st.write('In der Regel werden bei einer Auswertung die vPartition Daten herangezogen. Jedoch kann es sein, dass nicht für alle VMs die vPartition Daten vorliegen (z.B. durch fehlende Guest Tools), daher wird für diese VMs auf die vDisk Daten zurückgegriffen um so für alle VMs den Storage Bedarf bestmöglich erfassen zu können. Für eine `provisioned` Storage Berechnung wird 100% der vDisk Kapazität angenommen, für eine `consumed` Storage Berechnung wird 80% der vDisk Kapazität angenommen.')
 
-            storage_chart, storage_chart_config = custom_functions.generate_storage_charts(vmList_df)
+            storage_chart, storage_chart_config = analysis_graph.get(graph_state, 'storage_chart')
             column_vm_storage_table, column_vm_storage_chart = st.columns(2)            
             with column_vm_storage_table:
                 st.table(vmList_df)
             with column_vm_storage_chart:
                 st.markdown("<h5 style='text-align: center; color:#000000; '>VM Capacity - Gesamt:</h5>", unsafe_allow_html=True)
                 st.plotly_chart(storage_chart,use_container_width=True, config=storage_chart_config)    
+
+        snapshot_diff_expander = st.expander(label='Vergleich mit älterer Auswertung')
+        with snapshot_diff_expander:
+            compare_file = st.file_uploader(label="Ältere Collector Auswertung derselben Umgebung zum Vergleich hochladen.", type=['xlsx'], key='compare_file', help='Die VMs werden anhand der MOID verglichen. Der Vergleich umfasst alle Cluster beider Auswertungen.')
+
+            if compare_file is not None:
+                # the same compare file as in the last run is already stored (no re-reading / re-hashing of the file on every rerun)
+                compare_file_id = getattr(compare_file, 'file_id', None)
+                if compare_file_id is not None and st.session_state.get('compare_file_id') == compare_file_id and st.session_state.get('compare_dataset_id') is not None:
+                    compare_dataset_id = st.session_state['compare_dataset_id']
+                else:
+                    compare_dataset_id = dataset_store.store_datasets(compare_file)
+                if st.session_state.get('compare_dataset_id') not in (None, compare_dataset_id):
+                    dataset_store.release_dataset(st.session_state['compare_dataset_id'], st.session_state['session_id'])
+                dataset_store.acquire_dataset(compare_dataset_id, st.session_state['session_id'])
+                st.session_state['compare_dataset_id'] = compare_dataset_id
+                st.session_state['compare_file_id'] = compare_file_id
+
+                analysis_graph.set_inputs(graph_state, compare_dataset_id=compare_dataset_id)
+                snapshot_diff_result = analysis_graph.get(graph_state, 'snapshot_diff_result')
+
+                column_added, column_removed, column_changed, column_power_state, column_moved, column_unchanged = st.columns(6)
+                with column_added:
+                    st.markdown(f"<h5 style='text-align: center; color:#000000;'>VMs neu: { snapshot_diff_result.vms_added.shape[0] }</h5>", unsafe_allow_html=True)
+                with column_removed:
+                    st.markdown(f"<h5 style='text-align: center; color:#000000;'>VMs entfernt: { snapshot_diff_result.vms_removed.shape[0] }</h5>", unsafe_allow_html=True)
+                with column_changed:
+                    st.markdown(f"<h5 style='text-align: center; color:#000000;'>VMs geändert: { snapshot_diff_result.vms_changed.shape[0] }</h5>", unsafe_allow_html=True)
+                with column_power_state:
+                    st.markdown(f"<h5 style='text-align: center; color:#000000;'>Power State geändert: { snapshot_diff_result.power_state_changes.shape[0] }</h5>", unsafe_allow_html=True)
+                with column_moved:
+                    st.markdown(f"<h5 style='text-align: center; color:#000000;'>VMs verschoben: { snapshot_diff_result.vms_moved.shape[0] }</h5>", unsafe_allow_html=True)
+                with column_unchanged:
+                    st.markdown(f"<h5 style='text-align: center; color:#000000;'>VMs unverändert: { snapshot_diff_result.vms_unchanged }</h5>", unsafe_allow_html=True)
+
+                st.markdown("<h5 style='text-align: left; color:#000000; '><u>Veränderung pro Cluster</u></h5>", unsafe_allow_html=True)
+                st.table(snapshot_diff_result.cluster_deltas.style.format(precision=2))
+
+                st.markdown("<h5 style='text-align: left; color:#000000; '><u>Geänderte VMs (vCPU / vRAM / vStorage)</u></h5>", unsafe_allow_html=True)
+                st.dataframe(snapshot_diff_result.vms_changed)
+                st.markdown("<h5 style='text-align: left; color:#000000; '><u>Power State Änderungen</u></h5>", unsafe_allow_html=True)
+                st.dataframe(snapshot_diff_result.power_state_changes)
+                st.markdown("<h5 style='text-align: left; color:#000000; '><u>Zwischen Clustern verschobene VMs</u></h5>", unsafe_allow_html=True)
+                st.dataframe(snapshot_diff_result.vms_moved)
+
+                column_vms_added, column_vms_removed = st.columns(2)
+                with column_vms_added:
+                    st.markdown("<h5 style='text-align: left; color:#000000; '><u>Neue VMs</u></h5>", unsafe_allow_html=True)
+                    st.dataframe(snapshot_diff_result.vms_added)
+                with column_vms_removed:
+                    st.markdown("<h5 style='text-align: left; color:#000000; '><u>Entfernte VMs</u></h5>", unsafe_allow_html=True)
+                    st.dataframe(snapshot_diff_result.vms_removed)
+
+            elif st.session_state.get('compare_dataset_id') is not None:
+                dataset_store.release_dataset(st.session_state['compare_dataset_id'], st.session_state['session_id'])
+                st.session_state['compare_dataset_id'] = None
+                st.session_state['compare_file_id'] = None
     
 
     with sizing_section: 
@@ -304,36 +450,70 @@ if uploaded_file is not None and uploaded_file_valid is True and len(vCluster_se
             st.markdown("<h4 style='text-align: center; color:#000000; '><u>vCPU Sizing:</u></h4>", unsafe_allow_html=True)
 
             if 'vCPU_selectbox' not in st.session_state:
-                st.session_state['vCPU_selectbox'] = 'On VMs - 95th Percentile vCPUs *'
+                st.session_state['vCPU_selectbox'] = custom_functions.sizing_defaults['vCPU'][0]
             if 'vCPU_slider' not in st.session_state:
-                st.session_state['vCPU_slider'] = 10
+                st.session_state['vCPU_slider'] = custom_functions.sizing_defaults['vCPU'][1]
 
-            form_vCPU_selected = st.selectbox('vCPU Sizing Grundlage wählen:', ('On VMs - 95th Percentile vCPUs *', 'On VMs - Peak vCPUs', 'On VMs - Provisioned vCPUs','On und Off VMs - Provisioned vCPUs','On VMs - Average vCPUs', 'On VMs - Median vCPUs'), key='vCPU_selectbox', on_change=custom_functions.calculate_sizing_result_vCPU(vCPU_provisioned_df, vCPU_overview_df))
-            form_vCPU_growth_selected = st.slider('Wieviel % vCPU Wachstum?', 0, 100, key='vCPU_slider', on_change=custom_functions.calculate_sizing_result_vCPU(vCPU_provisioned_df, vCPU_overview_df))
+            form_vCPU_selected = st.selectbox('vCPU Sizing Grundlage wählen:', tuple(custom_functions.vCPU_sizing_options), key='vCPU_selectbox')
+            form_vCPU_growth_selected = st.slider('Wieviel % vCPU Wachstum?', 0, 100, key='vCPU_slider')
             
         with form_column_vRAM:
             st.markdown("<h4 style='text-align: center; color:#000000; '><u>vMemory Sizing:</u></h4>", unsafe_allow_html=True)
 
             if 'vRAM_selectbox' not in st.session_state:
-                st.session_state['vRAM_selectbox'] = 'On VMs - Provisioned vMemory *'
+                st.session_state['vRAM_selectbox'] = custom_functions.sizing_defaults['vRAM'][0]
             if 'vRAM_slider' not in st.session_state:
-                st.session_state['vRAM_slider'] = 30
+                st.session_state['vRAM_slider'] = custom_functions.sizing_defaults['vRAM'][1]
 
-            form_vMemory_selected = st.selectbox('vMemory Sizing Grundlage wählen:', ('On VMs - Provisioned vMemory *', 'On und Off VMs - Provisioned vMemory', 'On VMs - Peak vMemory', 'On VMs - 95th Percentile vMemory', 'On VMs - Average vMemory', 'On VMs - Median vMemory'), key='vRAM_selectbox', on_change=custom_functions.calculate_sizing_result_vRAM(vRAM_provisioned_df, vMemory_overview_df))
-            form_vMemory_growth_selected = st.slider('Wieviel % vMemory Wachstum?', 0, 100, key='vRAM_slider', on_change=custom_functions.calculate_sizing_result_vRAM(vRAM_provisioned_df, vMemory_overview_df))
+            form_vMemory_selected = st.selectbox('vMemory Sizing Grundlage wählen:', tuple(custom_functions.vRAM_sizing_options), key='vRAM_selectbox')
+            form_vMemory_growth_selected = st.slider('Wieviel % vMemory Wachstum?', 0, 100, key='vRAM_slider')
 
         with form_column_vStorage:
             st.markdown("<h4 style='text-align: center; color:#000000; '><u>vStorage Sizing:</u></h4>", unsafe_allow_html=True)
 
             if 'vStorage_selectbox' not in st.session_state:
-                st.session_state['vStorage_selectbox'] = 'On und Off VMs - Consumed VM Storage *'
+                st.session_state['vStorage_selectbox'] = custom_functions.sizing_defaults['vStorage'][0]
             if 'vStorage_slider' not in st.session_state:
-                st.session_state['vStorage_slider'] = 20
+                st.session_state['vStorage_slider'] = custom_functions.sizing_defaults['vStorage'][1]
 
-            form_vStorage_selected = st.selectbox('vStorage Sizing Grundlage wählen:', ('On und Off VMs - Consumed VM Storage *', 'On VMs - Consumed VM Storage', 'On und Off VMs - Provisioned VM Storage', 'On VMs - Provisioned VM Storage'), key='vStorage_selectbox', on_change=custom_functions.calculate_sizing_result_vRAM(vCPU_provisioned_df, vCPU_overview_df))
-            form_vStorage_growth_selected = st.slider('Wieviel % Storage Wachstum?', 0, 100, key='vStorage_slider', on_change=custom_functions.calculate_sizing_result_vRAM(vCPU_provisioned_df, vCPU_overview_df))
+            form_vStorage_selected = st.selectbox('vStorage Sizing Grundlage wählen:', tuple(custom_functions.vStorage_sizing_options), key='vStorage_selectbox')
+            form_vStorage_growth_selected = st.slider('Wieviel % Storage Wachstum?', 0, 100, key='vStorage_slider')
+        analysis_graph.set_inputs(graph_state, vCPU_option=form_vCPU_selected, vCPU_growth=form_vCPU_growth_selected, vRAM_option=form_vMemory_selected, vRAM_growth=form_vMemory_growth_selected, vStorage_option=form_vStorage_selected, vStorage_growth=form_vStorage_growth_selected)
         st.markdown("""<p><u>Hinweis:</u> Die mit * markierten Optionen stellen die jeweilige Empfehlung für vCPU, vRAM und vStorage dar.</p>""", unsafe_allow_html=True)
 
+        trend_expander = st.expander(label='Wachstum aus gespeicherten Auswertungen')
+        with trend_expander:
+            try:
+                column_trend_customer, column_trend_date, column_trend_save = st.columns([2,1,1])
+                with column_trend_customer:
+                    trend_customer = st.text_input('Kunde:', key='trend_customer')
+                with column_trend_date:
+                    trend_collection_date = st.date_input('Datum der Collector Auswertung:', key='trend_collection_date')
+                with column_trend_save:
+                    st.write('')
+                    st.write('')
+                    if st.button('Kunde zuordnen', disabled=(trend_customer.strip() == '')):
+                        trend_store.assign_customer(dataset_id, trend_customer.strip(), trend_collection_date)
+                        st.success('Die Cluster Werte der Auswertung wurden dem Kunden zugeordnet.')
+                export_customer = trend_store.get_export_customer(dataset_id)
+                if export_customer is not None:
+                    st.write(f"Diese Auswertung ist dem Kunden **{export_customer[0]}** ({export_customer[1].strftime('%d.%m.%Y')}) zugeordnet.")
+
+                if trend_customer.strip() != '':
+                    trend_table = pd.DataFrame({
+                        'vCPUs': trend_store.get_trend(trend_customer.strip(), vCluster_selected, 'vCPU_'+custom_functions.vCPU_sizing_options[st.session_state['vCPU_selectbox']]),
+                        'vRAM (GiB)': trend_store.get_trend(trend_customer.strip(), vCluster_selected, 'vRAM_'+custom_functions.vRAM_sizing_options[st.session_state['vRAM_selectbox']]),
+                        'vStorage (TiB)': trend_store.get_trend(trend_customer.strip(), vCluster_selected, 'vStorage_'+custom_functions.vStorage_sizing_options[st.session_state['vStorage_selectbox']])
+                    })
+                    if trend_table.shape[0] >= 2:
+                        trend_table.index = trend_table.index.strftime('%d.%m.%Y')
+                        st.table(trend_table.style.format(precision=2))
+                        st.button('Beobachtetes Wachstum (pro Jahr) übernehmen', on_click=trend_store.prefill_growth_sliders, args=(trend_customer.strip(), vCluster_selected))
+                    else:
+                        st.write('Für ein Wachstum werden mindestens zwei gespeicherte Auswertungen mit den selektierten vClustern benötigt.')
+            except Exception as e: # trend database locked / not writable, the analysis is shown anyway
+                st.warning(f"Die gespeicherten Auswertungen konnten nicht geladen werden: {e}")
+
       
         st.write('---')
         st.markdown('### Sizing-Eckdaten-Ergebnis')
@@ -355,7 +535,7 @@ if uploaded_file is not None and uploaded_file_valid is True and len(vCluster_se
             st.markdown(f"""<div class="container"><img class="logo-img" src="data:image/png;base64,{base64.b64encode(open("images/vCPU.png", "rb").read()).decode()}"></div>""", unsafe_allow_html=True)
             st.markdown("<h4 style='text-align: left; color:#000000;'>vCPU</h4>", unsafe_allow_html=True)
 
-            custom_functions.calculate_sizing_result_vCPU(vCPU_provisioned_df, vCPU_overview_df)
+            custom_functions.set_sizing_result('vCPU', analysis_graph.get(graph_state, 'vCPU_sizing'))
             st.metric(label="", value=st.session_state['vCPU_basis']+ ' vCPUs')
             st.metric(label="", value=st.session_state['vCPU_final']+ ' vCPUs', delta=st.session_state['vCPU_growth']+ ' vCPUs')
 
@@ -363,7 +543,7 @@ if uploaded_file is not None and uploaded_file_valid is True and len(vCluster_se
             st.markdown(f"""<div class="container"><img class="logo-img" src="data:image/png;base64,{base64.b64encode(open("images/vRAM.png", "rb").read()).decode()}"></div>""", unsafe_allow_html=True)
             st.markdown("<h4 style='text-align: left; color:#000000;'>vRAM</h4>", unsafe_allow_html=True)
 
-            custom_functions.calculate_sizing_result_vRAM(vRAM_provisioned_df, vMemory_overview_df)            
+            custom_functions.set_sizing_result('vRAM', analysis_graph.get(graph_state, 'vRAM_sizing'))
             st.metric(label="", value=st.session_state['vRAM_basis']+" GiB")
             st.metric(label="", value=st.session_state['vRAM_final']+" GiB", delta=st.session_state['vRAM_growth']+" GiB")
 
@@ -371,6 +551,16 @@ if uploaded_file is not None and uploaded_file_valid is True and len(vCluster_se
             st.markdown(f"""<div class="container"><img class="logo-img" src="data:image/png;base64,{base64.b64encode(open("images/vStorage.png", "rb").read()).decode()}"></div>""", unsafe_allow_html=True)
             st.markdown("<h4 style='text-align: left; color:#000000;'>vStorage</h4>", unsafe_allow_html=True)            
 
-            custom_functions.calculate_sizing_result_vStorage(vmList_df)  
+            custom_functions.set_sizing_result('vStorage', analysis_graph.get(graph_state, 'vStorage_sizing'))
             st.metric(label="", value=st.session_state['vStorage_basis']+" TiB")
             st.metric(label="", value=st.session_state['vStorage_final']+" TiB", delta=st.session_state['vStorage_growth']+" TiB")
+
+    # Which nodes of the analysis graph were invalidated / recomputed in this run and why (only with NTNX_RECOMPUTE_REPORT=1)
+    if recompute_report_enabled:
+        st.write('---')
+        recompute_report_expander = st.expander(label='Neuberechnung in diesem Durchlauf (Abhängigkeitsgraph)')
+        with recompute_report_expander:
+            st.table(analysis_graph.generate_report_df(graph_state))
+
+# Cache statistics of the server process (only written if NTNX_CACHE_STATS_FILE is set, e.g. by load_test.py)
+dataset_store.write_cache_stats({'generate_distribution_grids': distribution_charts.generate_distribution_grids.cache_info(), 'generate_snapshot_diff_from_datasets': snapshot_diff.generate_snapshot_diff_from_datasets.cache_info()})
@@ -1,55 +1,225 @@
+import os
+import base64
 import pandas as pd
 import numpy as np
 from io import BytesIO
 import streamlit as st
 import plotly.express as px  # pip install plotly-express
+import plotly.graph_objs as go
 import plotly.io as pio
-from PIL import Image
 from datetime import datetime
+from dataclasses import dataclass
 import json
 
 ######################
 # Initialize variables
 ######################
-# background nutanix logo for diagrams
-background_image = dict(source=Image.open("images/nutanix-x.png"), xref="paper", yref="paper", x=0.5, y=0.5, sizex=0.95, sizey=0.95, xanchor="center", yanchor="middle", opacity=0.04, layer="below", sizing="contain")
+# Directory of the app (images / styles), independent of the working directory of the app, the service & the CLIs
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Buffer on top of the measured usage for usage-based vCPU / vMemory values
+usage_buffer_factor = 1.2
+
+# vDisk / vPartition sheets with more rows are streamed and aggregated instead of loaded completely
+storage_streaming_row_threshold = 200000
+
+# used / free colors of the donut charts (vCluster overview)
+donut_chart_marker_colors = ['#034EA2','#BBE3F3']
+
+# background nutanix logo for diagrams (as data URI, a shared PIL image is lazily read from its file and not thread-safe)
+with open(os.path.join(base_dir, "images", "nutanix-x.png"), "rb") as f:
+    background_image_uri = "data:image/png;base64,"+base64.b64encode(f.read()).decode()
+background_image = dict(source=background_image_uri, xref="paper", yref="paper", x=0.5, y=0.5, sizex=0.95, sizey=0.95, xanchor="center", yanchor="middle", opacity=0.04, layer="below", sizing="contain")
+
+# Sizing selectbox options mapped to the result field used as sizing basis
+vCPU_sizing_options = {
+    'On VMs - 95th Percentile vCPUs *': 'percentile_95',
+    'On VMs - Peak vCPUs': 'peak',
+    'On VMs - Provisioned vCPUs': 'provisioned_on',
+    'On und Off VMs - Provisioned vCPUs': 'provisioned_total',
+    'On VMs - Average vCPUs': 'average',
+    'On VMs - Median vCPUs': 'median',
+}
+vRAM_sizing_options = {
+    'On VMs - Provisioned vMemory *': 'provisioned_on',
+    'On und Off VMs - Provisioned vMemory': 'provisioned_total',
+    'On VMs - Peak vMemory': 'peak',
+    'On VMs - 95th Percentile vMemory': 'percentile_95',
+    'On VMs - Average vMemory': 'average',
+    'On VMs - Median vMemory': 'median',
+}
+vStorage_sizing_options = {
+    'On und Off VMs - Consumed VM Storage *': 'vmList_consumed_total',
+    'On VMs - Consumed VM Storage': 'vmList_consumed_on',
+    'On und Off VMs - Provisioned VM Storage': 'vmList_capacity_total',
+    'On VMs - Provisioned VM Storage': 'vmList_capacity_on',
+}
+
+# Default sizing option and growth in % per resource (initial values of the sizing section)
+sizing_defaults = {
+    'vCPU': ('On VMs - 95th Percentile vCPUs *', 10),
+    'vRAM': ('On VMs - Provisioned vMemory *', 30),
+    'vStorage': ('On und Off VMs - Consumed VM Storage *', 20),
+}
+
+######################
+# Result models
+######################
+# Numeric results of the analysis builders. Values are plain int / float (NaN if not available),
+# so results can be cached, serialized via dataclasses.asdict and reused by UI, sizing and exports.
+# Formatting into tables / strings only happens at render time.
+
+# vCPU results (provisioned values & usage-based values of On VMs)
+@dataclass(frozen=True)
+class vCPUResult:
+    provisioned_on: int
+    provisioned_off: int
+    provisioned_total: int
+    provisioned_max_on: float
+    provisioned_average_on: float
+    per_core_on: float
+    per_core_on_n_1: float
+    per_core_total: float
+    per_core_total_n_1: float
+    peak: int
+    average: int
+    median: int
+    percentile_95: int
+
+    # Usage-based values in order: Provisioned, Peak, Average, Median, 95th Percentile
+    def usage_values(self):
+        return [self.provisioned_on, self.peak, self.average, self.median, self.percentile_95]
+
+# vRAM results in GiB (provisioned values & usage-based values of On VMs)
+@dataclass(frozen=True)
+class vRAMResult:
+    provisioned_on: float
+    provisioned_off: float
+    provisioned_total: float
+    provisioned_max_on: float
+    provisioned_average_on: float
+    peak: float
+    average: float
+    median: float
+    percentile_95: float
+
+    # Usage-based values in order: Provisioned, Peak, Average, Median, 95th Percentile
+    def usage_values(self):
+        return [self.provisioned_on, self.peak, self.average, self.median, self.percentile_95]
+
+# vStorage results, capacities in TiB (rounded up to 2 decimals)
+@dataclass(frozen=True)
+class vStorageResult:
+    vPartition_vms: int
+    vPartition_on: int
+    vPartition_off: int
+    vPartition_total: int
+    vPartition_consumed_on: float
+    vPartition_consumed_off: float
+    vPartition_consumed_total: float
+    vPartition_capacity_on: float
+    vPartition_capacity_off: float
+    vPartition_capacity_total: float
+    vDisk_vms: int
+    vDisk_on: int
+    vDisk_on_thin: int
+    vDisk_off: int
+    vDisk_off_thin: int
+    vDisk_total: int
+    vDisk_total_thin: int
+    vDisk_capacity_on: float
+    vDisk_capacity_off: float
+    vDisk_capacity_total: float
+    vmList_on: int
+    vmList_on_thin: int
+    vmList_off: int
+    vmList_off_thin: int
+    vmList_total: int
+    vmList_total_thin: int
+    vmList_consumed_on: float
+    vmList_consumed_off: float
+    vmList_consumed_total: float
+    vmList_capacity_on: float
+    vmList_capacity_off: float
+    vmList_capacity_total: float
+    vSnapshot_vms: int
+    vSnapshot_amount: int
+    vSnapshot_size: float
 
 ######################
 # Custom Functions
 ######################
-# Use local CSS
+# Use local CSS (path relative to the app directory)
 def local_css(file_name):
-    with open(file_name) as f:
+    with open(os.path.join(base_dir, file_name)) as f:
         #st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
         return f.read()
 
 # Generate Dataframe from Excel and make neccessary adjustment for easy consumption later on
-@st.cache(allow_output_mutation=True)
-def get_data_from_excel(uploaded_file):
+# (not cached itself, the app caches the parsed data via dataset_store)
+# storage_streaming: stream & aggregate vDisk / vPartition sheets (None = only for sheets above storage_streaming_row_threshold)
+def get_data_from_excel(uploaded_file, storage_streaming=None):
 
     df = pd.ExcelFile(uploaded_file, engine="openpyxl")
+    df_vInfo, df_vHosts, df_vCluster, df_vPartition = get_headline_data_from_excel(df, storage_streaming)
+    df_vCPU, df_vMemory, df_vmList, df_vDisk, df_vSnapshot = get_detail_data_from_excel(df, df_vInfo, storage_streaming)
+
+    return df_vInfo, df_vCPU, df_vMemory, df_vHosts, df_vCluster, df_vPartition, df_vmList, df_vDisk, df_vSnapshot
+
+# Parse the tabs needed for the vCluster overview (headline numbers), small compared to the other tabs
+def get_headline_data_from_excel(excel_file, storage_streaming=None):
 
     # Columns to read from Excel file
     vInfo_cols_to_use = ["VM Name","Power State","Cluster Name","MOID"]
-    vCPU_cols_to_use = ["VM Name","Power State","vCPUs","Peak %","Average %","Median %","95th Percentile % (recommended)","Cluster Name","MOID"]
-    vMemory_cols_to_use = ["VM Name", "Power State","Size (MiB)","Peak %","Average %","Median %","95th Percentile % (recommended)","Cluster Name","MOID"]
     vHosts_cols_to_use = ["Cluster","CPUs","VMs","CPU Cores","CPU Speed","Cores per CPU","Memory Size","CPU Usage","Memory Usage"]
     vCluster_cols_to_use = ["Datacenter", "MOID","Cluster Name","CPU Usage %","Memory Usage %","95th Percentile Disk Throughput (KBps)","95th Percentile IOPS","95th Percentile Number of Reads","95th Percentile Number of Writes"]
     vPartition_cols_to_use = ["VM Name","Power State","Consumed (MiB)","Capacity (MiB)","Datacenter Name","Cluster Name", "Host Name", "MOID"]    
+
+    # Create df for each tab with only relevant columns
+    df_vInfo = excel_file.parse('vInfo', usecols=vInfo_cols_to_use)
+    df_vHosts = excel_file.parse('vHosts', usecols=vHosts_cols_to_use)
+    df_vCluster = excel_file.parse('vCluster', usecols=vCluster_cols_to_use)
+
+    # Large vPartition sheets are aggregated per VM while streaming (bounded memory), 'Row Count' holds the amount of rows
+    if use_storage_streaming(excel_file, 'vPartition', storage_streaming):
+        df_vPartition = stream_aggregate_sheet(excel_file.book['vPartition'], vPartition_cols_to_use, ["Consumed (MiB)","Capacity (MiB)"])
+    else:
+        df_vPartition = excel_file.parse('vPartition', usecols=vPartition_cols_to_use)
+
+    # Calculate from MiB to GiB & rename column
+    df_vPartition.loc[:,"Consumed (MiB)"] = df_vPartition["Consumed (MiB)"] / 1024 # Use GiB instead of MiB
+    df_vPartition.rename(columns={'Consumed (MiB)': 'Consumed (GiB)'}, inplace=True) # Rename Column
+    df_vPartition.loc[:,"Capacity (MiB)"] = df_vPartition["Capacity (MiB)"] / 1024 # Use GiB instead of MiB
+    df_vPartition.rename(columns={'Capacity (MiB)': 'Capacity (GiB)'}, inplace=True) # Rename Column
+
+    # Add Cluster Name & MOID column to vHosts, drop column Cluster (as same as MOID)
+    df_vHosts = pd.merge(df_vHosts, df_vCluster[['Cluster Name','MOID']], left_on='Cluster', right_on='MOID')
+    df_vHosts.drop('Cluster', axis=1, inplace=True)
+    df_vCluster.drop('MOID', axis=1, inplace=True)
+
+    return df_vInfo, df_vHosts, df_vCluster, df_vPartition
+
+# Parse the remaining tabs incl. the vCPU / vMemory usage enrichment (df_vInfo from get_headline_data_from_excel)
+def get_detail_data_from_excel(excel_file, df_vInfo, storage_streaming=None):
+
+    # Columns to read from Excel file
+    vCPU_cols_to_use = ["VM Name","Power State","vCPUs","Peak %","Average %","Median %","95th Percentile % (recommended)","Cluster Name","MOID"]
+    vMemory_cols_to_use = ["VM Name", "Power State","Size (MiB)","Peak %","Average %","Median %","95th Percentile % (recommended)","Cluster Name","MOID"]
     vmList_cols_to_use = ["VM Name","Power State","vCPUs","Memory (MiB)","Thin Provisioned","Capacity (MiB)","Consumed (MiB)","Guest OS","Cluster Name","Datacenter Name"]
     vDisk_cols_to_use = ["VM Name", "Capacity (MiB)", "Thin Provisioned", "Cluster Name", "MOID"]
     vSnapshot_cols_to_use = ["Size MiB (vmsn)", "Cluster Name", "MOID"]
 
     # Create df for each tab with only relevant columns
-    df_vInfo = df.parse('vInfo', usecols=vInfo_cols_to_use)
-    df_vCPU = df.parse('vCPU', usecols=vCPU_cols_to_use)
-    df_vMemory = df.parse('vMemory', usecols=vMemory_cols_to_use)
-    df_vHosts = df.parse('vHosts', usecols=vHosts_cols_to_use)
-    df_vCluster = df.parse('vCluster', usecols=vCluster_cols_to_use)
-    df_vPartition = df.parse('vPartition', usecols=vPartition_cols_to_use)
-    df_vmList = df.parse('vmList', usecols=vmList_cols_to_use)
-    df_vDisk = df.parse('vDisk', usecols=vDisk_cols_to_use)
-    df_vSnapshot = df.parse('vSnapshot', usecols=vSnapshot_cols_to_use)
+    df_vCPU = excel_file.parse('vCPU', usecols=vCPU_cols_to_use)
+    df_vMemory = excel_file.parse('vMemory', usecols=vMemory_cols_to_use)
+    df_vmList = excel_file.parse('vmList', usecols=vmList_cols_to_use)
+
+    # Large vDisk sheets are aggregated per VM while streaming (bounded memory), 'Row Count' holds the amount of rows
+    if use_storage_streaming(excel_file, 'vDisk', storage_streaming):
+        df_vDisk = stream_aggregate_sheet(excel_file.book['vDisk'], vDisk_cols_to_use, ["Capacity (MiB)"], np.float32)
+    else:
+        df_vDisk = excel_file.parse('vDisk', usecols=vDisk_cols_to_use)
+    df_vSnapshot = excel_file.parse('vSnapshot', usecols=vSnapshot_cols_to_use)
 
     # Rename columns to make it shorter and correct names
     df_vCPU.rename(columns={'95th Percentile % (recommended)': '95th Percentile %'}, inplace=True)
@@ -60,10 +230,6 @@ def get_data_from_excel(uploaded_file):
     # Calculate from MiB to GiB & rename column
     df_vMemory.loc[:,"Size (MiB)"] = df_vMemory["Size (MiB)"] / 1024 # Use GiB instead of MiB
     df_vMemory.rename(columns={'Size (MiB)': 'Size (GiB)'}, inplace=True) # Rename Column
-    df_vPartition.loc[:,"Consumed (MiB)"] = df_vPartition["Consumed (MiB)"] / 1024 # Use GiB instead of MiB
-    df_vPartition.rename(columns={'Consumed (MiB)': 'Consumed (GiB)'}, inplace=True) # Rename Column
-    df_vPartition.loc[:,"Capacity (MiB)"] = df_vPartition["Capacity (MiB)"] / 1024 # Use GiB instead of MiB
-    df_vPartition.rename(columns={'Capacity (MiB)': 'Capacity (GiB)'}, inplace=True) # Rename Column
 
     df_vmList.loc[:,"Memory (MiB)"] = df_vmList["Memory (MiB)"] / 1024 # Use GiB instead of MiB
     df_vmList.rename(columns={'Memory (MiB)': 'Memory (GiB)'}, inplace=True) # Rename Column
@@ -82,68 +248,97 @@ def get_data_from_excel(uploaded_file):
     # Add / Generate Total Columns from vCPU performance percentage data
     df_vCPU['vCPUs'] = df_vCPU['vCPUs'].astype(np.int16)
     df_vCPU['Peak %'] = df_vCPU['Peak %'].astype(np.float32)
-    df_vCPU.loc[:,'Peak #'] = df_vCPU.apply(lambda row: get_vCPU_total_values(row, 'Peak %'), axis=1).astype(np.int16)
+    df_vCPU.loc[:,'Peak #'] = calculate_vCPU_total_values(df_vCPU['vCPUs'], df_vCPU['Peak %']).astype(np.int16)
     df_vCPU['Average %'] = df_vCPU['Average %'].astype(np.float32)
-    df_vCPU.loc[:,'Average #'] = df_vCPU.apply(lambda row: get_vCPU_total_values(row, 'Average %'), axis=1).astype(np.int16)
+    df_vCPU.loc[:,'Average #'] = calculate_vCPU_total_values(df_vCPU['vCPUs'], df_vCPU['Average %']).astype(np.int16)
     df_vCPU['Median %'] = df_vCPU['Median %'].astype(np.float32)
-    df_vCPU.loc[:,'Median #'] = df_vCPU.apply(lambda row: get_vCPU_total_values(row, 'Median %'), axis=1).astype(np.int16)
+    df_vCPU.loc[:,'Median #'] = calculate_vCPU_total_values(df_vCPU['vCPUs'], df_vCPU['Median %']).astype(np.int16)
     df_vCPU['95th Percentile %'] = df_vCPU['95th Percentile %'].astype(np.float32)
-    df_vCPU.loc[:,'95th Percentile #'] = df_vCPU.apply(lambda row: get_vCPU_total_values(row, '95th Percentile %'), axis=1).astype(np.int16)
+    df_vCPU.loc[:,'95th Percentile #'] = calculate_vCPU_total_values(df_vCPU['vCPUs'], df_vCPU['95th Percentile %']).astype(np.int16)
 
     # Add / Generate Total Columns from vMemory performance percentage data
     df_vMemory['Size (GiB)'] = df_vMemory['Size (GiB)'].astype(np.float32)
     df_vMemory['Peak %'] = df_vMemory['Peak %'].astype(np.float32)
-    df_vMemory.loc[:,'Peak #'] = df_vMemory.apply(lambda row: get_vMemory_total_values(row, 'Peak %'), axis=1).astype(np.float32)
+    df_vMemory.loc[:,'Peak #'] = calculate_vMemory_total_values(df_vMemory['Size (GiB)'], df_vMemory['Peak %']).astype(np.float32)
     df_vMemory['Average %'] = df_vMemory['Average %'].astype(np.float32)
-    df_vMemory.loc[:,'Average #'] = df_vMemory.apply(lambda row: get_vMemory_total_values(row, 'Average %'), axis=1).astype(np.float32)
+    df_vMemory.loc[:,'Average #'] = calculate_vMemory_total_values(df_vMemory['Size (GiB)'], df_vMemory['Average %']).astype(np.float32)
     df_vMemory['Median %'] = df_vMemory['Median %'].astype(np.float32)
-    df_vMemory.loc[:,'Median #'] = df_vMemory.apply(lambda row: get_vMemory_total_values(row, 'Median %'), axis=1).astype(np.float32)
+    df_vMemory.loc[:,'Median #'] = calculate_vMemory_total_values(df_vMemory['Size (GiB)'], df_vMemory['Median %']).astype(np.float32)
     df_vMemory['95th Percentile %'] = df_vMemory['95th Percentile %'].astype(np.float32)
-    df_vMemory.loc[:,'95th Percentile #'] = df_vMemory.apply(lambda row: get_vMemory_total_values(row, '95th Percentile %'), axis=1).astype(np.float32)
+    df_vMemory.loc[:,'95th Percentile #'] = calculate_vMemory_total_values(df_vMemory['Size (GiB)'], df_vMemory['95th Percentile %']).astype(np.float32)
 
     df_vDisk['Capacity (GiB)'] = df_vDisk['Capacity (GiB)'].astype(np.float32)
     df_vSnapshot['Size (GiB)'] = df_vSnapshot['Size (GiB)'].astype(np.float32)
 
-    # Add Cluster Name & MOID column to vHosts, drop column Cluster (as same as MOID)
-    df_vHosts = pd.merge(df_vHosts, df_vCluster[['Cluster Name','MOID']], left_on='Cluster', right_on='MOID')
-    df_vHosts.drop('Cluster', axis=1, inplace=True)
-    df_vCluster.drop('MOID', axis=1, inplace=True)
-
     # Add Powerstate to vDisk
     df_vDisk = pd.merge(df_vDisk, df_vInfo[['Power State','MOID']], left_on='MOID', right_on='MOID')
 
-    return df_vInfo, df_vCPU, df_vMemory, df_vHosts, df_vCluster, df_vPartition, df_vmList, df_vDisk, df_vSnapshot
-
-# Generate vCPU Values for Peak, Median, Average & 95 Percentile
-def get_vCPU_total_values(df_row, compare_value):
-    if pd.isna(df_row[compare_value]):
-        get_total_value = df_row['vCPUs'] # if no data is available use provisioned vCPU data
-    else:
-        get_total_value = df_row['vCPUs'] * (df_row[compare_value]/100)* 1.2
-        if(get_total_value) < 1:
-            get_total_value = 1
-        if(get_total_value) > df_row['vCPUs']:
-            get_total_value = df_row['vCPUs']
-    return np.ceil(get_total_value) #round up to full number without decimals
-
-# Generate vMemory Values for Peak, Median, Average & 95 Percentile
-def get_vMemory_total_values(df_row, compare_value):
-    vMemory_row_value = df_row['Size (GiB)']
-    vMemory_perf_value = df_row[compare_value]
-    if pd.isna(vMemory_perf_value):
-        get_total_value = vMemory_row_value # if no data is available use provisioned vMemory data
-    else:
-        get_total_value = vMemory_row_value * (vMemory_perf_value/100)* 1.2
-        if np.less(get_total_value, 1):
-            if np.less(vMemory_row_value, 1):
-                get_total_value = vMemory_row_value
-            else:
-                get_total_value = 1
-        elif np.greater(get_total_value, vMemory_row_value):
-            get_total_value = vMemory_row_value
-        else:
-            get_total_value = np.ceil(get_total_value)
-    return get_total_value
+    return df_vCPU, df_vMemory, df_vmList, df_vDisk, df_vSnapshot
+
+# Check if a vPartition / vDisk sheet should be streamed
+def use_storage_streaming(excel_file, sheet_name, storage_streaming):
+    if storage_streaming is not None:
+        return storage_streaming
+    max_row = excel_file.book[sheet_name].max_row # from the sheet dimension, no need to read the rows
+    return max_row is not None and max_row > storage_streaming_row_threshold
+
+# Stream a sheet row by row and sum up the value columns per distinct combination of the other columns.
+# Only the running accumulators are kept in memory (one per VM / cluster / state), not the sheet rows.
+# Each value is cast to row_dtype before it is added, the dtype the non-streamed path casts the rows to
+# (float32(MiB) / 1024 == float32(MiB / 1024), so casting the MiB values matches the GiB columns).
+def stream_aggregate_sheet(worksheet, cols_to_use, value_cols, row_dtype=np.float64):
+
+    rows = worksheet.iter_rows(values_only=True)
+    header = list(next(rows))
+    missing_cols = [col for col in cols_to_use if col not in header]
+    if missing_cols:
+        raise ValueError(f"Usecols do not match columns, columns expected but not found: {missing_cols}")
+
+    cols_in_sheet_order = [col for col in header if col in cols_to_use]
+    key_cols = [col for col in cols_in_sheet_order if col not in value_cols]
+    key_positions = [header.index(col) for col in key_cols]
+    value_positions = [header.index(col) for col in value_cols]
+
+    accumulators = {}
+    for row in rows:
+        if all(value is None for value in row):
+            continue
+        key = tuple(row[position] for position in key_positions)
+        accumulator = accumulators.get(key)
+        if accumulator is None:
+            accumulator = accumulators[key] = [0] + [0.0] * len(value_positions)
+        accumulator[0] += 1
+        for i, position in enumerate(value_positions, start=1):
+            value = row[position]
+            if value is not None and value != '':
+                accumulator[i] += float(row_dtype(float(value)))
+
+    df_aggregated = pd.DataFrame([key + tuple(accumulator[1:]) + (accumulator[0],) for key, accumulator in accumulators.items()], columns=key_cols + value_cols + ['Row Count'])
+    return df_aggregated[cols_in_sheet_order + ['Row Count']]
+
+# Get the amount of sheet rows of a (possibly aggregated) vPartition / vDisk dataframe
+def count_rows(df):
+    if 'Row Count' in df.columns:
+        return int(df['Row Count'].sum())
+    return int(df.shape[0])
+
+# Generate vCPU Values for Peak, Median, Average & 95 Percentile (vectorized over all VMs)
+# usage x buffer, at least 1 and at most the provisioned vCPUs, provisioned vCPUs if no usage data is available
+def calculate_vCPU_total_values(vCPUs, percentage, buffer_factor=usage_buffer_factor):
+    vCPUs = np.asarray(vCPUs, dtype=np.float64)
+    percentage = np.asarray(percentage, dtype=np.float64)
+    total_values = np.minimum(np.maximum(vCPUs * (percentage/100) * buffer_factor, 1), vCPUs)
+    return np.ceil(np.where(np.isnan(percentage), vCPUs, total_values)) #round up to full number without decimals
+
+# Generate vMemory Values for Peak, Median, Average & 95 Percentile (vectorized over all VMs)
+# usage x buffer rounded up, at least 1 GiB (or the provisioned size if smaller) and at most the provisioned size,
+# provisioned size if no usage data is available
+def calculate_vMemory_total_values(size, percentage, buffer_factor=usage_buffer_factor):
+    size = np.asarray(size, dtype=np.float64)
+    percentage = np.asarray(percentage, dtype=np.float64)
+    total_values = size * (percentage/100) * buffer_factor
+    total_values = np.where(total_values < 1, np.minimum(size, 1), np.where(total_values > size, size, np.ceil(total_values)))
+    return np.where(np.isnan(percentage), size, total_values)
 
 # Returns a value rounded up to a specific number of decimal places.
 def round_decimals_up(number:float, decimals:int=2):
@@ -199,7 +394,6 @@ def generate_Storage_infos(df_vPartition_filtered):
     return  round(storage_provisioned,2), round(storage_consumed,2), storage_percentage
 
 # Generate vHost Overview Section
-@st.cache(allow_output_mutation=True)
 def generate_vHosts_overview_df(df_vHosts_filtered):    
 
     # Generate Dataframe for pCPU Details
@@ -214,7 +408,6 @@ def generate_vHosts_overview_df(df_vHosts_filtered):
     pCPU_df = pd.DataFrame(pCPU_first_column_df)
     pCPU_second_column = [total_ghz, consumed_ghz, max_core_amount, max_frequency_amount, average_frequency_amount,max_usage_amount,average_usage_amount]
     pCPU_df.loc[:,'Werte'] = pCPU_second_column
-    pCPU_df = pCPU_df.style.format(precision=2) # Limit export to 2 decimals
 
     # Generate Dataframe for pMemory Details
     total_memory = df_vHosts_filtered['Memory Size'].sum().astype(np.float32)
@@ -226,7 +419,6 @@ def generate_vHosts_overview_df(df_vHosts_filtered):
     memory_df = pd.DataFrame(memory_first_column_df)
     memory_second_column = [total_memory, consumed_memory, max_pRAM_amount, max_pRAM_usage, average_pRAM_usage]
     memory_df.loc[:,'Werte'] = memory_second_column
-    memory_df = memory_df.style.format(precision=2) # Limit export to 2 decimals
 
     # Generate Dataframe for vHost Details
     host_amount = round(df_vHosts_filtered.shape[0]) # get amount of rows / hosts
@@ -242,7 +434,6 @@ def generate_vHosts_overview_df(df_vHosts_filtered):
     return pCPU_df, memory_df, hardware_df
 
 # Generate Top10 VMs based on vCPU (on)
-@st.cache(allow_output_mutation=True)
 def generate_top10_vCPU_VMs_df(df_vCPU_filtered):
 
     df_vCPU_filtered_vm_on = df_vCPU_filtered.query("`Power State`=='poweredOn'")
@@ -251,28 +442,23 @@ def generate_top10_vCPU_VMs_df(df_vCPU_filtered):
     return top_vms_vCPU
 
 # Generate Top10 VMs based on vCPU (on)
-@st.cache(allow_output_mutation=True)
 def generate_top10_vMemory_VMs_df(df_vMemory_filtered):
 
     df_vMemory_filtered_vm_on = df_vMemory_filtered.query("`Power State`=='poweredOn'")
     top_vms_vMemory = df_vMemory_filtered_vm_on[['VM Name','Size (GiB)']].nlargest(10,'Size (GiB)')
-    top_vms_vMemory = top_vms_vMemory.style.format(precision=0) 
 
     return top_vms_vMemory
 
 # Generate Top10 VMs based on vStorage consumed
-@st.cache(allow_output_mutation=True)
 def generate_top10_vStorage_consumed_VMs_df(df_vmList_filtered):
 
     top_vms_vStorage_consumed = df_vmList_filtered[['VM Name','Consumed (GiB)']].nlargest(10,'Consumed (GiB)')
     top_vms_vStorage_consumed.loc[:,"Consumed (GiB)"] = top_vms_vStorage_consumed["Consumed (GiB)"] / 1024
     top_vms_vStorage_consumed.rename(columns={'Consumed (GiB)': 'Consumed (TiB)'}, inplace=True) # Rename Column
-    top_vms_vStorage_consumed = top_vms_vStorage_consumed.style.format(precision=2) 
 
     return top_vms_vStorage_consumed
 
 # Generate Guest OS df
-@st.cache
 def generate_guest_os_df(df_vmList_filtered):
 
     guest_os_df = df_vmList_filtered['Guest OS'].value_counts()
@@ -282,84 +468,91 @@ def generate_guest_os_df(df_vmList_filtered):
     return guest_os_df
 
 
-# Generate vHost Overview Section
-@st.cache(allow_output_mutation=True)
-def generate_vRAM_overview_df(df_vMemory_filtered):
+# Generate vRAM results
+def generate_vRAM_result(df_vMemory_filtered):
     
     df_vMemory_filtered_on = df_vMemory_filtered.query("`Power State`=='poweredOn'")
     df_vMemory_filtered_off = df_vMemory_filtered.query("`Power State`=='poweredOff'")
 
-    vRAM_provisioned_on = df_vMemory_filtered_on['Size (GiB)'].sum()
-    vRAM_provisioned_off = df_vMemory_filtered_off['Size (GiB)'].sum()
-    vRAM_provisioned_total = df_vMemory_filtered['Size (GiB)'].sum()
-    vRAM_provisioned_max_on = df_vMemory_filtered_on['Size (GiB)'].max()
-    vRAM_provisioned_average_on = df_vMemory_filtered_on['Size (GiB)'].mean()
+    return vRAMResult(
+        provisioned_on = float(df_vMemory_filtered_on['Size (GiB)'].sum()),
+        provisioned_off = float(df_vMemory_filtered_off['Size (GiB)'].sum()),
+        provisioned_total = float(df_vMemory_filtered['Size (GiB)'].sum()),
+        provisioned_max_on = float(df_vMemory_filtered_on['Size (GiB)'].max()),
+        provisioned_average_on = float(df_vMemory_filtered_on['Size (GiB)'].mean()),
+        peak = float(df_vMemory_filtered_on["Peak #"].sum()),
+        average = float(df_vMemory_filtered_on["Average #"].sum()),
+        median = float(df_vMemory_filtered_on["Median #"].sum()),
+        percentile_95 = float(df_vMemory_filtered_on["95th Percentile #"].sum())
+    )
+
+# Generate vRAM overview tables from vRAM results
+def generate_vRAM_overview_df(vRAM_result):
+
     vRAM_provisioned_first_column_df = {'': ["vRAM - On","vRAM - Off","vRAM - Gesamt", "Max vRAM pro VM (On)","Ø vRAM pro VM (On)"]}
     vRAM_provisioned_df = pd.DataFrame(vRAM_provisioned_first_column_df)
-    vRAM_provisioned_second_column = [vRAM_provisioned_on, vRAM_provisioned_off, vRAM_provisioned_total,vRAM_provisioned_max_on,vRAM_provisioned_average_on]
+    vRAM_provisioned_second_column = [vRAM_result.provisioned_on, vRAM_result.provisioned_off, vRAM_result.provisioned_total, vRAM_result.provisioned_max_on, vRAM_result.provisioned_average_on]
     vRAM_provisioned_df.loc[:,'GiB'] = vRAM_provisioned_second_column
-    vRAM_provisioned_df = vRAM_provisioned_df.style.format(precision=2, na_rep='nicht vorhanden') 
 
-    vMemory_provisioned = df_vMemory_filtered_on["Size (GiB)"].sum()
-    vMemory_peak = df_vMemory_filtered_on["Peak #"].sum()
-    vMemory_average = df_vMemory_filtered_on["Average #"].sum()
-    vMemory_median = df_vMemory_filtered_on["Median #"].sum()
-    vMemory_95_percentile = df_vMemory_filtered_on["95th Percentile #"].sum()
     vMemory_overview_first_column = {'': ["Provisioned", "Peak", "Average", "Median", "95th Percentile"]}
     vMemory_overview_df = pd.DataFrame(vMemory_overview_first_column)
-    vMemory_overview_second_column = [vMemory_provisioned, vMemory_peak, vMemory_average, vMemory_median, vMemory_95_percentile]
-    vMemory_overview_df.loc[:,'GiB'] = vMemory_overview_second_column
-    vMemory_overview_df = vMemory_overview_df.style.format(precision=2, na_rep='nicht vorhanden') 
+    vMemory_overview_df.loc[:,'GiB'] = vRAM_result.usage_values()
 
     return vRAM_provisioned_df, vMemory_overview_df
 
-# Generate vCPU overview
-@st.cache(allow_output_mutation=True)
-def generate_vCPU_overview_df(df_vCPU_filtered,df_vHosts_filtered):
+# Generate vCPU results
+def generate_vCPU_result(df_vCPU_filtered,df_vHosts_filtered):
     
     df_vCPU_filtered_on = df_vCPU_filtered.query("`Power State`=='poweredOn'")
     df_vCPU_filtered_off = df_vCPU_filtered.query("`Power State`=='poweredOff'")
 
-    vCPU_provisioned_on = df_vCPU_filtered_on['vCPUs'].sum()
-    vCPU_provisioned_off = df_vCPU_filtered_off['vCPUs'].sum()
-    vCPU_provisioned_total = df_vCPU_filtered['vCPUs'].sum()
-    vCPU_provisioned_max_on = df_vCPU_filtered_on['vCPUs'].max()
-    vCPU_provisioned_average_on = df_vCPU_filtered_on['vCPUs'].mean()
-    vCPU_provisioned_core_on = df_vCPU_filtered_on['vCPUs'].sum() / df_vHosts_filtered['CPU Cores'].sum()
+    vCPU_provisioned_on = int(df_vCPU_filtered_on['vCPUs'].sum())
+    vCPU_provisioned_total = int(df_vCPU_filtered['vCPUs'].sum())
+    cores_total = df_vHosts_filtered['CPU Cores'].sum()
 
     if df_vHosts_filtered.shape[0] > 1: # Make sure more than 1 host
-        vCPU_provisioned_core_on_n_1 = df_vCPU_filtered_on['vCPUs'].sum() / ((df_vHosts_filtered['CPU Cores'].sum() / df_vHosts_filtered.shape[0]) * (df_vHosts_filtered.shape[0]-1))
-        vCPU_provisioned_core_total_n_1 = df_vCPU_filtered['vCPUs'].sum() / ((df_vHosts_filtered['CPU Cores'].sum() / df_vHosts_filtered.shape[0]) * (df_vHosts_filtered.shape[0]-1))
+        cores_n_1 = (cores_total / df_vHosts_filtered.shape[0]) * (df_vHosts_filtered.shape[0]-1)
+        vCPU_provisioned_core_on_n_1 = vCPU_provisioned_on / cores_n_1
+        vCPU_provisioned_core_total_n_1 = vCPU_provisioned_total / cores_n_1
     else: # in case of single node
         vCPU_provisioned_core_on_n_1 = 0
         vCPU_provisioned_core_total_n_1 = 0
 
-    vCPU_provisioned_core_total = df_vCPU_filtered['vCPUs'].sum() / df_vHosts_filtered['CPU Cores'].sum()
+    return vCPUResult(
+        provisioned_on = vCPU_provisioned_on,
+        provisioned_off = int(df_vCPU_filtered_off['vCPUs'].sum()),
+        provisioned_total = vCPU_provisioned_total,
+        provisioned_max_on = float(df_vCPU_filtered_on['vCPUs'].max()),
+        provisioned_average_on = float(df_vCPU_filtered_on['vCPUs'].mean()),
+        per_core_on = float(vCPU_provisioned_on / cores_total),
+        per_core_on_n_1 = float(vCPU_provisioned_core_on_n_1),
+        per_core_total = float(vCPU_provisioned_total / cores_total),
+        per_core_total_n_1 = float(vCPU_provisioned_core_total_n_1),
+        peak = int(df_vCPU_filtered_on["Peak #"].sum()),
+        average = int(df_vCPU_filtered_on["Average #"].sum()),
+        median = int(df_vCPU_filtered_on["Median #"].sum()),
+        percentile_95 = int(df_vCPU_filtered_on["95th Percentile #"].sum())
+    )
+
+# Generate vCPU overview tables from vCPU results
+def generate_vCPU_overview_df(vCPU_result):
+
     vCPU_provisioned_first_column_df = {'': ["vCPU - On","vCPU - Off","vCPU - Gesamt", "Max vCPU pro VM (On)","Ø vCPU pro VM (On)", "vCPU pro Core (On)", "vCPU pro Core bei N-1 (On)", "vCPU pro Core (Gesamt)", "vCPU pro Core bei N-1 (Gesamt)"]}
     vCPU_provisioned_df = pd.DataFrame(vCPU_provisioned_first_column_df)
-    vCPU_provisioned_second_column = [vCPU_provisioned_on, vCPU_provisioned_off, vCPU_provisioned_total,vCPU_provisioned_max_on,vCPU_provisioned_average_on,vCPU_provisioned_core_on,vCPU_provisioned_core_on_n_1,vCPU_provisioned_core_total,vCPU_provisioned_core_total_n_1]
-
+    vCPU_provisioned_second_column = [vCPU_result.provisioned_on, vCPU_result.provisioned_off, vCPU_result.provisioned_total, vCPU_result.provisioned_max_on, vCPU_result.provisioned_average_on, vCPU_result.per_core_on, vCPU_result.per_core_on_n_1, vCPU_result.per_core_total, vCPU_result.per_core_total_n_1]
     vCPU_provisioned_df.loc[:,'vCPUs'] = vCPU_provisioned_second_column
-    vCPU_provisioned_df = vCPU_provisioned_df.style.format(precision=2, na_rep='nicht vorhanden') 
 
-    vCPU_provisioned = df_vCPU_filtered_on["vCPUs"].sum()
-    vCPU_peak = df_vCPU_filtered_on["Peak #"].sum()
-    vCPU_average = df_vCPU_filtered_on["Average #"].sum()
-    vCPU_median = df_vCPU_filtered_on["Median #"].sum()
-    vCPU_95_percentile = df_vCPU_filtered_on["95th Percentile #"].sum()
     vCPU_overview_first_column = {'': ["Provisioned", "Peak", "Average", "Median", "95th Percentile"]}
     vCPU_overview_df = pd.DataFrame(vCPU_overview_first_column)
-    vCPU_overview_second_column = [vCPU_provisioned, vCPU_peak, vCPU_average, vCPU_median, vCPU_95_percentile]
-    vCPU_overview_df.loc[:,'vCPUs'] = vCPU_overview_second_column
-    vCPU_overview_df = vCPU_overview_df.style.format(precision=2, na_rep='nicht vorhanden') 
+    vCPU_overview_df.loc[:,'vCPUs'] = vCPU_result.usage_values()
 
     return vCPU_provisioned_df, vCPU_overview_df
 
 # Generate Bar charts for vCPU & vMemory
-@st.cache
-def generate_bar_charts(df_vCPU_or_vMemory, y_axis_name, chart_height):
+def generate_bar_charts(usage_values, y_axis_name, chart_height):
 
     bar_chart_names = ['Provisioned', 'Peak', 'Average', 'Median', '95th Percentile']
+    df_vCPU_or_vMemory = pd.DataFrame({'': bar_chart_names, y_axis_name: usage_values})
 
     bar_chart = px.bar(
                 df_vCPU_or_vMemory,
@@ -380,6 +573,17 @@ def generate_bar_charts(df_vCPU_or_vMemory, y_axis_name, chart_height):
 
     return bar_chart, bar_chart_config
 
+# Generate Donut chart for the used percentage of pCPU, pMemory & vStorage
+def generate_donut_chart(percentage):
+
+    donut_chart = go.Figure(data = go.Pie(values = percentage, hole = 0.9, marker_colors=donut_chart_marker_colors, sort=False,textinfo='none', hoverinfo='skip'))
+    donut_chart.add_annotation(x= 0.5, y = 0.5, text = str(round(percentage[0],2))+' %',
+                        font = dict(size=20,family='Arial Black', color='black'), showarrow = False)
+    donut_chart.update(layout_showlegend=False)
+    donut_chart.update_layout(margin=dict(l=10, r=10, t=10, b=10,pad=4), autosize=True, height = 150)
+
+    return donut_chart
+
 def round_up_2_decimals(n):
     multiplier = 10 ** 2 # 2 = amount of decimals to round to
     return np.ceil(n * multiplier) / multiplier
@@ -388,64 +592,23 @@ def round_up(n, decimals):
     multiplier = 10 ** decimals # 2 = amount of decimals to round to
     return np.ceil(n * multiplier) / multiplier
 
-def generate_vStorage_overview_df(df_vPartition_filtered, df_vDisk_filtered, df_vmList_filtered, df_vSnapshot_filtered):
+# Generate vStorage results
+def generate_vStorage_result(df_vPartition_filtered, df_vDisk_filtered, df_vmList_filtered, df_vSnapshot_filtered):
     
     df_vPartition_filtered_on = df_vPartition_filtered.query("`Power State`=='poweredOn'")
     df_vPartition_filtered_off = df_vPartition_filtered.query("`Power State`=='poweredOff'")
-
-    vPartition_amount_vms = str(df_vPartition_filtered['MOID'].nunique())
-    vPartition_amount_on = str(df_vPartition_filtered_on.shape[0])
-    vPartition_amount_off = str(df_vPartition_filtered_off.shape[0])
-    vPartition_amount_total = str(df_vPartition_filtered.shape[0])
-    vPartition_capacity_on = str(round_up_2_decimals(df_vPartition_filtered_on['Capacity (GiB)'].sum() / 1024))+" TiB"
-    vPartition_capacity_off = str(round_up_2_decimals(df_vPartition_filtered_off['Capacity (GiB)'].sum() / 1024))+" TiB"
-    vPartition_capacity_total = str(round_up_2_decimals(df_vPartition_filtered['Capacity (GiB)'].sum() / 1024))+" TiB"
-    vPartition_capacity_consumed_on = str(round_up_2_decimals(df_vPartition_filtered_on['Consumed (GiB)'].sum() / 1024))+" TiB"
-    vPartition_capacity_consumed_off = str(round_up_2_decimals(df_vPartition_filtered_off['Consumed (GiB)'].sum() / 1024))+" TiB"
-    vPartition_capacity_consumed_total = str(round_up_2_decimals(df_vPartition_filtered['Consumed (GiB)'].sum() / 1024))+" TiB"
-    vPartition_first_column_df = {'': [
-            "Anzahl VMs mit vPartitions", "Anzahl vPartition - On", "Anzahl vPartition - Off", "Anzahl vPartition - Gesamt",
-            "Capacity consumed (On)", "Capacity consumed (Off)", "Capacity consumed (Total)",
-            "Capacity provisioned (On)", "Capacity provisioned (Off)", "Capacity provisioned (Total)"            
-        ]}
-    vPartition_df = pd.DataFrame(vPartition_first_column_df)
-    vPartition_df = vPartition_df.astype(str)
-    vPartition_second_column_df = [
-            vPartition_amount_vms, vPartition_amount_on, vPartition_amount_off, vPartition_amount_total,            
-            vPartition_capacity_consumed_on, vPartition_capacity_consumed_off, vPartition_capacity_consumed_total,
-            vPartition_capacity_on, vPartition_capacity_off, vPartition_capacity_total
-        ]
-    vPartition_df.loc[:,'Werte'] = vPartition_second_column_df
     
     df_vDisk_filtered_on = df_vDisk_filtered.query("`Power State`=='poweredOn'")
     df_vDisk_filtered_off = df_vDisk_filtered.query("`Power State`=='poweredOff'")
     df_vDisk_filtered_on_thin = df_vDisk_filtered_on.query("`Thin Provisioned`==True")
     df_vDisk_filtered_off_thin = df_vDisk_filtered_off.query("`Thin Provisioned`==True")
     df_vDisk_filtered_total_thin = df_vDisk_filtered.query("`Thin Provisioned`==True")
-    vDisk_amount_vms = str(df_vDisk_filtered['MOID'].nunique())
-    vDisk_amount_on = str(df_vDisk_filtered_on.shape[0])+" ("+str(df_vDisk_filtered_on_thin.shape[0])+" Thin)"
-    vDisk_amount_off = str(df_vDisk_filtered_off.shape[0])+" ("+str(df_vDisk_filtered_off_thin.shape[0])+" Thin)"
-    vDisk_amount_total = str(df_vDisk_filtered.shape[0])+" ("+str(df_vDisk_filtered_total_thin.shape[0])+" Thin)"
-    vDisk_capacity_on = str(round_up_2_decimals(df_vDisk_filtered_on['Capacity (GiB)'].sum() / 1024))+" TiB"
-    vDisk_capacity_off = str(round_up_2_decimals(df_vDisk_filtered_off['Capacity (GiB)'].sum() / 1024))+" TiB"
-    vDisk_capacity_total = str(round_up_2_decimals(df_vDisk_filtered['Capacity (GiB)'].sum() / 1024))+" TiB"
-    vDisk_first_column_df = {'': [
-            "Anzahl VMs mit vDisks", "Anzahl vDisk - On", "Anzahl vDisk - Off", "Anzahl vDisk - Gesamt",
-            "Capacity (On)", "Capacity (Off)", "Capacity (Gesamt)"
-        ]}
-    vDisk_df = pd.DataFrame(vDisk_first_column_df)
-    vDisk_second_column_df = [
-            vDisk_amount_vms, vDisk_amount_on, vDisk_amount_off, vDisk_amount_total,
-            vDisk_capacity_on, vDisk_capacity_off, vDisk_capacity_total
-        ]
-    vDisk_df.loc[:,'Werte'] = vDisk_second_column_df
     
     vDisk_for_VMs_not_in_vPartition = pd.merge(df_vDisk_filtered[['VM Name','Capacity (GiB)','Power State','MOID']],df_vPartition_filtered[['MOID']],on='MOID', how='left', indicator=True).query("`_merge`=='left_only'").drop("_merge", axis=1)
     vDisk_for_VMs_not_in_vPartition_filtered_on = vDisk_for_VMs_not_in_vPartition.query("`Power State`=='poweredOn'")
     vDisk_for_VMs_not_in_vPartition_filtered_on_value = round_up_2_decimals(vDisk_for_VMs_not_in_vPartition_filtered_on['Capacity (GiB)'].sum() / 1024)
     vDisk_for_VMs_not_in_vPartition_filtered_off = vDisk_for_VMs_not_in_vPartition.query("`Power State`=='poweredOff'")
     vDisk_for_VMs_not_in_vPartition_filtered_off_value = round_up_2_decimals(vDisk_for_VMs_not_in_vPartition_filtered_off['Capacity (GiB)'].sum() / 1024)
-      
     vDisk_for_VMs_not_in_vPartition_filtered_total_value = round_up_2_decimals(vDisk_for_VMs_not_in_vPartition['Capacity (GiB)'].sum() / 1024)
     
     df_vmList_filtered_on = df_vmList_filtered.query("`Power State`=='poweredOn'")
@@ -454,21 +617,87 @@ def generate_vStorage_overview_df(df_vPartition_filtered, df_vDisk_filtered, df_
     df_vmList_filtered_off_thin = df_vmList_filtered_off.query("`Thin Provisioned`==True")
     df_vmList_filtered_total_thin = df_vmList_filtered.query("`Thin Provisioned`==True")
 
-    vmList_amount_on = str(df_vmList_filtered_on.shape[0])+" ("+str(df_vmList_filtered_on_thin.shape[0])+" Thin)"
-    vmList_amount_off = str(df_vmList_filtered_off.shape[0])+" ("+str(df_vmList_filtered_off_thin.shape[0])+" Thin)"
-    vmList_amount_total = str(df_vmList_filtered.shape[0])+" ("+str(df_vmList_filtered_total_thin.shape[0])+" Thin)"
-
-
-    vmList_capacity_on = str(round_up_2_decimals((df_vmList_filtered_on['Capacity (GiB)'].sum() / 1024) + vDisk_for_VMs_not_in_vPartition_filtered_on_value))+" TiB"
-    vmList_capacity_off = str(round_up_2_decimals((df_vmList_filtered_off['Capacity (GiB)'].sum() / 1024) + vDisk_for_VMs_not_in_vPartition_filtered_off_value))+" TiB"
-    vmList_capacity_total = str(round_up_2_decimals((df_vmList_filtered['Capacity (GiB)'].sum() / 1024) + vDisk_for_VMs_not_in_vPartition_filtered_total_value))+" TiB"
-
+    # For VMs without vPartition data 80% of the vDisk capacity is assumed as consumed
     vDisk_for_VMs_not_in_vPartition_filtered_on_value_80 = vDisk_for_VMs_not_in_vPartition_filtered_on_value * 0.8
     vDisk_for_VMs_not_in_vPartition_filtered_off_value_80 = vDisk_for_VMs_not_in_vPartition_filtered_off_value * 0.8
     vDisk_for_VMs_not_in_vPartition_filtered_total_value_80 = vDisk_for_VMs_not_in_vPartition_filtered_total_value * 0.8
-    vmList_consumed_on = str(round_up_2_decimals((df_vmList_filtered_on['Consumed (GiB)'].sum() / 1024)+(vDisk_for_VMs_not_in_vPartition_filtered_on_value_80)))+" TiB"
-    vmList_consumed_off = str(round_up_2_decimals((df_vmList_filtered_off['Consumed (GiB)'].sum() / 1024)+(vDisk_for_VMs_not_in_vPartition_filtered_off_value_80)))+" TiB"
-    vmList_consumed_total = str(round_up_2_decimals((df_vmList_filtered['Consumed (GiB)'].sum() / 1024)+(vDisk_for_VMs_not_in_vPartition_filtered_total_value_80)))+" TiB"
+
+    return vStorageResult(
+        vPartition_vms = int(df_vPartition_filtered['MOID'].nunique()),
+        vPartition_on = count_rows(df_vPartition_filtered_on),
+        vPartition_off = count_rows(df_vPartition_filtered_off),
+        vPartition_total = count_rows(df_vPartition_filtered),
+        vPartition_consumed_on = float(round_up_2_decimals(df_vPartition_filtered_on['Consumed (GiB)'].sum() / 1024)),
+        vPartition_consumed_off = float(round_up_2_decimals(df_vPartition_filtered_off['Consumed (GiB)'].sum() / 1024)),
+        vPartition_consumed_total = float(round_up_2_decimals(df_vPartition_filtered['Consumed (GiB)'].sum() / 1024)),
+        vPartition_capacity_on = float(round_up_2_decimals(df_vPartition_filtered_on['Capacity (GiB)'].sum() / 1024)),
+        vPartition_capacity_off = float(round_up_2_decimals(df_vPartition_filtered_off['Capacity (GiB)'].sum() / 1024)),
+        vPartition_capacity_total = float(round_up_2_decimals(df_vPartition_filtered['Capacity (GiB)'].sum() / 1024)),
+        vDisk_vms = int(df_vDisk_filtered['MOID'].nunique()),
+        vDisk_on = count_rows(df_vDisk_filtered_on),
+        vDisk_on_thin = count_rows(df_vDisk_filtered_on_thin),
+        vDisk_off = count_rows(df_vDisk_filtered_off),
+        vDisk_off_thin = count_rows(df_vDisk_filtered_off_thin),
+        vDisk_total = count_rows(df_vDisk_filtered),
+        vDisk_total_thin = count_rows(df_vDisk_filtered_total_thin),
+        vDisk_capacity_on = float(round_up_2_decimals(df_vDisk_filtered_on['Capacity (GiB)'].sum() / 1024)),
+        vDisk_capacity_off = float(round_up_2_decimals(df_vDisk_filtered_off['Capacity (GiB)'].sum() / 1024)),
+        vDisk_capacity_total = float(round_up_2_decimals(df_vDisk_filtered['Capacity (GiB)'].sum() / 1024)),
+        vmList_on = int(df_vmList_filtered_on.shape[0]),
+        vmList_on_thin = int(df_vmList_filtered_on_thin.shape[0]),
+        vmList_off = int(df_vmList_filtered_off.shape[0]),
+        vmList_off_thin = int(df_vmList_filtered_off_thin.shape[0]),
+        vmList_total = int(df_vmList_filtered.shape[0]),
+        vmList_total_thin = int(df_vmList_filtered_total_thin.shape[0]),
+        vmList_consumed_on = float(round_up_2_decimals((df_vmList_filtered_on['Consumed (GiB)'].sum() / 1024)+(vDisk_for_VMs_not_in_vPartition_filtered_on_value_80))),
+        vmList_consumed_off = float(round_up_2_decimals((df_vmList_filtered_off['Consumed (GiB)'].sum() / 1024)+(vDisk_for_VMs_not_in_vPartition_filtered_off_value_80))),
+        vmList_consumed_total = float(round_up_2_decimals((df_vmList_filtered['Consumed (GiB)'].sum() / 1024)+(vDisk_for_VMs_not_in_vPartition_filtered_total_value_80))),
+        vmList_capacity_on = float(round_up_2_decimals((df_vmList_filtered_on['Capacity (GiB)'].sum() / 1024) + vDisk_for_VMs_not_in_vPartition_filtered_on_value)),
+        vmList_capacity_off = float(round_up_2_decimals((df_vmList_filtered_off['Capacity (GiB)'].sum() / 1024) + vDisk_for_VMs_not_in_vPartition_filtered_off_value)),
+        vmList_capacity_total = float(round_up_2_decimals((df_vmList_filtered['Capacity (GiB)'].sum() / 1024) + vDisk_for_VMs_not_in_vPartition_filtered_total_value)),
+        vSnapshot_vms = int(df_vSnapshot_filtered['MOID'].nunique()),
+        vSnapshot_amount = int(df_vSnapshot_filtered.shape[0]),
+        vSnapshot_size = float(round_up_2_decimals(df_vSnapshot_filtered['Size (GiB)'].sum() / 1024))
+    )
+
+# Format a TiB value for tables
+def format_TiB(value):
+    return str(value)+" TiB"
+
+# Format an amount including the amount of thin provisioned items for tables
+def format_amount_thin(amount, amount_thin):
+    return str(amount)+" ("+str(amount_thin)+" Thin)"
+
+# Generate vStorage overview tables from vStorage results
+def generate_vStorage_overview_df(vStorage_result):
+
+    vPartition_first_column_df = {'': [
+            "Anzahl VMs mit vPartitions", "Anzahl vPartition - On", "Anzahl vPartition - Off", "Anzahl vPartition - Gesamt",
+            "Capacity consumed (On)", "Capacity consumed (Off)", "Capacity consumed (Total)",
+            "Capacity provisioned (On)", "Capacity provisioned (Off)", "Capacity provisioned (Total)"            
+        ]}
+    vPartition_df = pd.DataFrame(vPartition_first_column_df)
+    vPartition_df = vPartition_df.astype(str)
+    vPartition_second_column_df = [
+            str(vStorage_result.vPartition_vms), str(vStorage_result.vPartition_on), str(vStorage_result.vPartition_off), str(vStorage_result.vPartition_total),
+            format_TiB(vStorage_result.vPartition_consumed_on), format_TiB(vStorage_result.vPartition_consumed_off), format_TiB(vStorage_result.vPartition_consumed_total),
+            format_TiB(vStorage_result.vPartition_capacity_on), format_TiB(vStorage_result.vPartition_capacity_off), format_TiB(vStorage_result.vPartition_capacity_total)
+        ]
+    vPartition_df.loc[:,'Werte'] = vPartition_second_column_df
+    
+    vDisk_first_column_df = {'': [
+            "Anzahl VMs mit vDisks", "Anzahl vDisk - On", "Anzahl vDisk - Off", "Anzahl vDisk - Gesamt",
+            "Capacity (On)", "Capacity (Off)", "Capacity (Gesamt)"
+        ]}
+    vDisk_df = pd.DataFrame(vDisk_first_column_df)
+    vDisk_second_column_df = [
+            str(vStorage_result.vDisk_vms),
+            format_amount_thin(vStorage_result.vDisk_on, vStorage_result.vDisk_on_thin),
+            format_amount_thin(vStorage_result.vDisk_off, vStorage_result.vDisk_off_thin),
+            format_amount_thin(vStorage_result.vDisk_total, vStorage_result.vDisk_total_thin),
+            format_TiB(vStorage_result.vDisk_capacity_on), format_TiB(vStorage_result.vDisk_capacity_off), format_TiB(vStorage_result.vDisk_capacity_total)
+        ]
+    vDisk_df.loc[:,'Werte'] = vDisk_second_column_df
 
     vmList_first_column_df = {'VMs': [
             "Anzahl VMs - On", "Anzahl VMs - Off", "Anzahl VMs - Gesamt",
@@ -477,36 +706,29 @@ def generate_vStorage_overview_df(df_vPartition_filtered, df_vDisk_filtered, df_
         ]}
     vmList_df = pd.DataFrame(vmList_first_column_df)
     vmList_second_column_df = [
-            vmList_amount_on, vmList_amount_off, vmList_amount_total,
-            vmList_consumed_on, vmList_consumed_off, vmList_consumed_total,
-            vmList_capacity_on, vmList_capacity_off, vmList_capacity_total            
+            format_amount_thin(vStorage_result.vmList_on, vStorage_result.vmList_on_thin),
+            format_amount_thin(vStorage_result.vmList_off, vStorage_result.vmList_off_thin),
+            format_amount_thin(vStorage_result.vmList_total, vStorage_result.vmList_total_thin),
+            format_TiB(vStorage_result.vmList_consumed_on), format_TiB(vStorage_result.vmList_consumed_off), format_TiB(vStorage_result.vmList_consumed_total),
+            format_TiB(vStorage_result.vmList_capacity_on), format_TiB(vStorage_result.vmList_capacity_off), format_TiB(vStorage_result.vmList_capacity_total)
         ]
     vmList_df.loc[:,'Werte'] = vmList_second_column_df 
 
-    vSnapshot_from_vms = str(df_vSnapshot_filtered['MOID'].nunique())
-    vSnapshot_amount = str(df_vSnapshot_filtered.shape[0])    
-    vSnapshot_size = str(round_up_2_decimals(df_vSnapshot_filtered['Size (GiB)'].sum() / 1024))+" TiB"
-
     vSnapshot_first_column_df = {'': [
             "Anzahl VMs mit vSnapshots", "Anzahl vSnapshots", "vSnapshot Kapazität"
         ]}
     vSnapshot_df = pd.DataFrame(vSnapshot_first_column_df)
-    vSnapshot_second_column_df = [vSnapshot_from_vms, vSnapshot_amount, vSnapshot_size]
+    vSnapshot_second_column_df = [str(vStorage_result.vSnapshot_vms), str(vStorage_result.vSnapshot_amount), format_TiB(vStorage_result.vSnapshot_size)]
     vSnapshot_df.loc[:,'Werte'] = vSnapshot_second_column_df 
 
-
     return vPartition_df, vDisk_df, vmList_df, vSnapshot_df
 
 # Generate vStorage Chart Diagram
-@st.cache
-def generate_storage_charts(vmList_df):
-    
-    vm_capacity_provisioned_overall = float(vmList_df.iloc[8]['Werte'].strip(' TiB'))
-    vm_capacity_consumed_overall = float(vmList_df.iloc[5]['Werte'].strip(' TiB'))
+def generate_storage_charts(vStorage_result):
 
     type_first_column = {'Type': ["Provisioned", "Consumed"]}
     storage_df = pd.DataFrame(type_first_column)
-    values_second_column = [vm_capacity_provisioned_overall, vm_capacity_consumed_overall]
+    values_second_column = [vStorage_result.vmList_capacity_total, vStorage_result.vmList_consumed_total]
 
     storage_df.loc[:,'Werte'] = values_second_column 
 
@@ -522,71 +744,45 @@ def generate_storage_charts(vmList_df):
 
     return storage_chart, storage_chart_config
 
-# Calculate vCPU Sizing Results
-def calculate_sizing_result_vCPU(vCPU_provisioned_df, vCPU_overview_df):
-
-    if st.session_state['vCPU_selectbox'] == 'On VMs - 95th Percentile vCPUs *':
-        vCPU_value = vCPU_overview_df.data.loc[4].values[1]
-    elif st.session_state['vCPU_selectbox'] == 'On VMs - Peak vCPUs':
-        vCPU_value = vCPU_overview_df.data.loc[1].values[1]
-    elif st.session_state['vCPU_selectbox'] == 'On VMs - Provisioned vCPUs':
-        vCPU_value = vCPU_overview_df.data.loc[0].values[1]
-    elif st.session_state['vCPU_selectbox'] == 'On und Off VMs - Provisioned vCPUs':
-        vCPU_value = vCPU_provisioned_df.data.loc[2].values[1]
-    elif st.session_state['vCPU_selectbox'] == 'On VMs - Average vCPUs':
-        vCPU_value = vCPU_overview_df.data.loc[2].values[1]
-    elif st.session_state['vCPU_selectbox'] == 'On VMs - Median vCPUs':
-        vCPU_value = vCPU_overview_df.data.loc[3].values[1]
+# Store Sizing values (basis, final value incl. growth, growth) as result strings in the session state
+def set_sizing_result(sizing_type, sizing_values):
+
+    sizing_value, sizing_value_calc, sizing_value_diff = sizing_values
+
+    st.session_state[sizing_type+'_basis'] = str(sizing_value)
+    st.session_state[sizing_type+'_final'] = str(sizing_value_calc)
+    st.session_state[sizing_type+'_growth'] = str(sizing_value_diff)
+
+# Calculate vCPU Sizing values (basis, final value incl. growth, growth) for a sizing option & growth in %
+def calculate_sizing_values_vCPU(vCPU_result, sizing_option, growth):
+
+    vCPU_value = getattr(vCPU_result, vCPU_sizing_options[sizing_option])
 
     # Roundup both values and convert to int
     vCPU_value = int(np.ceil(vCPU_value))
-    vCPU_value_calc = int(np.ceil(vCPU_value*(1+(int(st.session_state['vCPU_slider'])/100))))
-
-    st.session_state['vCPU_basis'] = str(vCPU_value)
-    st.session_state['vCPU_final'] = str(vCPU_value_calc)
-    st.session_state['vCPU_growth'] = str(vCPU_value_calc-vCPU_value)
-
-# Calculate vRAM Sizing Results
-def calculate_sizing_result_vRAM(vRAM_provisioned_df, vMemory_overview_df):
-
-    if st.session_state['vRAM_selectbox'] == 'On VMs - Provisioned vMemory *':
-        vRAM_value = vRAM_provisioned_df.data.loc[0].values[1]
-    elif st.session_state['vRAM_selectbox'] == 'On und Off VMs - Provisioned vMemory':
-        vRAM_value = vRAM_provisioned_df.data.loc[2].values[1]
-    elif st.session_state['vRAM_selectbox'] == 'On VMs - Peak vMemory':
-        vRAM_value = vMemory_overview_df.data.loc[1].values[1]
-    elif st.session_state['vRAM_selectbox'] == 'On VMs - 95th Percentile vMemory':
-        vRAM_value = vMemory_overview_df.data.loc[4].values[1]
-    elif st.session_state['vRAM_selectbox'] == 'On VMs - Average vMemory':
-        vRAM_value = vMemory_overview_df.data.loc[2].values[1]
-    elif st.session_state['vRAM_selectbox'] == 'On VMs - Median vMemory':
-        vRAM_value = vMemory_overview_df.data.loc[3].values[1]
+    vCPU_value_calc = int(np.ceil(vCPU_value*(1+(int(growth)/100))))
+
+    return vCPU_value, vCPU_value_calc, vCPU_value_calc-vCPU_value
+
+# Calculate vRAM Sizing values (basis, final value incl. growth, growth) for a sizing option & growth in %
+def calculate_sizing_values_vRAM(vRAM_result, sizing_option, growth):
+
+    vRAM_value = getattr(vRAM_result, vRAM_sizing_options[sizing_option])
 
     vRAM_value = round_up_2_decimals(vRAM_value)
-    vRAM_value_calc = int(np.ceil(vRAM_value*(1+(int(st.session_state['vRAM_slider'])/100))))
+    vRAM_value_calc = int(np.ceil(vRAM_value*(1+(int(growth)/100))))
     vRAM_value_diff = round((vRAM_value_calc-vRAM_value),2)
 
-    st.session_state['vRAM_basis'] = str(vRAM_value)
-    st.session_state['vRAM_final'] = str(vRAM_value_calc)
-    st.session_state['vRAM_growth'] = str(vRAM_value_diff)
+    return vRAM_value, vRAM_value_calc, vRAM_value_diff
 
-# Calculate vStorage Sizing Results
-def calculate_sizing_result_vStorage(vmList_df):
+# Calculate vStorage Sizing values (basis, final value incl. growth, growth) for a sizing option & growth in %
+def calculate_sizing_values_vStorage(vStorage_result, sizing_option, growth):
 
-    if st.session_state['vStorage_selectbox'] == 'On und Off VMs - Consumed VM Storage *':
-        vStorage_value = float(vmList_df.iloc[5]['Werte'].strip(' TiB'))
-    elif st.session_state['vStorage_selectbox'] == 'On VMs - Consumed VM Storage':
-        vStorage_value = float(vmList_df.iloc[3]['Werte'].strip(' TiB'))
-    elif st.session_state['vStorage_selectbox'] == 'On und Off VMs - Provisioned VM Storage':
-        vStorage_value = float(vmList_df.iloc[8]['Werte'].strip(' TiB'))
-    elif st.session_state['vStorage_selectbox'] == 'On VMs - Provisioned VM Storage':
-        vStorage_value = float(vmList_df.iloc[6]['Werte'].strip(' TiB'))
+    vStorage_value = getattr(vStorage_result, vStorage_sizing_options[sizing_option])
 
     # Roundup values and convert to int
     vStorage_value = round_up_2_decimals(vStorage_value)
-    vStorage_value_calc = int(np.ceil(vStorage_value*(1+(int(st.session_state['vStorage_slider'])/100))))
+    vStorage_value_calc = int(np.ceil(vStorage_value*(1+(int(growth)/100))))
     vStorage_value_diff = round((vStorage_value_calc-vStorage_value),2)
 
-    st.session_state['vStorage_basis'] = str(vStorage_value)
-    st.session_state['vStorage_final'] = str(vStorage_value_calc)
-    st.session_state['vStorage_growth'] = str(vStorage_value_diff)
+    return vStorage_value, vStorage_value_calc, vStorage_value_diff
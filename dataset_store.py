@@ -0,0 +1,338 @@
+import os
+import sys
+import json
+import time
+import uuid
+import fcntl
+import shutil
+import hashlib
+import tempfile
+import threading
+from io import BytesIO
+from contextlib import contextmanager
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import custom_functions
+
+######################
+# Initialize variables
+######################
+# Parsed collector exports are stored once as uncompressed Arrow IPC files (one per tab) and opened
+# memory-mapped by every Streamlit session and by the batch tooling. The OS page cache shares the
+# mapped pages across sessions and processes, numeric columns are used zero-copy from the mapping.
+dataset_store_dir = os.environ.get('NTNX_DATASET_STORE', os.path.join(tempfile.gettempdir(), 'ntnx_collector_datasets'))
+dataset_names = ['vInfo', 'vCPU', 'vMemory', 'vHosts', 'vCluster', 'vPartition', 'vmList', 'vDisk', 'vSnapshot'] # same order as get_data_from_excel
+# Datasets are stored in two stages: the headline tabs (vCluster overview) first, the detail tabs afterwards.
+# Same order as get_headline_data_from_excel / get_detail_data_from_excel.
+headline_dataset_names = ['vInfo', 'vHosts', 'vCluster', 'vPartition']
+detail_dataset_names = ['vCPU', 'vMemory', 'vmList', 'vDisk', 'vSnapshot']
+lease_ttl_seconds = 60 * 60 # leases not refreshed within this time are treated as released (e.g. closed browser tab)
+unused_grace_seconds = 60 # unused datasets are kept a short time, e.g. between storing and acquiring
+max_opened_datasets = int(os.environ.get('NTNX_MAX_OPENED_DATASETS', '8')) # per process, least recently used ones are closed
+
+# Datasets opened by this process (least recently used first): dataset_id -> {'frames': {dataset_name: df}, 'cluster_index': {dataset_name: {...}}}.
+# Closed datasets stay mapped until their frames are not referenced anymore (e.g. by the recompute graph of a session).
+opened_datasets = OrderedDict()
+opened_datasets_lock = threading.Lock()
+
+# Cache hits / misses of this process: cache name -> {'hits': ..., 'misses': ...}. If NTNX_CACHE_STATS_FILE is set the
+# app writes them (together with its own caches) to that file after every run, e.g. for load_test.py
+cache_stats_path = os.environ.get('NTNX_CACHE_STATS_FILE') or None
+cache_stats = {}
+cache_stats_lock = threading.Lock()
+
+######################
+# Custom Functions
+######################
+# Count a cache hit / miss
+def count_cache_access(cache_name, hit):
+    with cache_stats_lock:
+        counter = cache_stats.setdefault(cache_name, {'hits': 0, 'misses': 0})
+        counter['hits' if hit else 'misses'] += 1
+
+# Write the cache statistics of this process (incl. further caches given as name -> functools lru_cache info) to cache_stats_path
+def write_cache_stats(cache_infos={}):
+
+    if cache_stats_path is None:
+        return
+
+    with cache_stats_lock:
+        stats = {cache_name: dict(counter) for cache_name, counter in cache_stats.items()}
+    for cache_name, cache_info in cache_infos.items():
+        stats[cache_name] = {'hits': cache_info.hits, 'misses': cache_info.misses}
+
+    # Written to a temporary file and renamed, readers never see partial files (sessions write concurrently)
+    file_descriptor, temp_path = tempfile.mkstemp(prefix='.cache-stats-', dir=os.path.dirname(os.path.abspath(cache_stats_path)))
+    with os.fdopen(file_descriptor, 'w') as f:
+        json.dump({'pid': os.getpid(), 'time': time.time(), 'caches': stats}, f)
+    os.replace(temp_path, cache_stats_path)
+
+# Get the directory of a dataset
+def get_dataset_dir(dataset_id):
+    return os.path.join(dataset_store_dir, dataset_id)
+
+# Get the dataset id (content hash) of an uploaded file, a file path or raw bytes
+def get_dataset_id(file_bytes):
+    return hashlib.sha256(file_bytes).hexdigest()[:32]
+
+# Read raw bytes from an uploaded file, a file path or bytes
+def read_file_bytes(uploaded_file):
+    if isinstance(uploaded_file, (bytes, bytearray)):
+        return bytes(uploaded_file)
+    if isinstance(uploaded_file, (str, os.PathLike)):
+        with open(uploaded_file, 'rb') as f:
+            return f.read()
+    if hasattr(uploaded_file, 'getvalue'):
+        return uploaded_file.getvalue()
+    uploaded_file.seek(0)
+    return uploaded_file.read()
+
+# Convert a dataframe to an Arrow table, numeric NaN values are kept as NaN (no null bitmap) so
+# those columns can be converted back to pandas without copying
+def dataframe_to_arrow(df):
+    arrays = []
+    for column in df.columns:
+        values = df[column]
+        if values.dtype.kind in 'iuf':
+            arrays.append(pa.array(values.to_numpy(), from_pandas=False))
+        else:
+            if pd.api.types.infer_dtype(values, skipna=True).startswith('mixed'):
+                values = values.where(values.isna(), values.astype(str)) # e.g. numeric VM names mixed with strings
+            arrays.append(pa.array(values, from_pandas=True))
+    return pa.Table.from_arrays(arrays, names=[str(column) for column in df.columns])
+
+# Write an Arrow table as uncompressed IPC file (required for zero-copy memory mapping)
+def write_arrow_file(table, path):
+    with pa.OSFile(path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+# Read an Arrow IPC file memory-mapped and convert it to a dataframe
+def read_arrow_file(path):
+    with pa.memory_map(path, 'r') as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas(split_blocks=True)
+
+# Get the lock file of a dataset (next to the dataset directory, it exists before the dataset is stored)
+def get_dataset_lock_path(dataset_id):
+    return os.path.join(dataset_store_dir, '.'+dataset_id+'.lock')
+
+# Lock a dataset across threads & processes while one of its stages is parsed, other sessions / processes
+# storing the same export wait and reuse the result instead of parsing it in parallel.
+# Non-blocking it yields False (without lock) if the dataset is locked by someone else, otherwise True.
+@contextmanager
+def lock_dataset(dataset_id, blocking=True):
+    os.makedirs(dataset_store_dir, exist_ok=True)
+    lock_path = get_dataset_lock_path(dataset_id)
+    lock_file = None
+    while lock_file is None:
+        lock_file = open(lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            break
+        # cleanup_datasets removes the lock file while holding the lock, a lock file removed while waiting for it
+        # doesn't exclude anyone anymore -> lock the current one
+        try:
+            if os.fstat(lock_file.fileno()).st_ino == os.stat(lock_path).st_ino:
+                break
+        except FileNotFoundError:
+            pass
+        lock_file.close()
+        lock_file = None
+
+    if lock_file.closed:
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+# Count the active leases of a dataset and remove expired ones
+def count_active_leases(lease_dir, lease_ttl):
+
+    active_leases = 0
+    now = time.time()
+    for lease in os.listdir(lease_dir):
+        lease_path = os.path.join(lease_dir, lease)
+        try:
+            if now - os.path.getmtime(lease_path) > lease_ttl:
+                os.remove(lease_path)
+            else:
+                active_leases += 1
+        except FileNotFoundError:
+            pass
+
+    return active_leases
+
+# Check if the detail stage of a dataset is stored as well
+def is_dataset_complete(dataset_id):
+    dataset_dir = get_dataset_dir(dataset_id)
+    return all(os.path.exists(os.path.join(dataset_dir, dataset_name+'.arrow')) for dataset_name in detail_dataset_names)
+
+# Parse the headline tabs of an uploaded collector export once and store them in the dataset store, returns the dataset id.
+# The detail tabs are added afterwards by store_detail_datasets.
+def store_headline_datasets(uploaded_file):
+
+    file_bytes = read_file_bytes(uploaded_file)
+    dataset_id = get_dataset_id(file_bytes)
+    dataset_dir = get_dataset_dir(dataset_id)
+
+    with lock_dataset(dataset_id):
+        count_cache_access('store_headline_datasets', os.path.isdir(dataset_dir))
+        if not os.path.isdir(dataset_dir):
+            frames = custom_functions.get_headline_data_from_excel(pd.ExcelFile(BytesIO(file_bytes), engine="openpyxl"))
+
+            # Write into a temporary directory and rename it, so readers without lock never see partial datasets
+            temp_dir = tempfile.mkdtemp(prefix='.'+dataset_id+'-', dir=dataset_store_dir)
+            for dataset_name, df in zip(headline_dataset_names, frames):
+                write_arrow_file(dataframe_to_arrow(df), os.path.join(temp_dir, dataset_name+'.arrow'))
+            os.makedirs(os.path.join(temp_dir, 'leases'))
+            try:
+                os.rename(temp_dir, dataset_dir)
+            except OSError: # stored concurrently (e.g. dataset store shared by hosts without working file locks)
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return dataset_id
+
+# Parse the detail tabs of an uploaded collector export and add them to its (headline) dataset
+def store_detail_datasets(uploaded_file, dataset_id):
+
+    with lock_dataset(dataset_id):
+        dataset_complete = is_dataset_complete(dataset_id)
+        count_cache_access('store_detail_datasets', dataset_complete)
+        if dataset_complete:
+            return dataset_id
+
+        dataset_dir = get_dataset_dir(dataset_id)
+        df_vInfo = open_datasets(dataset_id, ['vInfo'])[0]
+        frames = custom_functions.get_detail_data_from_excel(pd.ExcelFile(BytesIO(read_file_bytes(uploaded_file)), engine="openpyxl"), df_vInfo)
+
+        # Write into a temporary directory and move the files, the dataset counts as complete once all detail files are moved
+        temp_dir = tempfile.mkdtemp(prefix='.details-', dir=dataset_dir)
+        try:
+            for dataset_name, df in zip(detail_dataset_names, frames):
+                write_arrow_file(dataframe_to_arrow(df), os.path.join(temp_dir, dataset_name+'.arrow'))
+            for dataset_name in detail_dataset_names:
+                os.replace(os.path.join(temp_dir, dataset_name+'.arrow'), os.path.join(dataset_dir, dataset_name+'.arrow'))
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return dataset_id
+
+# Parse an uploaded collector export once and store it completely in the dataset store, returns the dataset id
+def store_datasets(uploaded_file):
+    dataset_id = store_headline_datasets(uploaded_file)
+    return store_detail_datasets(uploaded_file, dataset_id)
+
+# Get positions of rows per cluster (rows without cluster name are not part of any cluster)
+def get_cluster_index(df):
+    return {cluster: np.asarray(positions) for cluster, positions in df.groupby('Cluster Name', sort=False).indices.items()}
+
+# Open tabs of a dataset memory-mapped (once per process), returns its opened_datasets entry
+def open_dataset(dataset_id, names):
+
+    with opened_datasets_lock:
+        opened_dataset = opened_datasets.setdefault(dataset_id, {'frames': {}, 'cluster_index': {}})
+        opened_datasets.move_to_end(dataset_id)
+        for dataset_name in names:
+            count_cache_access('open_datasets', dataset_name in opened_dataset['frames'])
+            if dataset_name not in opened_dataset['frames']:
+                df = read_arrow_file(os.path.join(get_dataset_dir(dataset_id), dataset_name+'.arrow'))
+                opened_dataset['frames'][dataset_name] = df
+                opened_dataset['cluster_index'][dataset_name] = get_cluster_index(df)
+        while len(opened_datasets) > max_opened_datasets:
+            opened_datasets.popitem(last=False)
+
+    return opened_dataset
+
+# Open dataframes of a dataset memory-mapped (once per process), by default all in the same order as get_data_from_excel
+def open_datasets(dataset_id, names=dataset_names):
+    opened_dataset = open_dataset(dataset_id, names)
+    return tuple(opened_dataset['frames'][dataset_name] for dataset_name in names)
+
+# Get the (sorted) cluster names of a dataset from the cluster index of its vInfo tab
+def get_dataset_clusters(dataset_id):
+    return sorted(open_dataset(dataset_id, ['vInfo'])['cluster_index']['vInfo'])
+
+# Select the rows of the selected clusters without copying where possible
+def filter_by_cluster(df, cluster_index, vCluster_selected):
+
+    positions = [cluster_index[cluster] for cluster in vCluster_selected if cluster in cluster_index]
+    if len(positions) == len(cluster_index) and sum(len(p) for p in positions) == df.shape[0]:
+        return df # all rows selected
+    if len(positions) == 0:
+        return df.iloc[0:0]
+
+    positions = np.sort(np.concatenate(positions))
+    if positions[-1] - positions[0] + 1 == len(positions):
+        return df.iloc[positions[0]:positions[-1]+1] # contiguous rows -> view
+    return df.take(positions)
+
+# Get dataframes of a dataset filtered by the selected clusters, by default all in the same order as get_data_from_excel
+def filter_datasets(dataset_id, vCluster_selected, names=dataset_names):
+
+    opened_dataset = open_dataset(dataset_id, names)
+
+    return tuple(filter_by_cluster(opened_dataset['frames'][dataset_name], opened_dataset['cluster_index'][dataset_name], vCluster_selected) for dataset_name in names)
+
+# Register (or refresh) the usage of a dataset by a session / process
+def acquire_dataset(dataset_id, session_id):
+    lease_path = os.path.join(get_dataset_dir(dataset_id), 'leases', session_id)
+    with open(lease_path, 'a'):
+        os.utime(lease_path)
+
+# Unregister the usage of a dataset by a session / process
+def release_dataset(dataset_id, session_id):
+    try:
+        os.remove(os.path.join(get_dataset_dir(dataset_id), 'leases', session_id))
+    except FileNotFoundError:
+        pass
+
+# Remove expired leases and all datasets which are not used by any session / process anymore
+def cleanup_datasets(lease_ttl=lease_ttl_seconds):
+
+    if not os.path.isdir(dataset_store_dir):
+        return []
+
+    removed_datasets = []
+    for dataset_id in os.listdir(dataset_store_dir):
+        lease_dir = os.path.join(get_dataset_dir(dataset_id), 'leases')
+        if dataset_id.startswith('.') or not os.path.isdir(lease_dir):
+            continue
+        if count_active_leases(lease_dir, lease_ttl) > 0 or time.time() - os.path.getmtime(lease_dir) <= unused_grace_seconds:
+            continue
+        # Removed under the dataset lock (datasets being stored are skipped) after checking the leases again,
+        # the lock file is removed while still locked (lock_dataset locks the new one then)
+        with lock_dataset(dataset_id, blocking=False) as locked:
+            if not locked or not os.path.isdir(lease_dir) or count_active_leases(lease_dir, lease_ttl) > 0:
+                continue
+            with opened_datasets_lock:
+                opened_datasets.pop(dataset_id, None)
+            shutil.rmtree(get_dataset_dir(dataset_id), ignore_errors=True)
+            os.remove(get_dataset_lock_path(dataset_id))
+            removed_datasets.append(dataset_id)
+
+    return removed_datasets
+
+# Batch usage:
+#   python dataset_store.py store <export.xlsx> [...]  -> store exports and print their dataset ids
+#   python dataset_store.py cleanup                     -> remove datasets without active leases
+if __name__ == '__main__':
+    if len(sys.argv) >= 3 and sys.argv[1] == 'store':
+        batch_session_id = 'batch-'+uuid.uuid4().hex
+        for file_path in sys.argv[2:]:
+            dataset_id = store_datasets(file_path)
+            acquire_dataset(dataset_id, batch_session_id)
+            print(dataset_id, file_path)
+    elif len(sys.argv) == 2 and sys.argv[1] == 'cleanup':
+        for dataset_id in cleanup_datasets():
+            print('removed', dataset_id)
+    else:
+        print('Usage: python dataset_store.py store <export.xlsx> [...] | cleanup')
+        sys.exit(1)
@@ -0,0 +1,107 @@
+from dataclasses import dataclass
+from functools import lru_cache
+import numpy as np
+import plotly.graph_objs as go
+import dataset_store
+
+######################
+# Initialize variables
+######################
+# Maximum amount of bins per axis, the browser receives at most grid_bins x grid_bins cells independent of the amount of VMs
+grid_bins = 40
+density_colorscale = [[0, '#BBE3F3'], [1, '#034EA2']]
+
+######################
+# Result models
+######################
+# Binned counts of a distribution, counts[y][x] as expected by a plotly heatmap (no labels & counts if there are no VMs to bin)
+@dataclass(frozen=True)
+class DensityGrid:
+    x_labels: tuple
+    y_labels: tuple
+    counts: np.ndarray
+
+    def is_empty(self):
+        return self.counts.size == 0
+
+empty_density_grid = DensityGrid(x_labels=(), y_labels=(), counts=np.zeros((0, 0), dtype=np.int64))
+
+######################
+# Custom Functions
+######################
+# Get bin edges: one bin per integer value for small integer ranges, otherwise grid_bins equal bins
+def get_bin_edges(max_value, integer_values):
+    if integer_values and max_value <= grid_bins:
+        return np.arange(0.5, max_value + 1.5)
+    return np.linspace(0, max(max_value, 1), grid_bins + 1)
+
+# Get bin labels (bin centers, rounded for non integer bins)
+def get_bin_labels(bin_edges):
+    return tuple(np.round((bin_edges[:-1] + bin_edges[1:]) / 2, 1).tolist())
+
+# Generate a 2D density grid of provisioned vs. used values, both axes use the same bins (VMs without values are skipped)
+def generate_density_grid(provisioned, used, integer_values):
+
+    provisioned = np.asarray(provisioned, dtype=np.float64)
+    used = np.asarray(used, dtype=np.float64)
+    valid = ~(np.isnan(provisioned) | np.isnan(used))
+    if not valid.any():
+        return empty_density_grid
+    provisioned, used = provisioned[valid], used[valid]
+
+    bin_edges = get_bin_edges(provisioned.max(), integer_values)
+    counts, _, _ = np.histogram2d(provisioned, used, bins=[bin_edges, bin_edges])
+    bin_labels = get_bin_labels(bin_edges)
+
+    return DensityGrid(x_labels=bin_labels, y_labels=bin_labels, counts=counts.T.astype(np.int64))
+
+# Generate a histogram of the provisioned storage per VM for each cluster (log scaled bins, storage spans several magnitudes).
+# VMs without cluster or capacity are skipped.
+def generate_storage_grid(df_vmList_filtered):
+
+    cluster_names = df_vmList_filtered['Cluster Name'].to_numpy()
+    capacity = df_vmList_filtered['Capacity (GiB)'].to_numpy(dtype=np.float64)
+    valid = df_vmList_filtered['Cluster Name'].notna().to_numpy() & ~np.isnan(capacity)
+    if not valid.any():
+        return empty_density_grid
+    cluster_names, capacity = cluster_names[valid], np.maximum(capacity[valid], 1)
+
+    clusters = np.sort(np.unique(cluster_names))
+    bin_edges = np.geomspace(1, max(capacity.max(), 2) * 1.0001, grid_bins + 1)
+    cluster_positions = np.searchsorted(clusters, cluster_names)
+    counts, _, _ = np.histogram2d(cluster_positions, capacity, bins=[np.arange(-0.5, len(clusters) + 0.5), bin_edges])
+    bin_labels = tuple(f"≤ {edge:,.0f} GiB" if edge >= 100 else f"≤ {edge:.3g} GiB" for edge in bin_edges[1:])
+
+    return DensityGrid(x_labels=bin_labels, y_labels=tuple(clusters.tolist()), counts=counts.astype(np.int64))
+
+# Generate all distribution grids for a dataset & cluster selection (cached per process)
+@lru_cache(maxsize=32)
+def generate_distribution_grids(dataset_id, vCluster_selected):
+
+    df_vInfo_filtered, df_vCPU_filtered, df_vMemory_filtered, df_vHosts_filtered, df_vCluster_filtered, df_vPartition_filtered, df_vmList_filtered, df_vDisk_filtered, df_vSnapshot_filtered = dataset_store.filter_datasets(dataset_id, list(vCluster_selected))
+    df_vCPU_filtered_on = df_vCPU_filtered.loc[df_vCPU_filtered['Power State'].to_numpy() == 'poweredOn']
+    df_vMemory_filtered_on = df_vMemory_filtered.loc[df_vMemory_filtered['Power State'].to_numpy() == 'poweredOn']
+
+    vCPU_grid = generate_density_grid(df_vCPU_filtered_on['vCPUs'], df_vCPU_filtered_on['95th Percentile #'], integer_values=True)
+    vRAM_grid = generate_density_grid(df_vMemory_filtered_on['Size (GiB)'], df_vMemory_filtered_on['95th Percentile #'], integer_values=False)
+    storage_grid = generate_storage_grid(df_vmList_filtered)
+
+    return vCPU_grid, vRAM_grid, storage_grid
+
+# Generate a heatmap chart from a density grid (empty cells are transparent)
+def generate_density_chart(density_grid, x_axis_name, y_axis_name, chart_height):
+
+    counts = np.where(density_grid.counts > 0, density_grid.counts, np.nan)
+    x_axis_type = 'category' if isinstance(density_grid.x_labels[0] if density_grid.x_labels else None, str) else '-'
+    y_axis_type = 'category' if isinstance(density_grid.y_labels[0] if density_grid.y_labels else None, str) else '-'
+
+    density_chart = go.Figure(data=go.Heatmap(
+        z=counts, x=list(density_grid.x_labels), y=list(density_grid.y_labels), colorscale=density_colorscale,
+        hoverongaps=False, hovertemplate=x_axis_name+': %{x}<br>'+y_axis_name+': %{y}<br>VMs: %{z}<extra></extra>'
+    ))
+    density_chart.update_layout(
+        margin=dict(l=10, r=10, t=10, b=10, pad=4), autosize=True, height=chart_height,
+        xaxis={'title': x_axis_name, 'type': x_axis_type}, yaxis={'title': y_axis_name, 'type': y_axis_type}
+    )
+
+    return density_chart
@@ -0,0 +1,430 @@
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.request
+import numpy as np
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.websocket import websocket_connect
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+import parity_check
+
+######################
+# Initialize variables
+######################
+# Simulates concurrent browser sessions against a local instance of app.py (started by the tool or already running).
+# Every session speaks the Streamlit websocket protocol like the browser: it uploads a collector workbook, then
+# toggles clusters in the vCluster multiselect and moves the sizing sliders. Reported are the rerun latencies per
+# interaction (percentiles), the RSS of the server process over time and the cache hit rates of the server process.
+#   python load_test.py [--sessions 8] [--interactions 20] [--vms 5000] [--clusters 8] [--workbooks 1] [--ramp-up 5]
+#   python load_test.py --url http://localhost:8501 [--server-pid <pid>] [--cache-stats-file <path>] [...]
+# A server started by the tool uses a fresh dataset store, so the first upload of every workbook is parsed.
+app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+default_sessions = 8
+default_interactions = 20
+think_time_seconds = (0.5, 2.0) # pause between the interactions of a session (uniform)
+rss_sample_interval_seconds = 0.5
+rss_timeline_points = 12 # RSS values printed in the report, all samples are part of the --json output
+rerun_timeout_seconds = 600
+server_start_timeout_seconds = 60
+max_message_bytes = 512 * 2**20 # forward messages with tables of large exports
+latency_percentiles = (50, 90, 95, 99)
+sizing_slider_keys = ('vCPU_slider', 'vRAM_slider', 'vStorage_slider')
+workbook_content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+######################
+# Custom Functions
+######################
+# Get a free local TCP port
+def get_free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+# Read the resident set size of a process in bytes (None if not available, e.g. not on Linux)
+def read_rss(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+# Sample the RSS of a process in a background thread until stop_event is set, appends (seconds, bytes) to samples
+def sample_rss(pid, samples, stop_event, start_time, interval=rss_sample_interval_seconds):
+    while not stop_event.is_set():
+        rss = read_rss(pid)
+        if rss is not None:
+            samples.append((time.perf_counter() - start_time, rss))
+        stop_event.wait(interval)
+
+# Read the cache statistics written by the app (see dataset_store.write_cache_stats), empty if not available
+def read_cache_stats(path):
+    try:
+        with open(path) as f:
+            return json.load(f)['caches']
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+
+# Get the cache hits / misses between two snapshots of the cache statistics
+def get_cache_stats_delta(before, after):
+    return {
+        cache_name: {key: counter[key] - before.get(cache_name, {}).get(key, 0) for key in ('hits', 'misses')}
+        for cache_name, counter in after.items()
+    }
+
+# Start app.py with streamlit in a subprocess and wait until it is healthy
+def start_server(port, env, log_file):
+
+    command = [
+        sys.executable, '-m', 'streamlit', 'run', app_path, '--server.headless', 'true', '--server.port', str(port),
+        '--server.enableXsrfProtection', 'false', '--server.fileWatcherType', 'none', '--browser.gatherUsageStats', 'false',
+    ]
+    process = subprocess.Popen(command, cwd=os.path.dirname(app_path), env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + server_start_timeout_seconds
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"streamlit exited with code {process.returncode}, see {log_file.name}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return process
+        except OSError:
+            time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError(f"streamlit did not become healthy within {server_start_timeout_seconds} s, see {log_file.name}")
+
+# Stop the streamlit subprocess
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+# Build a multipart/form-data body with a single file (as sent by the browser to the upload endpoint)
+def get_multipart_body(file_name, file_bytes):
+    boundary = uuid.uuid4().hex
+    body = b''.join([
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{file_name}"\r\nContent-Type: {workbook_content_type}\r\n\r\n'.encode(),
+        file_bytes,
+        f'\r\n--{boundary}--\r\n'.encode(),
+    ])
+    return 'multipart/form-data; boundary='+boundary, body
+
+# A simulated browser session: keeps the widget states like the frontend and sends them with every rerun
+class SimulatedSession:
+
+    def __init__(self, number, base_url, workbook_path, interactions, rng, reruns):
+        self.number = number
+        self.base_url = base_url.rstrip('/')
+        self.workbook_path = workbook_path
+        self.interactions = interactions
+        self.rng = rng
+        self.reruns = reruns # shared list of all reruns: dicts with session, action, start, seconds, ok
+        self.connection = None
+        self.session_id = None
+        self.widgets = {} # widget id -> (element type, element proto) of the last run
+        self.widget_states = {} # widget id -> WidgetState sent with every rerun
+        self.message_cache = {} # hash -> ForwardMsg, the server sends references for messages already sent to this session
+        self.file_urls_responses = {}
+        self.exceptions = []
+
+    async def connect(self):
+        websocket_url = self.base_url.replace('http', 'ws', 1)+'/_stcore/stream'
+        self.connection = await websocket_connect(websocket_url, max_message_size=max_message_bytes, subprotocols=['streamlit'])
+
+    async def send(self, back_msg):
+        await self.connection.write_message(back_msg.SerializeToString(), binary=True)
+
+    # Receive and process one forward message, returns it (resolved if it is a cache reference)
+    async def receive(self):
+
+        data = await self.connection.read_message()
+        if data is None:
+            raise ConnectionError(f"session {self.number}: websocket closed by the server")
+        msg = ForwardMsg()
+        msg.ParseFromString(data)
+
+        if msg.WhichOneof('type') == 'ref_hash':
+            msg = self.message_cache[msg.ref_hash]
+        elif msg.metadata.cacheable:
+            self.message_cache[msg.hash] = msg
+
+        msg_type = msg.WhichOneof('type')
+        if msg_type == 'new_session':
+            self.session_id = msg.new_session.initialize.session_id
+        elif msg_type == 'delta' and msg.delta.WhichOneof('type') == 'new_element':
+            element_type = msg.delta.new_element.WhichOneof('type')
+            if element_type in ('file_uploader', 'multiselect', 'slider', 'selectbox'):
+                widget = getattr(msg.delta.new_element, element_type)
+                self.widgets[widget.id] = (element_type, widget)
+            elif element_type == 'exception':
+                self.exceptions.append(msg.delta.new_element.exception.message)
+        elif msg_type == 'file_urls_response':
+            self.file_urls_responses[msg.file_urls_response.response_id] = msg.file_urls_response
+
+        return msg
+
+    # Rerun the script with the current widget states and wait until it finished, records the latency
+    async def rerun(self, action):
+
+        back_msg = BackMsg()
+        back_msg.rerun_script.widget_states.widgets.extend(self.widget_states.values())
+        self.exceptions = []
+
+        start = time.perf_counter()
+        await self.send(back_msg)
+        while True:
+            msg = await asyncio.wait_for(self.receive(), rerun_timeout_seconds)
+            if msg.WhichOneof('type') == 'script_finished' and msg.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                break
+        seconds = time.perf_counter() - start
+
+        ok = msg.script_finished == ForwardMsg.FINISHED_SUCCESSFULLY and not self.exceptions
+        self.reruns.append({'session': self.number, 'action': action, 'start': start, 'seconds': seconds, 'ok': ok})
+        if self.exceptions:
+            print(f"session {self.number}: exception during '{action}': {self.exceptions[0]}", file=sys.stderr)
+
+    # Get the widgets of an element type (and optionally with a user key) of the last run
+    def get_widgets(self, element_type, key=None):
+        return [(widget_id, widget) for widget_id, (widget_type, widget) in self.widgets.items() if widget_type == element_type and (key is None or widget_id.endswith('-'+key))]
+
+    # Upload the workbook like the browser: request an upload url, PUT the file, rerun with the file uploader state
+    async def upload_workbook(self):
+
+        file_name = os.path.basename(self.workbook_path)
+        with open(self.workbook_path, 'rb') as f:
+            file_bytes = f.read()
+
+        request_id = uuid.uuid4().hex
+        back_msg = BackMsg()
+        back_msg.file_urls_request.request_id = request_id
+        back_msg.file_urls_request.file_names.append(file_name)
+        back_msg.file_urls_request.session_id = self.session_id
+        await self.send(back_msg)
+        while request_id not in self.file_urls_responses:
+            await asyncio.wait_for(self.receive(), rerun_timeout_seconds)
+        file_urls = self.file_urls_responses.pop(request_id).file_urls[0]
+
+        content_type, body = get_multipart_body(file_name, file_bytes)
+        upload_url = file_urls.upload_url if file_urls.upload_url.startswith('http') else self.base_url+file_urls.upload_url
+        await AsyncHTTPClient().fetch(HTTPRequest(upload_url, method='PUT', headers={'Content-Type': content_type}, body=body, request_timeout=rerun_timeout_seconds))
+
+        # The upload field of the app is the first file uploader without key (the comparison upload has a key)
+        uploader_id = next(widget_id for widget_id, _ in self.get_widgets('file_uploader') if not widget_id.endswith('-compare_file'))
+        widget_state = WidgetState(id=uploader_id)
+        uploaded_file_info = widget_state.file_uploader_state_value.uploaded_file_info.add()
+        uploaded_file_info.file_id = file_urls.file_id
+        uploaded_file_info.name = file_name
+        uploaded_file_info.size = len(file_bytes)
+        uploaded_file_info.file_urls.CopyFrom(file_urls)
+        self.widget_states[uploader_id] = widget_state
+
+        await self.rerun('upload')
+
+    # Select / deselect a random cluster, at least one cluster stays selected. Returns False if there is nothing to toggle.
+    async def toggle_cluster(self):
+
+        multiselects = self.get_widgets('multiselect')
+        if not multiselects:
+            return False
+        widget_id, multiselect = multiselects[0]
+        selected = list(self.widget_states[widget_id].int_array_value.data) if widget_id in self.widget_states else list(multiselect.default)
+        candidates = [index for index in range(len(multiselect.options)) if index not in selected or len(selected) > 1]
+        if not candidates:
+            return False
+
+        index = self.rng.choice(candidates)
+        selected = [i for i in selected if i != index] if index in selected else sorted(selected + [index])
+        widget_state = WidgetState(id=widget_id)
+        widget_state.int_array_value.data.extend(selected)
+        self.widget_states[widget_id] = widget_state
+
+        await self.rerun('toggle_cluster')
+        return True
+
+    # Move a random sizing slider to a different value. Returns False if the sliders are not shown.
+    async def move_slider(self):
+
+        sliders = [widget for key in sizing_slider_keys for widget in self.get_widgets('slider', key)]
+        if not sliders:
+            return False
+        widget_id, slider = self.rng.choice(sliders)
+        current = self.widget_states[widget_id].double_array_value.data[0] if widget_id in self.widget_states else slider.default[0]
+        values = [value for value in np.arange(slider.min, slider.max + slider.step / 2, slider.step).tolist() if value != current]
+
+        widget_state = WidgetState(id=widget_id)
+        widget_state.double_array_value.data.append(self.rng.choice(values))
+        self.widget_states[widget_id] = widget_state
+
+        await self.rerun('move_slider')
+        return True
+
+    async def run(self):
+
+        await self.connect()
+        try:
+            await self.rerun('initial')
+            await self.upload_workbook()
+            for _ in range(self.interactions):
+                await asyncio.sleep(self.rng.uniform(*think_time_seconds))
+                if not (self.rng.random() < 0.5 and await self.toggle_cluster()):
+                    if not await self.move_slider():
+                        await self.toggle_cluster()
+        finally:
+            self.connection.close()
+
+# Run all sessions concurrently (started evenly over the ramp up time), returns the reruns and the failed sessions
+async def run_sessions(base_url, workbook_paths, sessions, interactions, ramp_up_seconds, seed):
+
+    reruns = []
+    failed_sessions = []
+
+    async def run_session(number):
+        await asyncio.sleep(ramp_up_seconds * number / sessions)
+        session = SimulatedSession(number, base_url, workbook_paths[number % len(workbook_paths)], interactions, random.Random(seed + number), reruns)
+        try:
+            await session.run()
+        except Exception as e:
+            failed_sessions.append(number)
+            print(f"session {number}: failed: {e!r}", file=sys.stderr)
+
+    await asyncio.gather(*(run_session(number) for number in range(sessions)))
+    return reruns, failed_sessions
+
+# Get the latency percentiles (ms) per action and over all reruns
+def get_latency_stats(reruns):
+
+    actions = ['initial', 'upload', 'toggle_cluster', 'move_slider']
+    latency_stats = {}
+    for action in actions + ['all']:
+        seconds = [rerun['seconds'] for rerun in reruns if action in ('all', rerun['action'])]
+        if seconds:
+            milliseconds = np.asarray(seconds) * 1000
+            latency_stats[action] = dict(
+                reruns=len(seconds), failed=sum(1 for rerun in reruns if action in ('all', rerun['action']) and not rerun['ok']),
+                **{f"p{percentile}": float(np.percentile(milliseconds, percentile)) for percentile in latency_percentiles}, max=float(milliseconds.max()),
+            )
+    return latency_stats
+
+# Print the report of a load test run
+def print_report(description, latency_stats, failed_sessions, rss_samples, cache_stats):
+
+    print(f"== {description}")
+    if failed_sessions:
+        print(f"   FAILED sessions: {', '.join(str(number) for number in sorted(failed_sessions))}")
+
+    print(f"   {'rerun latency (ms)':<18} {'reruns':>7} {'failed':>7} " + ' '.join(f"{'p'+str(percentile):>8}" for percentile in latency_percentiles) + f" {'max':>8}")
+    for action, stats in latency_stats.items():
+        print(f"   {action:<18} {stats['reruns']:>7} {stats['failed']:>7} " + ' '.join(f"{stats['p'+str(percentile)]:>8.0f}" for percentile in latency_percentiles) + f" {stats['max']:>8.0f}")
+
+    if rss_samples:
+        rss = np.asarray([sample[1] for sample in rss_samples]) / 2**20
+        print(f"   server RSS (MiB): start {rss[0]:.0f}, peak {rss.max():.0f}, end {rss[-1]:.0f}")
+        timeline = [rss_samples[int(i)] for i in np.linspace(0, len(rss_samples) - 1, min(rss_timeline_points, len(rss_samples)))]
+        print('   RSS over time:    ' + ', '.join(f"{seconds:.0f}s {rss_bytes / 2**20:.0f}" for seconds, rss_bytes in timeline))
+    else:
+        print('   server RSS: not available (no --server-pid or not on Linux)')
+
+    if cache_stats:
+        print(f"   {'cache':<38} {'hits':>7} {'misses':>7} {'hit rate':>9}")
+        for cache_name, counter in sorted(cache_stats.items()):
+            accesses = counter['hits'] + counter['misses']
+            hit_rate = f"{counter['hits'] / accesses * 100:.1f} %" if accesses else '-'
+            print(f"   {cache_name:<38} {counter['hits']:>7} {counter['misses']:>7} {hit_rate:>9}")
+    else:
+        print('   cache hit rates: not available (server without NTNX_CACHE_STATS_FILE)')
+
+# Run a load test against the given url or a streamlit server started for the test, prints the report and returns the results
+def run_load_test(sessions=default_sessions, interactions=default_interactions, workbook_paths=(), n_vms=5000, n_clusters=8, n_workbooks=1, ramp_up_seconds=5.0, seed=0, url=None, server_pid=None, cache_stats_path=None, dataset_store_dir=None):
+
+    with tempfile.TemporaryDirectory(prefix='ntnx_load_test_') as work_dir:
+        workbook_paths = list(workbook_paths)
+        if not workbook_paths:
+            for i in range(n_workbooks):
+                workbook_path = os.path.join(work_dir, f"generated_{n_vms}_vms_{i}.xlsx")
+                parity_check.generate_workbook(workbook_path, n_vms, n_clusters, seed + i)
+                workbook_paths.append(workbook_path)
+            workbook_description = f"{len(workbook_paths)} generated workbook(s) with {n_vms} VMs / {n_clusters} cluster"
+        else:
+            workbook_description = ', '.join(os.path.basename(path) for path in workbook_paths)
+
+        server = None
+        with open(os.path.join(work_dir, 'server.log'), 'w+') as log_file:
+            try:
+                if url is None:
+                    port = get_free_port()
+                    cache_stats_path = os.path.join(work_dir, 'cache_stats.json')
+                    env = dict(os.environ, NTNX_DATASET_STORE=dataset_store_dir or os.path.join(work_dir, 'datasets'), NTNX_CACHE_STATS_FILE=cache_stats_path)
+                    env.pop('NTNX_S3_BUCKET', None) # uploads only, no S3 picker
+                    env.setdefault('STREAMLIT_LOGGER_LEVEL', 'error')
+                    server = start_server(port, env, log_file)
+                    url, server_pid = f"http://127.0.0.1:{port}", server.pid
+
+                cache_stats_before = read_cache_stats(cache_stats_path) if cache_stats_path else {}
+                rss_samples = []
+                stop_event = threading.Event()
+                start_time = time.perf_counter()
+                rss_sampler = threading.Thread(target=sample_rss, args=(server_pid, rss_samples, stop_event, start_time), daemon=True) if server_pid else None
+                if rss_sampler:
+                    rss_sampler.start()
+                try:
+                    reruns, failed_sessions = asyncio.run(run_sessions(url, workbook_paths, sessions, interactions, ramp_up_seconds, seed))
+                finally:
+                    stop_event.set()
+                    if rss_sampler:
+                        rss_sampler.join()
+                cache_stats = get_cache_stats_delta(cache_stats_before, read_cache_stats(cache_stats_path)) if cache_stats_path else {}
+            finally:
+                if server is not None:
+                    stop_server(server)
+                    if server.returncode not in (0, -15):
+                        log_file.seek(0)
+                        print(log_file.read()[-4000:], file=sys.stderr)
+
+    for rerun in reruns:
+        rerun['start'] -= start_time
+    latency_stats = get_latency_stats(reruns)
+    print_report(f"{sessions} sessions x {interactions} interactions against {url}, {workbook_description}", latency_stats, failed_sessions, rss_samples, cache_stats)
+
+    return {
+        'sessions': sessions, 'interactions': interactions, 'workbooks': workbook_description, 'failed_sessions': failed_sessions,
+        'latency_ms': latency_stats, 'reruns': reruns, 'rss_samples': rss_samples, 'cache_stats': cache_stats,
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test of the Streamlit app with concurrent simulated sessions.')
+    parser.add_argument('--sessions', type=int, default=default_sessions)
+    parser.add_argument('--interactions', type=int, default=default_interactions, help='cluster toggles / slider moves per session after the upload')
+    parser.add_argument('--workbook', action='append', default=[], help='collector export uploaded by the sessions instead of generated workbooks, can be given multiple times')
+    parser.add_argument('--vms', type=int, default=5000, help='VMs per generated workbook')
+    parser.add_argument('--clusters', type=int, default=8, help='clusters per generated workbook')
+    parser.add_argument('--workbooks', type=int, default=1, help='distinct generated workbooks, the sessions use them round robin')
+    parser.add_argument('--ramp-up', type=float, default=5.0, help='seconds over which the sessions are started')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--url', default=None, help='running instance of app.py (default: start one on a free port)')
+    parser.add_argument('--server-pid', type=int, default=None, help='pid of the running instance for the RSS samples (with --url)')
+    parser.add_argument('--cache-stats-file', default=None, help='NTNX_CACHE_STATS_FILE of the running instance (with --url)')
+    parser.add_argument('--dataset-store', default=None, help='dataset store of the started instance (default: a fresh temporary one)')
+    parser.add_argument('--json', default=None, help='write all results (incl. every rerun and RSS sample) to this file')
+    args = parser.parse_args()
+
+    results = run_load_test(args.sessions, args.interactions, args.workbook, args.vms, args.clusters, args.workbooks, args.ramp_up, args.seed, args.url, args.server_pid, args.cache_stats_file, args.dataset_store)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    sys.exit(1 if results['failed_sessions'] or any(not rerun['ok'] for rerun in results['reruns']) else 0)
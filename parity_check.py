@@ -0,0 +1,535 @@
+import os
+import re
+import sys
+import math
+import time
+import pickle
+import hashlib
+import shutil
+import tarfile
+import argparse
+import tempfile
+import warnings
+import tracemalloc
+import subprocess
+import statistics
+import dataclasses
+from io import BytesIO
+import numpy as np
+import pandas as pd
+
+######################
+# Initialize variables
+######################
+# A reference and a candidate implementation (git revision or directory) run the analysis pipeline of
+# custom_functions on the same workbooks, each run in a fresh process (no st.cache hits between runs).
+# Like the app, the pipeline reads the workbook through dataset_store (stored in a temporary store, filtered
+# with filter_by_cluster), implementations without dataset_store read it with get_data_from_excel and filter
+# with isin. For a candidate with dataset_store both paths are run and compared as well, and the candidate is
+# run once more with all vDisk / vPartition sheets streamed & aggregated (same analysis outputs expected).
+# Reference revisions before the result models (e.g. the baseline before the typed results) are run through their
+# Styler overview tables & session state sizing results, compared are the tables (Styler data) and the sizing strings.
+# All outputs are compared within the tolerances, the median time and the peak memory are compared
+# against the thresholds. Usage:
+#   python parity_check.py compare [--reference HEAD] [--candidate .] [--workbook export.xlsx ...]
+#   python parity_check.py generate <target.xlsx> [--vms 5000] [--clusters 8] [--seed 0]
+#   python parity_check.py anonymize <export.xlsx> <target.xlsx>
+rel_tolerance = 1e-9
+abs_tolerance = 1e-6
+time_threshold = 1.10 # candidate median time may be at most 10% above the reference
+min_time_delta_seconds = 0.05 # ... and at least this much slower to count as regression (timer noise on small workbooks)
+memory_threshold = 1.10 # candidate peak memory may be at most 10% above the reference
+benchmark_repeats = 5
+max_reported_mismatches = 20
+
+# Generated workbooks: name -> (VMs, clusters, seed)
+generated_workbooks = {
+    'small': (500, 3, 0),
+    'medium': (5000, 8, 1),
+    'large': (20000, 20, 2),
+}
+
+# Growth values (%) used for the sizing results of every sizing option
+sizing_growth_values = (0, 10, 30, 100)
+
+# Sizing options of reference revisions before the result models (selectbox options of their app, no *_sizing_options)
+legacy_sizing_options = {
+    'vCPU': ('On VMs - 95th Percentile vCPUs *', 'On VMs - Peak vCPUs', 'On VMs - Provisioned vCPUs', 'On und Off VMs - Provisioned vCPUs', 'On VMs - Average vCPUs', 'On VMs - Median vCPUs'),
+    'vRAM': ('On VMs - Provisioned vMemory *', 'On und Off VMs - Provisioned vMemory', 'On VMs - Peak vMemory', 'On VMs - 95th Percentile vMemory', 'On VMs - Average vMemory', 'On VMs - Median vMemory'),
+    'vStorage': ('On und Off VMs - Consumed VM Storage *', 'On VMs - Consumed VM Storage', 'On und Off VMs - Provisioned VM Storage', 'On VMs - Provisioned VM Storage'),
+}
+# Outputs only implementations with result models have (not compared against a reference without them)
+result_output_names = ('vCPU_result', 'vRAM_result', 'vStorage_result')
+
+# Columns kept by anonymize_workbook (the columns read by the analysis) and the columns replaced by tokens
+# (vHosts 'Cluster' holds the vCluster MOID, both need the same token)
+workbook_cols = {
+    'vInfo': ["VM Name","Power State","Cluster Name","MOID"],
+    'vCPU': ["VM Name","Power State","vCPUs","Peak %","Average %","Median %","95th Percentile % (recommended)","Cluster Name","MOID"],
+    'vMemory': ["VM Name", "Power State","Size (MiB)","Peak %","Average %","Median %","95th Percentile % (recommended)","Cluster Name","MOID"],
+    'vHosts': ["Cluster","CPUs","VMs","CPU Cores","CPU Speed","Cores per CPU","Memory Size","CPU Usage","Memory Usage"],
+    'vCluster': ["Datacenter", "MOID","Cluster Name","CPU Usage %","Memory Usage %","95th Percentile Disk Throughput (KBps)","95th Percentile IOPS","95th Percentile Number of Reads","95th Percentile Number of Writes"],
+    'vPartition': ["VM Name","Power State","Consumed (MiB)","Capacity (MiB)","Datacenter Name","Cluster Name", "Host Name", "MOID"],
+    'vmList': ["VM Name","Power State","vCPUs","Memory (MiB)","Thin Provisioned","Capacity (MiB)","Consumed (MiB)","Guest OS","Cluster Name","Datacenter Name"],
+    'vDisk': ["VM Name", "Capacity (MiB)", "Thin Provisioned", "Cluster Name", "MOID"],
+    'vSnapshot': ["Size MiB (vmsn)", "Cluster Name", "MOID"],
+}
+anonymized_cols = {'VM Name': 'vm', 'Cluster Name': 'cluster', 'Cluster': 'moid', 'MOID': 'moid', 'Datacenter': 'dc', 'Datacenter Name': 'dc', 'Host Name': 'host'}
+
+######################
+# Custom Functions
+######################
+# Generate a collector-like workbook with random values, incl. missing usage data, VMs without vPartition data (vDisk fallback) and snapshots
+def generate_workbook(path, n_vms, n_clusters, seed=0):
+
+    rng = np.random.default_rng(seed)
+    clusters = np.array([f"Cluster-{i:03d}" for i in range(n_clusters)], dtype=object)
+    cluster_moids = np.array([f"domain-c{i}" for i in range(n_clusters)], dtype=object)
+    datacenters = np.array([f"DC-{i % 3}" for i in range(n_clusters)], dtype=object)
+
+    vm_cluster = rng.integers(0, n_clusters, n_vms)
+    vm_names = np.array([f"VM-{i:06d}" for i in range(n_vms)], dtype=object)
+    vm_moids = np.array([f"vm-{i}" for i in range(n_vms)], dtype=object)
+    vm_cluster_names = clusters[vm_cluster]
+    vm_datacenters = datacenters[vm_cluster]
+    power_state = np.where(rng.random(n_vms) < 0.8, 'poweredOn', 'poweredOff')
+    vCPUs = rng.choice([1, 2, 4, 8, 16, 32], n_vms, p=[0.15, 0.35, 0.3, 0.12, 0.06, 0.02])
+    memory_mib = rng.choice([512, 1024, 2048, 4096, 8192, 16384, 65536], n_vms)
+
+    # Usage in %, ~5% of the VMs without usage data, some at exactly 0 / 100 %
+    def generate_usage():
+        usage = np.round(rng.beta(1.5, 4, n_vms) * 100, 2)
+        usage[rng.random(n_vms) < 0.02] = 100
+        usage[rng.random(n_vms) < 0.02] = 0
+        usage[rng.random(n_vms) < 0.05] = np.nan
+        return usage
+
+    usage_cols = lambda: {"Peak %": generate_usage(), "Average %": generate_usage(), "Median %": generate_usage(), "95th Percentile % (recommended)": generate_usage()}
+    df_vInfo = pd.DataFrame({"VM Name": vm_names, "Power State": power_state, "Cluster Name": vm_cluster_names, "MOID": vm_moids})
+    df_vCPU = pd.DataFrame({"VM Name": vm_names, "Power State": power_state, "vCPUs": vCPUs, **usage_cols(), "Cluster Name": vm_cluster_names, "MOID": vm_moids})
+    df_vMemory = pd.DataFrame({"VM Name": vm_names, "Power State": power_state, "Size (MiB)": memory_mib, **usage_cols(), "Cluster Name": vm_cluster_names, "MOID": vm_moids})
+
+    n_hosts = n_clusters * 4
+    host_cluster = np.arange(n_hosts) % n_clusters
+    df_vHosts = pd.DataFrame({
+        "Cluster": cluster_moids[host_cluster], "CPUs": 2, "VMs": rng.integers(5, 80, n_hosts), "CPU Cores": rng.choice([16, 24, 32, 48], n_hosts),
+        "CPU Speed": rng.choice([2100, 2600, 3000], n_hosts), "Cores per CPU": rng.choice([8, 12, 16, 24], n_hosts), "Memory Size": rng.choice([262144, 524288, 1048576], n_hosts),
+        "CPU Usage": np.round(rng.random(n_hosts) * 100, 2), "Memory Usage": np.round(rng.random(n_hosts) * 100, 2), # in % like the collector export
+    })
+    df_vCluster = pd.DataFrame({
+        "Datacenter": datacenters, "MOID": cluster_moids, "Cluster Name": clusters, "CPU Usage %": np.round(rng.random(n_clusters) * 100, 2), "Memory Usage %": np.round(rng.random(n_clusters) * 100, 2),
+        "95th Percentile Disk Throughput (KBps)": np.round(rng.random(n_clusters) * 100000, 2), "95th Percentile IOPS": np.round(rng.random(n_clusters) * 20000, 2),
+        "95th Percentile Number of Reads": np.round(rng.random(n_clusters) * 12000, 2), "95th Percentile Number of Writes": np.round(rng.random(n_clusters) * 8000, 2),
+    })
+
+    # 1-3 partitions for ~70% of the VMs, 1-3 disks for every VM
+    partition_vms = np.flatnonzero(rng.random(n_vms) < 0.7)
+    partition_vms = np.repeat(partition_vms, rng.integers(1, 4, partition_vms.size))
+    partition_capacity = np.round(rng.lognormal(10.5, 1.2, partition_vms.size), 2)
+    df_vPartition = pd.DataFrame({
+        "VM Name": vm_names[partition_vms], "Power State": power_state[partition_vms], "Consumed (MiB)": np.round(partition_capacity * rng.random(partition_vms.size), 2), "Capacity (MiB)": partition_capacity,
+        "Datacenter Name": vm_datacenters[partition_vms], "Cluster Name": vm_cluster_names[partition_vms], "Host Name": [f"esx-{i % n_hosts:03d}" for i in partition_vms], "MOID": vm_moids[partition_vms],
+    })
+    disk_vms = np.repeat(np.arange(n_vms), rng.integers(1, 4, n_vms))
+    df_vDisk = pd.DataFrame({
+        "VM Name": vm_names[disk_vms], "Capacity (MiB)": np.round(rng.lognormal(10.8, 1.1, disk_vms.size), 2), "Thin Provisioned": rng.random(disk_vms.size) < 0.6,
+        "Cluster Name": vm_cluster_names[disk_vms], "MOID": vm_moids[disk_vms],
+    })
+    vm_disk_capacity = df_vDisk.groupby("MOID", sort=False)["Capacity (MiB)"].sum().reindex(vm_moids).to_numpy()
+    df_vmList = pd.DataFrame({
+        "VM Name": vm_names, "Power State": power_state, "vCPUs": vCPUs, "Memory (MiB)": memory_mib, "Thin Provisioned": rng.random(n_vms) < 0.6,
+        "Capacity (MiB)": vm_disk_capacity, "Consumed (MiB)": np.round(vm_disk_capacity * rng.random(n_vms), 2),
+        "Guest OS": rng.choice(np.array(["Microsoft Windows Server 2019 (64-bit)", "Red Hat Enterprise Linux 8 (64-bit)", "Ubuntu Linux (64-bit)", None], dtype=object), n_vms),
+        "Cluster Name": vm_cluster_names, "Datacenter Name": vm_datacenters,
+    })
+    snapshot_vms = rng.choice(n_vms, max(n_vms // 10, 1))
+    df_vSnapshot = pd.DataFrame({"Size MiB (vmsn)": np.round(rng.random(snapshot_vms.size) * 4096, 2), "Cluster Name": vm_cluster_names[snapshot_vms], "MOID": vm_moids[snapshot_vms]})
+
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        for sheet_name, df in [('vInfo', df_vInfo), ('vCPU', df_vCPU), ('vMemory', df_vMemory), ('vHosts', df_vHosts), ('vCluster', df_vCluster), ('vPartition', df_vPartition), ('vmList', df_vmList), ('vDisk', df_vDisk), ('vSnapshot', df_vSnapshot)]:
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+
+# Get a stable token for an identifying value (same value -> same token in all tabs, so joins keep working)
+def get_anonymized_token(value, prefix):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return value
+    token = prefix+'-'+hashlib.sha256(str(value).encode('utf-8')).hexdigest()[:12]
+    if prefix == 'vm' and re.match('^NTNX-.*-CVM$', str(value)):
+        token = 'NTNX-'+token+'-CVM' # keep the CVM detection working
+    return token
+
+# Copy the analyzed columns of a real collector export and replace all names / ids by tokens
+def anonymize_workbook(source_path, target_path):
+
+    with pd.ExcelWriter(target_path, engine="openpyxl") as writer:
+        for sheet_name, cols_to_use in workbook_cols.items():
+            df = pd.read_excel(source_path, sheet_name=sheet_name, usecols=cols_to_use, engine="openpyxl")
+            for col, prefix in anonymized_cols.items():
+                if col in df.columns:
+                    df[col] = df[col].map(lambda value: get_anonymized_token(value, prefix))
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+
+# Convert an output into plain values / dataframes for pickling and comparing
+def normalize_output(value):
+    if hasattr(value, 'data') and isinstance(getattr(value, 'data'), pd.DataFrame): # pandas Styler
+        return value.data.copy()
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy()
+    if dataclasses.is_dataclass(value):
+        return dataclasses.asdict(value)
+    if isinstance(value, (list, tuple)):
+        return [normalize_output(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+# Get the results, overview tables and sizing results (the customer-facing strings) for every sizing option and growth value
+def get_result_outputs(custom_functions, st, df_vCPU_filtered, df_vHosts_filtered, df_vMemory_filtered, df_vPartition_filtered, df_vDisk_filtered, df_vmList_filtered, df_vSnapshot_filtered):
+
+    vCPU_result = custom_functions.generate_vCPU_result(df_vCPU_filtered, df_vHosts_filtered)
+    vRAM_result = custom_functions.generate_vRAM_result(df_vMemory_filtered)
+    vStorage_result = custom_functions.generate_vStorage_result(df_vPartition_filtered, df_vDisk_filtered, df_vmList_filtered, df_vSnapshot_filtered)
+    outputs = {
+        'vCPU_result': vCPU_result, 'vCPU_overview': custom_functions.generate_vCPU_overview_df(vCPU_result),
+        'vRAM_result': vRAM_result, 'vRAM_overview': custom_functions.generate_vRAM_overview_df(vRAM_result),
+        'vStorage_result': vStorage_result, 'vStorage_overview': custom_functions.generate_vStorage_overview_df(vStorage_result),
+    }
+
+    for result_type, result, sizing_options in [
+        ('vCPU', vCPU_result, custom_functions.vCPU_sizing_options),
+        ('vRAM', vRAM_result, custom_functions.vRAM_sizing_options),
+        ('vStorage', vStorage_result, custom_functions.vStorage_sizing_options),
+    ]:
+        calculate_sizing_values = getattr(custom_functions, 'calculate_sizing_values_'+result_type, None)
+        for sizing_option in sizing_options:
+            for growth in sizing_growth_values:
+                if calculate_sizing_values is not None:
+                    sizing_strings = [str(value) for value in calculate_sizing_values(result, sizing_option, growth)]
+                else: # reference revisions before the numeric sizing values: session state based sizing results
+                    st.session_state[result_type+'_selectbox'] = sizing_option
+                    st.session_state[result_type+'_slider'] = growth
+                    getattr(custom_functions, 'calculate_sizing_result_'+result_type)(result)
+                    sizing_strings = [st.session_state[result_type+'_basis'], st.session_state[result_type+'_final'], st.session_state[result_type+'_growth']]
+                outputs[f"sizing_{result_type}/{sizing_option}/{growth}%"] = sizing_strings
+
+    return outputs
+
+# Same outputs for reference revisions before the result models: overview tables (Stylers) built from the filtered frames,
+# session state based sizing results read from the Styler tables
+def get_legacy_outputs(custom_functions, st, df_vCPU_filtered, df_vHosts_filtered, df_vMemory_filtered, df_vPartition_filtered, df_vDisk_filtered, df_vmList_filtered, df_vSnapshot_filtered):
+
+    vCPU_provisioned_df, vCPU_overview_df = custom_functions.generate_vCPU_overview_df(df_vCPU_filtered, df_vHosts_filtered)
+    vRAM_provisioned_df, vMemory_overview_df = custom_functions.generate_vRAM_overview_df(df_vMemory_filtered)
+    vStorage_overview = custom_functions.generate_vStorage_overview_df(df_vPartition_filtered, df_vDisk_filtered, df_vmList_filtered, df_vSnapshot_filtered)
+    outputs = {
+        'vCPU_overview': (vCPU_provisioned_df, vCPU_overview_df),
+        'vRAM_overview': (vRAM_provisioned_df, vMemory_overview_df),
+        'vStorage_overview': vStorage_overview,
+    }
+
+    for result_type, sizing_args in [
+        ('vCPU', (vCPU_provisioned_df, vCPU_overview_df)),
+        ('vRAM', (vRAM_provisioned_df, vMemory_overview_df)),
+        ('vStorage', (vStorage_overview[2],)), # vmList table
+    ]:
+        for sizing_option in legacy_sizing_options[result_type]:
+            for growth in sizing_growth_values:
+                st.session_state[result_type+'_selectbox'] = sizing_option
+                st.session_state[result_type+'_slider'] = growth
+                getattr(custom_functions, 'calculate_sizing_result_'+result_type)(*sizing_args)
+                outputs[f"sizing_{result_type}/{sizing_option}/{growth}%"] = [st.session_state[result_type+'_basis'], st.session_state[result_type+'_final'], st.session_state[result_type+'_growth']]
+
+    return outputs
+
+# Run the analysis pipeline of a custom_functions module on a workbook, returns all outputs by name.
+# With a dataset_store module the workbook is stored & filtered like in the app, otherwise get_data_from_excel + isin.
+def run_pipeline(custom_functions, st, workbook_path, dataset_store=None):
+
+    outputs = {}
+    if dataset_store is not None:
+        dataset_id = dataset_store.store_datasets(workbook_path)
+        frames = dataset_store.open_datasets(dataset_id)
+        filter_frames = lambda vCluster_selected: dataset_store.filter_datasets(dataset_id, vCluster_selected)
+    else:
+        frames = custom_functions.get_data_from_excel(workbook_path)
+        filter_frames = lambda vCluster_selected: [df[df['Cluster Name'].isin(vCluster_selected)] for df in frames]
+    for frame_name, df in zip(workbook_cols, frames):
+        outputs['frames/'+frame_name] = normalize_output(df)
+
+    df_vInfo, df_vCPU, df_vMemory, df_vHosts, df_vCluster, df_vPartition, df_vmList, df_vDisk, df_vSnapshot = frames
+    clusters = sorted(df_vInfo['Cluster Name'].dropna().unique())
+    for selection_name, vCluster_selected in [('all', clusters)] + [('cluster='+str(cluster), [cluster]) for cluster in clusters]:
+        df_vInfo_filtered, df_vCPU_filtered, df_vMemory_filtered, df_vHosts_filtered, df_vCluster_filtered, df_vPartition_filtered, df_vmList_filtered, df_vDisk_filtered, df_vSnapshot_filtered = filter_frames(vCluster_selected)
+        selection_outputs = {
+            'CPU_infos': custom_functions.generate_CPU_infos(df_vHosts_filtered),
+            'Memory_infos': custom_functions.generate_Memory_infos(df_vHosts_filtered),
+            'read_write_ratio_infos': custom_functions.generate_read_write_ratio_infos(df_vCluster_filtered),
+            'Storage_infos': custom_functions.generate_Storage_infos(df_vPartition_filtered),
+            'vHosts_overview': custom_functions.generate_vHosts_overview_df(df_vHosts_filtered),
+            'top10_vCPU_VMs': custom_functions.generate_top10_vCPU_VMs_df(df_vCPU_filtered),
+            'top10_vMemory_VMs': custom_functions.generate_top10_vMemory_VMs_df(df_vMemory_filtered),
+            'top10_vStorage_consumed_VMs': custom_functions.generate_top10_vStorage_consumed_VMs_df(df_vmList_filtered),
+            'guest_os': custom_functions.generate_guest_os_df(df_vmList_filtered),
+        }
+        if hasattr(custom_functions, 'generate_vCPU_result'):
+            selection_outputs.update(get_result_outputs(custom_functions, st, df_vCPU_filtered, df_vHosts_filtered, df_vMemory_filtered, df_vPartition_filtered, df_vDisk_filtered, df_vmList_filtered, df_vSnapshot_filtered))
+        else:
+            selection_outputs.update(get_legacy_outputs(custom_functions, st, df_vCPU_filtered, df_vHosts_filtered, df_vMemory_filtered, df_vPartition_filtered, df_vDisk_filtered, df_vmList_filtered, df_vSnapshot_filtered))
+
+        for output_name, value in selection_outputs.items():
+            outputs[selection_name+'/'+output_name] = normalize_output(value)
+
+    return outputs
+
+# Check if an implementation directory has the dataset store (reference revisions before it only have get_data_from_excel)
+def has_dataset_store(implementation_dir):
+    return os.path.exists(os.path.join(implementation_dir, 'dataset_store.py'))
+
+# Worker: run the pipeline of the implementation in the current directory once, write outputs / time / peak memory to a pickle file.
+# source 'dataset_store' runs through an empty temporary dataset store (if the implementation has one), 'excel' through get_data_from_excel.
+# storage_streaming forces the streamed & aggregated vDisk / vPartition path (storage_streaming_row_threshold = 0).
+def run_worker(workbook_path, result_path, trace_memory, keep_outputs, source='dataset_store', storage_streaming=False):
+
+    sys.path.insert(0, os.getcwd()) # the implementation to run, not the one of this file
+    warnings.simplefilter("ignore") # same as the app (openpyxl / pandas warnings)
+    import streamlit as st
+    import streamlit.logger
+    streamlit.logger.set_log_level('error') # bare mode warnings of st.cache / st.session_state
+    import custom_functions
+    if storage_streaming:
+        custom_functions.storage_streaming_row_threshold = 0
+
+    dataset_store = None
+    store_dir = tempfile.mkdtemp(prefix='ntnx_parity_store_')
+    if source == 'dataset_store' and has_dataset_store(os.getcwd()):
+        os.environ['NTNX_DATASET_STORE'] = store_dir # read by dataset_store on import
+        import dataset_store
+
+    try:
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        outputs = run_pipeline(custom_functions, st, os.path.abspath(workbook_path), dataset_store)
+        seconds = time.perf_counter() - start
+        peak_memory = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    finally:
+        shutil.rmtree(store_dir, ignore_errors=True)
+
+    with open(result_path, 'wb') as f:
+        pickle.dump({'outputs': outputs if keep_outputs else None, 'result_models': hasattr(custom_functions, 'generate_vCPU_result'), 'seconds': seconds, 'peak_memory': peak_memory}, f)
+
+# Run one worker process for an implementation directory
+def run_implementation(implementation_dir, workbook_path, trace_memory=False, keep_outputs=False, source='dataset_store', storage_streaming=False):
+
+    with tempfile.NamedTemporaryFile(suffix='.pickle', delete=False) as f:
+        result_path = f.name
+    try:
+        command = [sys.executable, os.path.abspath(__file__), 'run', os.path.abspath(workbook_path), result_path, '--source', source]
+        command += ['--trace-memory'] if trace_memory else []
+        command += ['--keep-outputs'] if keep_outputs else []
+        command += ['--storage-streaming'] if storage_streaming else []
+        worker = subprocess.run(command, cwd=implementation_dir, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if worker.returncode != 0:
+            raise RuntimeError(f"pipeline failed for {implementation_dir} on {workbook_path}:\n{worker.stderr[-4000:]}")
+        with open(result_path, 'rb') as f:
+            return pickle.load(f)
+    finally:
+        os.remove(result_path)
+
+# Get the implementation directory: an existing directory or a git revision exported into work_dir
+def get_implementation_dir(implementation, work_dir, name):
+
+    if os.path.isdir(implementation):
+        return os.path.abspath(implementation)
+
+    repository_dir = os.path.dirname(os.path.abspath(__file__))
+    archive = subprocess.run(['git', 'archive', '--format=tar', implementation], cwd=repository_dir, check=True, stdout=subprocess.PIPE).stdout
+    implementation_dir = os.path.join(work_dir, name)
+    with tarfile.open(fileobj=BytesIO(archive)) as tar:
+        tar.extractall(implementation_dir)
+
+    return implementation_dir
+
+# Check if two scalar values are equal (numbers within the tolerances, NaN equals NaN, everything else exact)
+def is_equal_value(reference, candidate, rel_tol, abs_tol):
+
+    if isinstance(reference, (bool, np.bool_)) or isinstance(candidate, (bool, np.bool_)):
+        return reference == candidate
+    if isinstance(reference, (int, float, np.number)) and isinstance(candidate, (int, float, np.number)):
+        if math.isnan(reference) or math.isnan(candidate):
+            return math.isnan(reference) and math.isnan(candidate)
+        return math.isclose(reference, candidate, rel_tol=rel_tol, abs_tol=abs_tol)
+    if pd.isna(reference) is True and pd.isna(candidate) is True:
+        return True
+
+    return reference == candidate
+
+# Compare two dataframes (index, columns and all cells), returns a list of mismatch descriptions
+def compare_frames(name, reference, candidate, rel_tol, abs_tol):
+
+    if isinstance(reference, pd.Series):
+        reference, candidate = reference.to_frame(), candidate.to_frame()
+    if reference.shape != candidate.shape:
+        return [f"{name}: shape {reference.shape} != {candidate.shape}"]
+    if list(reference.columns) != list(candidate.columns):
+        return [f"{name}: columns {list(reference.columns)} != {list(candidate.columns)}"]
+    if list(reference.index) != list(candidate.index):
+        return [f"{name}: index differs"]
+
+    mismatches = []
+    for position, column in enumerate(reference.columns):
+        reference_values = reference.iloc[:, position]
+        candidate_values = candidate.iloc[:, position]
+        if reference_values.dtype.kind in 'iuf' and candidate_values.dtype.kind in 'iuf':
+            equal = np.isclose(reference_values.to_numpy(dtype=np.float64), candidate_values.to_numpy(dtype=np.float64), rtol=rel_tol, atol=abs_tol, equal_nan=True)
+        else:
+            equal = np.array([is_equal_value(r, c, rel_tol, abs_tol) for r, c in zip(reference_values.tolist(), candidate_values.tolist())], dtype=bool)
+        for row in np.flatnonzero(~equal)[:3]:
+            mismatches.append(f"{name}[{reference.index[row]!r}, {column!r}]: {reference_values.iloc[row]!r} != {candidate_values.iloc[row]!r}")
+        if (~equal).sum() > 3:
+            mismatches.append(f"{name}[:, {column!r}]: {(~equal).sum()} differing rows")
+
+    return mismatches
+
+# Compare two outputs recursively, returns a list of mismatch descriptions
+def compare_outputs(name, reference, candidate, rel_tol=rel_tolerance, abs_tol=abs_tolerance):
+
+    if isinstance(reference, (pd.DataFrame, pd.Series)) or isinstance(candidate, (pd.DataFrame, pd.Series)):
+        if type(reference) is not type(candidate):
+            return [f"{name}: {type(reference).__name__} != {type(candidate).__name__}"]
+        return compare_frames(name, reference, candidate, rel_tol, abs_tol)
+    if isinstance(reference, dict) and isinstance(candidate, dict):
+        mismatches = [f"{name}/{key}: missing in candidate" for key in reference if key not in candidate]
+        mismatches += [f"{name}/{key}: missing in reference" for key in candidate if key not in reference]
+        for key in reference:
+            if key in candidate:
+                mismatches += compare_outputs(f"{name}/{key}", reference[key], candidate[key], rel_tol, abs_tol)
+        return mismatches
+    if isinstance(reference, list) and isinstance(candidate, list):
+        if len(reference) != len(candidate):
+            return [f"{name}: length {len(reference)} != {len(candidate)}"]
+        mismatches = []
+        for i, (reference_item, candidate_item) in enumerate(zip(reference, candidate)):
+            mismatches += compare_outputs(f"{name}[{i}]", reference_item, candidate_item, rel_tol, abs_tol)
+        return mismatches
+    if not is_equal_value(reference, candidate, rel_tol, abs_tol):
+        return [f"{name}: {reference!r} != {candidate!r}"]
+
+    return []
+
+# Print the result of an output comparison, returns True if there are no mismatches
+def report_mismatches(label, mismatches, ok_note):
+
+    if mismatches:
+        print(f"   {label:<8} FAILED, {len(mismatches)} mismatches")
+        for mismatch in mismatches[:max_reported_mismatches]:
+            print('     '+mismatch.lstrip('/'))
+        return False
+
+    print(f"   {label:<8} ok ({ok_note})")
+    return True
+
+# Benchmark implementations: median time over the repeats (runs interleaved, so load changes on the machine hit all
+# implementations alike) and the peak memory of a separate traced run
+def benchmark_implementations(implementation_dirs, workbook_path, repeats):
+
+    seconds = {implementation_dir: [] for implementation_dir in implementation_dirs}
+    for _ in range(repeats):
+        for implementation_dir in implementation_dirs:
+            seconds[implementation_dir].append(run_implementation(implementation_dir, workbook_path)['seconds'])
+
+    return [(statistics.median(seconds[implementation_dir]), run_implementation(implementation_dir, workbook_path, trace_memory=True)['peak_memory']) for implementation_dir in implementation_dirs]
+
+# Compare reference & candidate on all workbooks, prints a report and returns True if parity & performance are fine
+def compare_implementations(reference, candidate, workbook_paths, generated, repeats=benchmark_repeats, rel_tol=rel_tolerance, abs_tol=abs_tolerance, max_time_ratio=time_threshold, max_memory_ratio=memory_threshold):
+
+    passed = True
+    with tempfile.TemporaryDirectory(prefix='ntnx_parity_') as work_dir:
+        reference_dir = get_implementation_dir(reference, work_dir, 'reference')
+        candidate_dir = get_implementation_dir(candidate, work_dir, 'candidate')
+
+        workbooks = [(os.path.basename(path), path) for path in workbook_paths]
+        for workbook_name in generated:
+            n_vms, n_clusters, seed = generated_workbooks[workbook_name]
+            workbook_path = os.path.join(work_dir, f"generated_{workbook_name}.xlsx")
+            generate_workbook(workbook_path, n_vms, n_clusters, seed)
+            workbooks.append((f"generated {workbook_name} ({n_vms} VMs, {n_clusters} cluster)", workbook_path))
+
+        for workbook_name, workbook_path in workbooks:
+            print(f"== {workbook_name}")
+
+            reference_run = run_implementation(reference_dir, workbook_path, keep_outputs=True)
+            reference_outputs = reference_run['outputs']
+            candidate_outputs = run_implementation(candidate_dir, workbook_path, keep_outputs=True)['outputs']
+            compared_outputs, ok_note = candidate_outputs, f"{len(reference_outputs)} outputs"
+            if not reference_run['result_models']: # reference before the result models: compare the tables & sizing strings built from them
+                compared_outputs = {name: value for name, value in candidate_outputs.items() if name.rsplit('/', 1)[-1] not in result_output_names}
+                ok_note += ", reference without result models"
+            mismatches = compare_outputs('', reference_outputs, compared_outputs, rel_tol, abs_tol)
+            passed = report_mismatches('parity:', mismatches, ok_note) and passed
+
+            # Same candidate through get_data_from_excel + isin (e.g. the batch tooling) vs. through the dataset store (the app)
+            if has_dataset_store(candidate_dir):
+                excel_outputs = run_implementation(candidate_dir, workbook_path, keep_outputs=True, source='excel')['outputs']
+                mismatches = compare_outputs('', excel_outputs, candidate_outputs, rel_tol, abs_tol)
+                passed = report_mismatches('paths:', mismatches, "get_data_from_excel == dataset_store") and passed
+
+            # Same candidate with streamed & aggregated vDisk / vPartition sheets, the parsed frames differ (one row per VM), the analysis outputs not
+            streamed_outputs = run_implementation(candidate_dir, workbook_path, keep_outputs=True, storage_streaming=True)['outputs']
+            analysis_outputs = lambda outputs: {name: value for name, value in outputs.items() if not name.startswith('frames/')}
+            mismatches = compare_outputs('', analysis_outputs(candidate_outputs), analysis_outputs(streamed_outputs), rel_tol, abs_tol)
+            passed = report_mismatches('stream:', mismatches, "streamed vDisk / vPartition == loaded") and passed
+
+            (reference_seconds, reference_peak_memory), (candidate_seconds, candidate_peak_memory) = benchmark_implementations([reference_dir, candidate_dir], workbook_path, repeats)
+            time_regression = candidate_seconds > reference_seconds * max_time_ratio and candidate_seconds - reference_seconds > min_time_delta_seconds
+            memory_regression = candidate_peak_memory > reference_peak_memory * max_memory_ratio
+            passed = passed and not time_regression and not memory_regression
+            print(f"   time:    {reference_seconds:.3f} s -> {candidate_seconds:.3f} s (median of {repeats}, x{candidate_seconds / reference_seconds:.2f}){'  REGRESSION' if time_regression else ''}")
+            print(f"   memory:  {reference_peak_memory / 2**20:.1f} MiB -> {candidate_peak_memory / 2**20:.1f} MiB (peak, x{candidate_peak_memory / reference_peak_memory:.2f}){'  REGRESSION' if memory_regression else ''}")
+
+    print('PASSED' if passed else 'FAILED')
+    return passed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parity & performance check of the analysis pipeline (reference vs. candidate implementation).')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    compare_parser = subparsers.add_parser('compare', help='compare reference & candidate on generated and given workbooks')
+    compare_parser.add_argument('--reference', default='HEAD', help='git revision or directory (default: HEAD)')
+    compare_parser.add_argument('--candidate', default=os.path.dirname(os.path.abspath(__file__)), help='git revision or directory (default: working tree)')
+    compare_parser.add_argument('--workbook', action='append', default=[], help='(anonymized) collector export, can be given multiple times')
+    compare_parser.add_argument('--generated', nargs='*', default=list(generated_workbooks), choices=list(generated_workbooks))
+    compare_parser.add_argument('--repeats', type=int, default=benchmark_repeats)
+    compare_parser.add_argument('--rel-tolerance', type=float, default=rel_tolerance)
+    compare_parser.add_argument('--abs-tolerance', type=float, default=abs_tolerance)
+    compare_parser.add_argument('--time-threshold', type=float, default=time_threshold, help='max. candidate / reference ratio of the median time')
+    compare_parser.add_argument('--memory-threshold', type=float, default=memory_threshold, help='max. candidate / reference ratio of the peak memory')
+
+    generate_parser = subparsers.add_parser('generate', help='generate a collector-like workbook')
+    generate_parser.add_argument('target')
+    generate_parser.add_argument('--vms', type=int, default=5000)
+    generate_parser.add_argument('--clusters', type=int, default=8)
+    generate_parser.add_argument('--seed', type=int, default=0)
+
+    anonymize_parser = subparsers.add_parser('anonymize', help='anonymize a real collector export')
+    anonymize_parser.add_argument('source')
+    anonymize_parser.add_argument('target')
+
+    run_parser = subparsers.add_parser('run', help=argparse.SUPPRESS) # worker, started by compare
+    run_parser.add_argument('workbook')
+    run_parser.add_argument('result')
+    run_parser.add_argument('--trace-memory', action='store_true')
+    run_parser.add_argument('--keep-outputs', action='store_true')
+    run_parser.add_argument('--source', default='dataset_store', choices=['dataset_store', 'excel'])
+    run_parser.add_argument('--storage-streaming', action='store_true')
+
+    args = parser.parse_args()
+    if args.command == 'compare':
+        passed = compare_implementations(args.reference, args.candidate, args.workbook, args.generated, args.repeats, args.rel_tolerance, args.abs_tolerance, args.time_threshold, args.memory_threshold)
+        sys.exit(0 if passed else 1)
+    elif args.command == 'generate':
+        generate_workbook(args.target, args.vms, args.clusters, args.seed)
+    elif args.command == 'anonymize':
+        anonymize_workbook(args.source, args.target)
+    elif args.command == 'run':
+        run_worker(args.workbook, args.result, args.trace_memory, args.keep_outputs, args.source, args.storage_streaming)
@@ -0,0 +1,131 @@
+import time
+from dataclasses import dataclass, field
+import pandas as pd
+
+######################
+# Result models
+######################
+# Invalidation of a node: the changed inputs upstream of the node and the direct dependencies through which it was reached
+@dataclass(frozen=True)
+class Invalidation:
+    changed_inputs: tuple
+    via: tuple
+
+# State of a graph for one session (e.g. stored in st.session_state): input values and memoized node values,
+# plus the invalidations and recomputations of the current run (reset by start_run)
+@dataclass
+class GraphState:
+    input_values: dict = field(default_factory=dict)
+    node_values: dict = field(default_factory=dict)
+    inputs_set: set = field(default_factory=set) # inputs set in the current run
+    invalidations: dict = field(default_factory=dict) # node -> Invalidation
+    recompute_seconds: dict = field(default_factory=dict) # node -> seconds
+
+######################
+# Recompute graph
+######################
+# Memoized dependency graph: inputs (widget values) and nodes (derived tables, charts, ...) computed from inputs and
+# other nodes. Changing an input invalidates only the nodes downstream of it, nodes are recomputed lazily on get.
+# Input values are compared with ==, so they should be scalars / tuples.
+class RecomputeGraph:
+
+    def __init__(self):
+        self.inputs = set()
+        self.nodes = {} # node -> (function, dependencies), in topological order (dependencies are added first)
+        self.upstream_inputs = {} # node -> all inputs the node depends on (directly or through other nodes)
+
+    # Add an input
+    def add_input(self, name):
+        if name in self.inputs or name in self.nodes:
+            raise ValueError(f"'{name}' is already part of the graph")
+        self.inputs.add(name)
+
+    # Add a node computed by function(*values of dependencies), the dependencies must be part of the graph already
+    def add_node(self, name, function, dependencies):
+        if name in self.inputs or name in self.nodes:
+            raise ValueError(f"'{name}' is already part of the graph")
+        unknown_dependencies = [dependency for dependency in dependencies if dependency not in self.inputs and dependency not in self.nodes]
+        if unknown_dependencies:
+            raise ValueError(f"'{name}' depends on unknown inputs / nodes: {', '.join(unknown_dependencies)}")
+
+        self.nodes[name] = (function, tuple(dependencies))
+        self.upstream_inputs[name] = frozenset().union(*({dependency} if dependency in self.inputs else self.upstream_inputs[dependency] for dependency in dependencies))
+
+    # Start a new run (e.g. a rerun of the Streamlit script), resets the invalidations & recomputations reported for the run
+    def start_run(self, state):
+        state.inputs_set = set()
+        state.invalidations = {}
+        state.recompute_seconds = {}
+
+    # Set input values, invalidates all nodes downstream of changed inputs (inputs not set before count as changed)
+    def set_inputs(self, state, **input_values):
+
+        unknown_inputs = [name for name in input_values if name not in self.inputs]
+        if unknown_inputs:
+            raise ValueError(f"unknown inputs: {', '.join(unknown_inputs)}")
+
+        changed_inputs = set()
+        for name, value in input_values.items():
+            if name not in state.input_values or state.input_values[name] != value:
+                changed_inputs.add(name)
+            state.input_values[name] = value
+            state.inputs_set.add(name)
+
+        if changed_inputs:
+            for name, (function, dependencies) in self.nodes.items():
+                node_changed_inputs = self.upstream_inputs[name] & changed_inputs
+                if node_changed_inputs:
+                    state.node_values.pop(name, None)
+                    previous = state.invalidations.get(name, Invalidation((), ()))
+                    via = [dependency for dependency in dependencies if dependency in changed_inputs or dependency in state.invalidations]
+                    state.invalidations[name] = Invalidation(
+                        changed_inputs=tuple(sorted(set(previous.changed_inputs) | node_changed_inputs)),
+                        via=tuple(dict.fromkeys(previous.via + tuple(via))),
+                    )
+
+        return changed_inputs
+
+    # Get the value of one or more inputs / nodes (a tuple for several names), invalidated nodes are recomputed
+    def get(self, state, *names):
+        values = tuple(self.get_value(state, name) for name in names)
+        return values[0] if len(names) == 1 else values
+
+    def get_value(self, state, name):
+
+        if name in self.inputs:
+            if name not in state.inputs_set:
+                raise ValueError(f"input '{name}' was not set in this run") # a node was requested before its input, it could be stale
+            return state.input_values[name]
+
+        if name not in state.node_values:
+            function, dependencies = self.nodes[name]
+            dependency_values = [self.get_value(state, dependency) for dependency in dependencies]
+            start = time.perf_counter()
+            state.node_values[name] = function(*dependency_values)
+            state.recompute_seconds[name] = time.perf_counter() - start
+
+        return state.node_values[name]
+
+    # Generate the report of the current run: one row per node with its status, the reason of the invalidation and the recompute time
+    def generate_report_df(self, state):
+
+        rows = []
+        for name in self.nodes:
+            invalidation = state.invalidations.get(name)
+            if name in state.recompute_seconds:
+                status = 'neu berechnet'
+            elif invalidation is not None:
+                status = 'invalidiert (nicht benötigt)'
+            elif name in state.node_values:
+                status = 'unverändert (Cache)'
+            else:
+                status = 'nicht benötigt'
+            rows.append({
+                'Knoten': name,
+                'Status': status,
+                'Geänderte Eingaben': ', '.join(invalidation.changed_inputs) if invalidation else '',
+                'Über': ', '.join(invalidation.via) if invalidation else '',
+                'Zeit (ms)': round(state.recompute_seconds[name] * 1000, 1) if name in state.recompute_seconds else None,
+            })
+
+        return pd.DataFrame(rows).set_index('Knoten')
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import custom_functions
+
+######################
+# Initialize variables
+######################
+# Usage basis selectable for the right-sizing recommendation mapped to the performance column
+rightsizing_basis_options = {
+    '95th Percentile *': '95th Percentile %',
+    'Peak': 'Peak %',
+    'Average': 'Average %',
+    'Median': 'Median %',
+}
+
+# Ranking options mapped to the column used for sorting
+rightsizing_ranking_options = {
+    'vRAM einsparbar (GiB)': 'vRAM einsparbar (GiB)',
+    'vCPUs einsparbar': 'vCPUs einsparbar',
+}
+
+######################
+# Custom Functions
+######################
+# Generate the per VM right-sizing recommendation for all powered on VMs (vCPU & vMemory joined on MOID)
+def generate_rightsizing_df(df_vCPU_filtered, df_vMemory_filtered, rightsizing_basis, buffer_factor):
+
+    usage_column = rightsizing_basis_options[rightsizing_basis]
+    df_vCPU_filtered_on = df_vCPU_filtered.loc[df_vCPU_filtered['Power State'].to_numpy() == 'poweredOn', ['MOID', 'VM Name', 'Cluster Name', 'vCPUs', usage_column]]
+    df_vMemory_filtered_on = df_vMemory_filtered.loc[df_vMemory_filtered['Power State'].to_numpy() == 'poweredOn', ['MOID', 'Size (GiB)', usage_column]]
+    df_vm_on = pd.merge(df_vCPU_filtered_on, df_vMemory_filtered_on, on='MOID', suffixes=(' vCPU', ' vMemory'))
+
+    vCPUs = df_vm_on['vCPUs'].to_numpy(dtype=np.float64)
+    vCPUs_recommended = custom_functions.calculate_vCPU_total_values(vCPUs, df_vm_on[usage_column+' vCPU'], buffer_factor)
+    vRAM = df_vm_on['Size (GiB)'].to_numpy(dtype=np.float64)
+    vRAM_recommended = custom_functions.calculate_vMemory_total_values(vRAM, df_vm_on[usage_column+' vMemory'], buffer_factor)
+
+    return pd.DataFrame({
+        'VM Name': df_vm_on['VM Name'].to_numpy(),
+        'Cluster Name': df_vm_on['Cluster Name'].to_numpy(),
+        'vCPUs': vCPUs.astype(np.int64),
+        'vCPUs empfohlen': vCPUs_recommended.astype(np.int64),
+        'vCPUs einsparbar': (vCPUs - vCPUs_recommended).astype(np.int64),
+        'vRAM (GiB)': vRAM,
+        'vRAM empfohlen (GiB)': vRAM_recommended,
+        'vRAM einsparbar (GiB)': vRAM - vRAM_recommended,
+    })
+
+# Generate the reclaimable resources per cluster
+def generate_rightsizing_cluster_df(rightsizing_df):
+
+    rightsizing_cluster_df = rightsizing_df.groupby('Cluster Name')[['vCPUs', 'vCPUs empfohlen', 'vCPUs einsparbar', 'vRAM (GiB)', 'vRAM empfohlen (GiB)', 'vRAM einsparbar (GiB)']].sum()
+    rightsizing_cluster_df.insert(0, 'VMs (On)', rightsizing_df.groupby('Cluster Name').size())
+
+    return rightsizing_cluster_df
+
+# Generate the VMs with the biggest savings per cluster
+def generate_rightsizing_ranking_df(rightsizing_df, rightsizing_ranking, top_n=10):
+
+    ranking_column = rightsizing_ranking_options[rightsizing_ranking]
+    rightsizing_ranking_df = rightsizing_df.loc[rightsizing_df[ranking_column].to_numpy() > 0]
+    rightsizing_ranking_df = rightsizing_ranking_df.sort_values(['Cluster Name', ranking_column], ascending=[True, False], kind='stable')
+
+    return rightsizing_ranking_df.groupby('Cluster Name', sort=False).head(top_n).reset_index(drop=True)
@@ -0,0 +1,132 @@
+import os
+import sys
+import sqlite3
+import threading
+import argparse
+from io import BytesIO
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+from botocore.config import Config
+import streamlit as st
+import dataset_store
+import trend_store
+
+######################
+# Initialize variables
+######################
+# Collector exports can be ingested from an S3-compatible bucket (AWS S3, MinIO, a local S3 stand-in, ...).
+# Endpoint and credentials are taken from the environment / the usual boto3 configuration.
+s3_endpoint_url = os.environ.get('NTNX_S3_ENDPOINT_URL') or None
+s3_bucket = os.environ.get('NTNX_S3_BUCKET') or None
+s3_prefix = os.environ.get('NTNX_S3_PREFIX', '')
+s3_max_workers = 8 # concurrent downloads, the client connection pool is sized accordingly
+
+# Processed objects (bucket, key, ETag) and the resulting dataset id, so unchanged objects are skipped
+s3_state_db_path = os.environ.get('NTNX_S3_STATE_DB', os.path.join(os.path.expanduser('~'), '.ntnx_collector_analysis', 's3_ingest.sqlite'))
+
+s3_client = None
+s3_client_lock = threading.Lock()
+s3_state_db_connections = threading.local()
+
+######################
+# Custom Functions
+######################
+# Get the shared S3 client (boto3 clients are thread-safe, one connection pool for all downloads)
+def get_s3_client():
+
+    global s3_client
+    with s3_client_lock:
+        if s3_client is None:
+            s3_client = boto3.session.Session().client('s3', endpoint_url=s3_endpoint_url, config=Config(max_pool_connections=s3_max_workers * 2, retries={'max_attempts': 5, 'mode': 'standard'}))
+
+    return s3_client
+
+# Get the (per thread) connection to the ingest state database, creates the schema if needed
+def get_s3_state_db():
+
+    connection = getattr(s3_state_db_connections, 'connection', None)
+    if connection is None:
+        os.makedirs(os.path.dirname(s3_state_db_path) or '.', exist_ok=True)
+        connection = sqlite3.connect(s3_state_db_path, timeout=30)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('CREATE TABLE IF NOT EXISTS processed_objects (bucket TEXT NOT NULL, key TEXT NOT NULL, etag TEXT NOT NULL, dataset_id TEXT NOT NULL, processed_at TEXT NOT NULL, PRIMARY KEY (bucket, key, etag)) WITHOUT ROWID')
+        connection.commit()
+        s3_state_db_connections.connection = connection
+
+    return connection
+
+# List all collector exports (.xlsx) below a bucket prefix
+def list_exports(bucket, prefix=''):
+
+    exports = []
+    for page in get_s3_client().get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+        for s3_object in page.get('Contents', []):
+            if s3_object['Key'].lower().endswith('.xlsx'):
+                exports.append({'Key': s3_object['Key'], 'ETag': s3_object['ETag'].strip('"'), 'Size': s3_object['Size'], 'LastModified': s3_object['LastModified']})
+
+    return exports
+
+# List all collector exports for the file picker of the app (cached for a minute)
+@st.cache_data(ttl=60)
+def list_exports_for_app(bucket, prefix=''):
+    return {export['Key']: export for export in list_exports(bucket, prefix)}
+
+# Get the dataset id of an already processed object version (None if not processed yet)
+def get_processed_dataset_id(bucket, key, etag):
+    row = get_s3_state_db().execute('SELECT dataset_id FROM processed_objects WHERE bucket = ? AND key = ? AND etag = ?', (bucket, key, etag)).fetchone()
+    return row[0] if row else None
+
+# Download an export into memory (multipart / ranged downloads for large objects) and store it in the dataset store
+def ingest_export(bucket, key, etag):
+
+    export_file = BytesIO()
+    get_s3_client().download_fileobj(bucket, key, export_file)
+    export_file.name = key
+    dataset_id = dataset_store.store_datasets(export_file)
+
+    connection = get_s3_state_db()
+    with connection:
+        connection.execute('INSERT OR REPLACE INTO processed_objects VALUES (?, ?, ?, ?, ?)', (bucket, key, etag, dataset_id, datetime.now(timezone.utc).isoformat()))
+
+    return dataset_id
+
+# Get the dataset of an export for the app, only downloads if the object version was not processed or the dataset was removed meanwhile
+def get_export_dataset_id(bucket, key, etag):
+
+    dataset_id = get_processed_dataset_id(bucket, key, etag)
+    if dataset_id is None or not dataset_store.is_dataset_complete(dataset_id):
+        dataset_id = ingest_export(bucket, key, etag)
+
+    return dataset_id
+
+# Ingest all exports below a bucket prefix concurrently, objects with an already processed ETag are skipped.
+# Returns a list of (export, dataset_id) for the newly ingested exports.
+def ingest_exports(bucket, prefix='', max_workers=s3_max_workers):
+
+    new_exports = [export for export in list_exports(bucket, prefix) if get_processed_dataset_id(bucket, export['Key'], export['ETag']) is None]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        dataset_ids = list(executor.map(lambda export: ingest_export(bucket, export['Key'], export['ETag']), new_exports))
+
+    return list(zip(new_exports, dataset_ids))
+
+# Batch usage:
+#   python s3_ingest.py <bucket> [--prefix exports/] [--customer ACME]
+# The per-cluster aggregates are saved in the trend store, with --customer also assigned to the customer (collection date = object date)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ingest Nutanix Collector exports from an S3-compatible bucket.')
+    parser.add_argument('bucket')
+    parser.add_argument('--prefix', default='')
+    parser.add_argument('--customer', default=None)
+    parser.add_argument('--max-workers', type=int, default=s3_max_workers)
+    args = parser.parse_args()
+
+    ingested_exports = ingest_exports(args.bucket, args.prefix, args.max_workers)
+    for export, dataset_id in ingested_exports:
+        dataset_store.acquire_dataset(dataset_id, 's3-ingest') # keep the dataset for the lease ttl
+        trend_store.save_export(dataset_id)
+        if args.customer:
+            trend_store.assign_customer(dataset_id, args.customer, export['LastModified'].date())
+        print(dataset_id, export['Key'])
+    print(f"{len(ingested_exports)} new exports ingested", file=sys.stderr)
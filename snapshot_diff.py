@@ -0,0 +1,118 @@
+from dataclasses import dataclass
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+import dataset_store
+
+######################
+# Initialize variables
+######################
+# Per VM values compared between two exports of the same environment (keyed on MOID)
+vm_snapshot_value_cols = ['vCPUs', 'Memory (GiB)', 'Capacity (GiB)', 'Consumed (GiB)']
+vm_snapshot_cols = ['VM Name', 'Power State', 'Cluster Name'] + vm_snapshot_value_cols
+
+######################
+# Result models
+######################
+# Structural diff between an older and a newer export
+@dataclass
+class SnapshotDiffResult:
+    vms_added: pd.DataFrame
+    vms_removed: pd.DataFrame
+    vms_changed: pd.DataFrame
+    power_state_changes: pd.DataFrame
+    vms_moved: pd.DataFrame
+    cluster_deltas: pd.DataFrame
+    vms_unchanged: int
+
+######################
+# Custom Functions
+######################
+# Generate one row per VM (index MOID) with the compared values and a hashed row fingerprint
+def get_vm_snapshot(df_vInfo, df_vCPU, df_vMemory, df_vPartition, df_vDisk):
+
+    vm_snapshot = df_vInfo[['MOID', 'VM Name', 'Power State', 'Cluster Name']].drop_duplicates('MOID').set_index('MOID')
+    vm_snapshot['vCPUs'] = df_vCPU.drop_duplicates('MOID').set_index('MOID')['vCPUs'].reindex(vm_snapshot.index).fillna(0).astype(np.int64)
+    vm_snapshot['Memory (GiB)'] = df_vMemory.drop_duplicates('MOID').set_index('MOID')['Size (GiB)'].reindex(vm_snapshot.index).fillna(0).astype(np.float64)
+    vm_snapshot['Capacity (GiB)'] = df_vDisk.groupby('MOID')['Capacity (GiB)'].sum().reindex(vm_snapshot.index).fillna(0).astype(np.float64)
+    vm_snapshot['Consumed (GiB)'] = df_vPartition.groupby('MOID')['Consumed (GiB)'].sum().reindex(vm_snapshot.index).fillna(0).astype(np.float64)
+
+    # Round GiB values, so float noise between exports does not count as change
+    vm_snapshot[['Memory (GiB)', 'Capacity (GiB)', 'Consumed (GiB)']] = vm_snapshot[['Memory (GiB)', 'Capacity (GiB)', 'Consumed (GiB)']].round(2)
+    vm_snapshot['Fingerprint'] = pd.util.hash_pandas_object(vm_snapshot[vm_snapshot_cols], index=False).to_numpy()
+
+    return vm_snapshot
+
+# Compare two columns row by row, NaN equals NaN
+def get_values_differ(old_values, new_values):
+    return ~((old_values.to_numpy() == new_values.to_numpy()) | (old_values.isna().to_numpy() & new_values.isna().to_numpy()))
+
+# Generate the vCPU / vRAM / vStorage sums and VM amount per cluster
+def get_cluster_totals(vm_snapshot):
+    cluster_totals = vm_snapshot.groupby('Cluster Name')[vm_snapshot_value_cols].sum()
+    cluster_totals.insert(0, 'VMs', vm_snapshot.groupby('Cluster Name').size())
+    return cluster_totals
+
+# Generate the diff between two exports, both given as frames from get_data_from_excel / dataset_store.open_datasets
+def generate_snapshot_diff(old_frames, new_frames):
+
+    df_vInfo_old, df_vCPU_old, df_vMemory_old, _, _, df_vPartition_old, _, df_vDisk_old, _ = old_frames
+    df_vInfo_new, df_vCPU_new, df_vMemory_new, _, _, df_vPartition_new, _, df_vDisk_new, _ = new_frames
+    vm_snapshot_old = get_vm_snapshot(df_vInfo_old, df_vCPU_old, df_vMemory_old, df_vPartition_old, df_vDisk_old)
+    vm_snapshot_new = get_vm_snapshot(df_vInfo_new, df_vCPU_new, df_vMemory_new, df_vPartition_new, df_vDisk_new)
+
+    in_old = vm_snapshot_new.index.isin(vm_snapshot_old.index)
+    in_new = vm_snapshot_old.index.isin(vm_snapshot_new.index)
+    vms_added = vm_snapshot_new.loc[~in_old, vm_snapshot_cols]
+    vms_removed = vm_snapshot_old.loc[~in_new, vm_snapshot_cols]
+
+    # Only VMs with different fingerprints are compared column by column, a VM changed only in its name counts as unchanged
+    old_common = vm_snapshot_old.loc[in_new]
+    new_common = vm_snapshot_new.loc[old_common.index]
+    fingerprint_changed = old_common['Fingerprint'].to_numpy() != new_common['Fingerprint'].to_numpy()
+    old_changed = old_common.loc[fingerprint_changed]
+    new_changed = new_common.loc[fingerprint_changed]
+
+    vms_changed = new_changed[['VM Name', 'Cluster Name']].copy()
+    values_changed = np.zeros(len(vms_changed), dtype=bool)
+    for col in vm_snapshot_value_cols:
+        vms_changed[col+' (alt)'] = old_changed[col]
+        vms_changed[col+' (neu)'] = new_changed[col]
+        vms_changed[col+' Δ'] = new_changed[col] - old_changed[col]
+        values_changed |= vms_changed[col+' Δ'].to_numpy() != 0
+    vms_changed = vms_changed.loc[values_changed]
+
+    power_state_changed = get_values_differ(old_changed['Power State'], new_changed['Power State'])
+    power_state_changes = new_changed.loc[power_state_changed, ['VM Name', 'Cluster Name']].copy()
+    power_state_changes['Power State (alt)'] = old_changed.loc[power_state_changed, 'Power State']
+    power_state_changes['Power State (neu)'] = new_changed.loc[power_state_changed, 'Power State']
+
+    # VMs moved to another cluster (e.g. vMotion between clusters)
+    cluster_changed = get_values_differ(old_changed['Cluster Name'], new_changed['Cluster Name'])
+    vms_moved = new_changed.loc[cluster_changed, ['VM Name']].copy()
+    vms_moved['Cluster Name (alt)'] = old_changed.loc[cluster_changed, 'Cluster Name']
+    vms_moved['Cluster Name (neu)'] = new_changed.loc[cluster_changed, 'Cluster Name']
+
+    # Moved VMs leave the totals of the old cluster and are added to the new one, the moves are listed per cluster as well
+    cluster_totals_old = get_cluster_totals(vm_snapshot_old)
+    cluster_totals_new = get_cluster_totals(vm_snapshot_new)
+    cluster_index = cluster_totals_old.index.union(cluster_totals_new.index)
+    cluster_deltas = cluster_totals_new.reindex(cluster_index, fill_value=0) - cluster_totals_old.reindex(cluster_index, fill_value=0)
+    cluster_deltas.insert(1, 'VMs verschoben (zu)', vms_moved.groupby('Cluster Name (neu)').size().reindex(cluster_index, fill_value=0).astype(np.int64))
+    cluster_deltas.insert(2, 'VMs verschoben (ab)', vms_moved.groupby('Cluster Name (alt)').size().reindex(cluster_index, fill_value=0).astype(np.int64))
+    cluster_deltas.index.name = 'Cluster Name'
+
+    return SnapshotDiffResult(
+        vms_added = vms_added,
+        vms_removed = vms_removed,
+        vms_changed = vms_changed,
+        power_state_changes = power_state_changes,
+        vms_moved = vms_moved,
+        cluster_deltas = cluster_deltas,
+        vms_unchanged = int(len(old_common) - (values_changed | power_state_changed | cluster_changed).sum())
+    )
+
+# Generate the diff between two stored datasets (cached per process)
+@lru_cache(maxsize=8)
+def generate_snapshot_diff_from_datasets(old_dataset_id, new_dataset_id):
+    return generate_snapshot_diff(dataset_store.open_datasets(old_dataset_id), dataset_store.open_datasets(new_dataset_id))
@@ -0,0 +1,162 @@
+import os
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+import streamlit as st
+import custom_functions
+import dataset_store
+
+######################
+# Initialize variables
+######################
+# Per-cluster aggregates of every analyzed export are stored in a local SQLite database keyed by dataset id
+# and cluster (re-uploads of an export are no-ops). Assigned to a customer & collection date, the snapshots
+# of an export are used to derive the observed growth.
+trend_db_path = os.environ.get('NTNX_TREND_DB', os.path.join(os.path.expanduser('~'), '.ntnx_collector_analysis', 'trends.sqlite'))
+
+# Stored sizing bases per cluster (all fields selectable in the sizing selectboxes) and additional aggregates
+trend_fields = (
+    ['vCPU_'+field for field in dict.fromkeys(custom_functions.vCPU_sizing_options.values())] +
+    ['vRAM_'+field for field in dict.fromkeys(custom_functions.vRAM_sizing_options.values())] +
+    ['vStorage_'+field for field in dict.fromkeys(custom_functions.vStorage_sizing_options.values())] +
+    ['hosts', 'iops']
+)
+
+trend_db_connections = threading.local() # sqlite connections can't be shared between threads
+
+######################
+# Custom Functions
+######################
+# Get the (per thread) connection to the trend database, creates the schema if needed
+def get_trend_db():
+
+    connection = getattr(trend_db_connections, 'connection', None)
+    if connection is None:
+        os.makedirs(os.path.dirname(trend_db_path) or '.', exist_ok=True)
+        connection = sqlite3.connect(trend_db_path, timeout=30)
+        connection.execute('PRAGMA journal_mode=WAL') # readers don't block writers (several app sessions / processes)
+        field_cols = ', '.join(field+' REAL' for field in trend_fields)
+        connection.execute(f'CREATE TABLE IF NOT EXISTS dataset_snapshots (dataset_id TEXT NOT NULL, cluster TEXT NOT NULL, customer TEXT, collection_date TEXT, {field_cols}, PRIMARY KEY (dataset_id, cluster)) WITHOUT ROWID')
+        connection.execute('CREATE INDEX IF NOT EXISTS dataset_snapshots_customer_date ON dataset_snapshots (customer, collection_date)')
+        connection.commit()
+        trend_db_connections.connection = connection
+
+    return connection
+
+# Generate the stored aggregates for every cluster of a dataset (one row per cluster)
+def generate_cluster_aggregates(dataset_id):
+
+    df_vInfo = dataset_store.open_datasets(dataset_id)[0]
+    cluster_aggregates = []
+    for cluster in sorted(df_vInfo['Cluster Name'].dropna().unique()):
+        df_vInfo_filtered, df_vCPU_filtered, df_vMemory_filtered, df_vHosts_filtered, df_vCluster_filtered, df_vPartition_filtered, df_vmList_filtered, df_vDisk_filtered, df_vSnapshot_filtered = dataset_store.filter_datasets(dataset_id, [cluster])
+        vCPU_result = custom_functions.generate_vCPU_result(df_vCPU_filtered, df_vHosts_filtered)
+        vRAM_result = custom_functions.generate_vRAM_result(df_vMemory_filtered)
+        vStorage_result = custom_functions.generate_vStorage_result(df_vPartition_filtered, df_vDisk_filtered, df_vmList_filtered, df_vSnapshot_filtered)
+
+        cluster_aggregate = {'cluster': cluster}
+        for field in trend_fields:
+            result_type, _, result_field = field.partition('_')
+            if result_type == 'vCPU':
+                cluster_aggregate[field] = getattr(vCPU_result, result_field)
+            elif result_type == 'vRAM':
+                cluster_aggregate[field] = getattr(vRAM_result, result_field)
+            elif result_type == 'vStorage':
+                cluster_aggregate[field] = getattr(vStorage_result, result_field)
+        cluster_aggregate['hosts'] = df_vHosts_filtered.shape[0]
+        cluster_aggregate['iops'] = float(df_vCluster_filtered['95th Percentile IOPS'].sum())
+        cluster_aggregates.append(cluster_aggregate)
+
+    return pd.DataFrame(cluster_aggregates, columns=['cluster']+trend_fields)
+
+# Check if the per-cluster aggregates of a dataset are stored
+def is_export_saved(dataset_id):
+    return get_trend_db().execute('SELECT 1 FROM dataset_snapshots WHERE dataset_id = ? LIMIT 1', [dataset_id]).fetchone() is not None
+
+# Store the per-cluster aggregates of an analyzed dataset (no customer assigned yet), returns the amount of stored clusters.
+# A dataset is only stored once, saving it again (e.g. a re-upload of the same export) is a no-op.
+def save_export(dataset_id):
+
+    if is_export_saved(dataset_id):
+        return 0
+
+    cluster_aggregates = generate_cluster_aggregates(dataset_id)
+    columns = ['dataset_id', 'cluster'] + trend_fields
+    rows = [
+        [dataset_id, row['cluster']] + [float(row[field]) for field in trend_fields]
+        for row in cluster_aggregates.to_dict('records')
+    ]
+
+    connection = get_trend_db()
+    with connection:
+        connection.executemany(f"INSERT OR IGNORE INTO dataset_snapshots ({', '.join(columns)}) VALUES ({', '.join('?'*len(columns))})", rows)
+
+    return len(rows)
+
+# Assign (or change) the customer & collection date of a stored dataset, other datasets assigned to the same customer &
+# collection date are unassigned (one snapshot per customer & date). Returns the amount of assigned clusters.
+def assign_customer(dataset_id, customer, collection_date):
+
+    connection = get_trend_db()
+    with connection:
+        connection.execute('UPDATE dataset_snapshots SET customer = NULL, collection_date = NULL WHERE customer = ? AND collection_date = ? AND dataset_id != ?', [customer, collection_date.isoformat(), dataset_id])
+        return connection.execute('UPDATE dataset_snapshots SET customer = ?, collection_date = ? WHERE dataset_id = ?', [customer, collection_date.isoformat(), dataset_id]).rowcount
+
+# Get the assigned customer & collection date of a stored dataset: (customer, date) or None
+def get_export_customer(dataset_id):
+
+    row = get_trend_db().execute('SELECT customer, collection_date FROM dataset_snapshots WHERE dataset_id = ? AND customer IS NOT NULL LIMIT 1', [dataset_id]).fetchone()
+    if row is None:
+        return None
+
+    return row[0], pd.Timestamp(row[1]).date()
+
+# Get all customers with stored snapshots
+def get_customers():
+    return [row[0] for row in get_trend_db().execute('SELECT DISTINCT customer FROM dataset_snapshots WHERE customer IS NOT NULL ORDER BY customer')]
+
+# Get the trend of a field summed over the given clusters, only dates containing all given clusters are used
+def get_trend(customer, clusters, field):
+
+    if field not in trend_fields:
+        raise ValueError(f"unknown trend field: {field}")
+    clusters = list(clusters)
+    if len(clusters) == 0:
+        return pd.Series(dtype=np.float64, name=field)
+
+    rows = get_trend_db().execute(
+        f"SELECT collection_date, SUM({field}) FROM dataset_snapshots WHERE customer = ? AND cluster IN ({', '.join('?'*len(clusters))}) "
+        "GROUP BY collection_date HAVING COUNT(*) = ? ORDER BY collection_date",
+        [customer] + clusters + [len(clusters)]
+    ).fetchall()
+
+    return pd.Series([row[1] for row in rows], index=pd.to_datetime([row[0] for row in rows]), name=field, dtype=np.float64)
+
+# Calculate the observed yearly growth in % between the first and the last snapshot (None if not enough data)
+def calculate_growth_rate(trend):
+
+    if len(trend) < 2 or trend.iloc[0] <= 0:
+        return None
+    days = (trend.index[-1] - trend.index[0]).days
+    if days <= 0:
+        return None
+
+    return float(((trend.iloc[-1] / trend.iloc[0]) ** (365 / days) - 1) * 100)
+
+# Calculate the observed yearly growth for the selected sizing basis, rounded up and limited to the slider range
+def calculate_growth_slider_value(customer, clusters, result_type, sizing_options, sizing_option_selected):
+
+    growth_rate = calculate_growth_rate(get_trend(customer, clusters, result_type+'_'+sizing_options[sizing_option_selected]))
+    if growth_rate is None:
+        return None
+
+    return int(min(max(np.ceil(growth_rate), 0), 100))
+
+# Pre-fill the growth sliders with the observed growth (used as on_click callback)
+def prefill_growth_sliders(customer, clusters):
+
+    for result_type, sizing_options in [('vCPU', custom_functions.vCPU_sizing_options), ('vRAM', custom_functions.vRAM_sizing_options), ('vStorage', custom_functions.vStorage_sizing_options)]:
+        growth_slider_value = calculate_growth_slider_value(customer, clusters, result_type, sizing_options, st.session_state[result_type+'_selectbox'])
+        if growth_slider_value is not None:
+            st.session_state[result_type+'_slider'] = growth_slider_value